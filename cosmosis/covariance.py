@@ -0,0 +1,317 @@
+"""
+Covariance matrices for Gaussian likelihoods.
+
+Each class here stores a covariance matrix C together with a factorization
+of it, made once, that is then used for everything the likelihood needs:
+the chi^2 of a residual, log |C|, and simulated noise realizations.
+
+As well as general dense matrices there are classes for diagonal, block
+diagonal, banded and low-rank-plus-diagonal matrices, which are much
+cheaper for long data vectors.  A GaussianLikelihood can return any of them
+from its build_covariance or extract_covariance methods.
+"""
+import numpy as np
+import scipy.linalg
+
+try:
+    from packaging.version import parse as parse_version
+    use_hermitian_keyword = parse_version(np.version.version) > parse_version('1.17.0')
+except ImportError: # fall back to not using hermitian
+    use_hermitian_keyword = False
+
+
+class Covariance:
+    """
+    Base class for covariance matrices.
+
+    Subclasses implement chi2, log_determinant, simulate, inverse and matrix.
+    The residuals passed to chi2 can be a single vector or a stack of them,
+    with shape (..., n), in which case an array of chi^2 values is returned.
+    """
+    size = 0
+
+    def chi2(self, d):
+        "The chi^2 of residual d, i.e. d^T C^-1 d"
+        raise NotImplementedError()
+
+    def log_determinant(self):
+        "The log of the determinant |C|"
+        raise NotImplementedError()
+
+    def simulate(self):
+        "Return a random vector drawn from a Gaussian with zero mean and this covariance"
+        raise NotImplementedError()
+
+    def inverse(self):
+        "The inverse of the matrix, as a dense array"
+        raise NotImplementedError()
+
+    def matrix(self):
+        "The matrix itself, as a dense array"
+        raise NotImplementedError()
+
+    def __len__(self):
+        return self.size
+
+
+def as_covariance(cov):
+    """
+    Return cov if it is already a Covariance object, and otherwise
+    a DenseCovariance for it.
+    """
+    if isinstance(cov, Covariance):
+        return cov
+    return DenseCovariance(cov)
+
+
+def _scalar_if_single(chi2):
+    # Return a float for a single residual rather than a 0-d array
+    return float(chi2) if np.ndim(chi2) == 0 else chi2
+
+
+def _triangular_chi2(L, d, lower=True):
+    # d^T (L L^T)^-1 d for a Cholesky factor L, for one or many d
+    d = np.asarray(d)
+    y = scipy.linalg.solve_triangular(L, d.reshape(-1, d.shape[-1]).T, lower=lower)
+    chi2 = np.sum(y**2, axis=0)
+    if d.ndim == 1:
+        return float(chi2[0])
+    return chi2.reshape(d.shape[:-1])
+
+
+class DenseCovariance(Covariance):
+    """
+    A general covariance matrix, using its Cholesky decomposition
+    C = L L^T, which can be passed in if it is already known.
+
+    If the matrix is not positive definite we fall back to its
+    pseudo-inverse, and simulations are not possible.
+    """
+    def __init__(self, matrix, cholesky=None):
+        self.cov = np.atleast_2d(matrix)
+        self.size = self.cov.shape[0]
+        self.pseudo_inverse = None
+        if cholesky is None:
+            try:
+                cholesky = np.linalg.cholesky(self.cov)
+            except np.linalg.LinAlgError:
+                if use_hermitian_keyword:
+                    self.pseudo_inverse = np.linalg.pinv(self.cov, hermitian=True)
+                else:
+                    self.pseudo_inverse = np.linalg.pinv(self.cov)
+        self.cholesky = cholesky
+
+    def chi2(self, d):
+        if self.cholesky is None:
+            return _scalar_if_single(np.einsum('...i,ij,...j->...', d, self.pseudo_inverse, d))
+        return _triangular_chi2(self.cholesky, d)
+
+    def log_determinant(self):
+        if self.cholesky is None:
+            return np.linalg.slogdet(self.cov)[1]
+        return 2 * np.log(np.diag(self.cholesky)).sum()
+
+    def simulate(self):
+        if self.cholesky is None:
+            raise np.linalg.LinAlgError("Cannot simulate from a covariance matrix that is not positive definite")
+        return np.dot(self.cholesky, np.random.randn(self.size))
+
+    def inverse(self):
+        if self.cholesky is None:
+            return self.pseudo_inverse
+        return scipy.linalg.cho_solve((self.cholesky, True), np.eye(self.size))
+
+    def matrix(self):
+        return self.cov
+
+
+class InverseCovariance(Covariance):
+    """
+    A covariance matrix given by its inverse, for example when the
+    inverse is corrected for noise in simulations and so is not just
+    the inverse of the matrix.  If the covariance matrix itself or its
+    Cholesky decomposition is also known it is used for simulations.
+    """
+    def __init__(self, inverse, matrix=None, cholesky=None):
+        self.inv_cov = np.atleast_2d(inverse)
+        self.cov = matrix
+        self.cholesky = cholesky
+        self.size = self.inv_cov.shape[0]
+        self.inverse_cholesky = None
+
+    def chi2(self, d):
+        return _scalar_if_single(np.einsum('...i,ij,...j->...', d, self.inv_cov, d))
+
+    def log_determinant(self):
+        return -np.linalg.slogdet(self.inv_cov)[1]
+
+    def simulate(self):
+        z = np.random.randn(self.size)
+        if self.cholesky is None and self.cov is not None:
+            self.cholesky = np.linalg.cholesky(self.cov)
+        if self.cholesky is not None:
+            return np.dot(self.cholesky, z)
+        # If C^-1 = M M^T then x = M^-T z has covariance C
+        if self.inverse_cholesky is None:
+            self.inverse_cholesky = np.linalg.cholesky(self.inv_cov)
+        return scipy.linalg.solve_triangular(self.inverse_cholesky.T, z, lower=False)
+
+    def inverse(self):
+        return self.inv_cov
+
+    def matrix(self):
+        if self.cov is None:
+            self.cov = np.linalg.inv(self.inv_cov)
+        return self.cov
+
+
+class DiagonalCovariance(Covariance):
+    """
+    A diagonal covariance matrix, given by its diagonal (the variances).
+    """
+    def __init__(self, variance):
+        self.variance = np.atleast_1d(np.asarray(variance, dtype=float))
+        self.size = self.variance.size
+
+    def chi2(self, d):
+        return _scalar_if_single(np.sum(np.asarray(d)**2 / self.variance, axis=-1))
+
+    def log_determinant(self):
+        return np.log(self.variance).sum()
+
+    def simulate(self):
+        return np.sqrt(self.variance) * np.random.randn(self.size)
+
+    def inverse(self):
+        return np.diag(1.0 / self.variance)
+
+    def matrix(self):
+        return np.diag(self.variance)
+
+
+class BlockDiagonalCovariance(Covariance):
+    """
+    A block-diagonal covariance matrix, for example from independent
+    probes or redshift bins.  The blocks can be arrays or any of the
+    other Covariance classes, and are used in order along the diagonal.
+    """
+    def __init__(self, blocks):
+        self.blocks = [as_covariance(block) for block in blocks]
+        sizes = [block.size for block in self.blocks]
+        self.edges = np.concatenate([[0], np.cumsum(sizes)]).astype(int)
+        self.size = int(self.edges[-1])
+
+    def chi2(self, d):
+        d = np.asarray(d)
+        return sum(block.chi2(d[..., s:e])
+            for block, s, e in zip(self.blocks, self.edges[:-1], self.edges[1:]))
+
+    def log_determinant(self):
+        return sum(block.log_determinant() for block in self.blocks)
+
+    def simulate(self):
+        return np.concatenate([block.simulate() for block in self.blocks])
+
+    def inverse(self):
+        return scipy.linalg.block_diag(*[block.inverse() for block in self.blocks])
+
+    def matrix(self):
+        return scipy.linalg.block_diag(*[block.matrix() for block in self.blocks])
+
+
+class BandedCovariance(Covariance):
+    """
+    A banded covariance matrix, whose elements are zero more than
+    some number u of places away from the diagonal.
+
+    The matrix is given in the upper banded form used by LAPACK and
+    scipy.linalg.solveh_banded, an array of shape (u+1, n) where
+    bands[u + i - j, j] = C[i, j].  Use from_matrix to make one from
+    a dense matrix.  Everything costs O(n u^2) or less instead of O(n^3).
+    """
+    def __init__(self, bands):
+        self.bands = np.atleast_2d(np.asarray(bands, dtype=float))
+        self.bandwidth = self.bands.shape[0] - 1
+        self.size = self.bands.shape[1]
+        # The upper Cholesky factor, C = U^T U, in the same form
+        self.cholesky = scipy.linalg.cholesky_banded(self.bands, lower=False)
+
+    @classmethod
+    def from_matrix(cls, matrix, bandwidth):
+        "Make a banded covariance from the diagonal and first bandwidth off-diagonals of a matrix"
+        matrix = np.asarray(matrix)
+        n = matrix.shape[0]
+        bands = np.zeros((bandwidth + 1, n))
+        for k in range(bandwidth + 1):
+            bands[bandwidth - k, k:] = np.diagonal(matrix, k)
+        return cls(bands)
+
+    def chi2(self, d):
+        d = np.asarray(d)
+        y = scipy.linalg.cho_solve_banded((self.cholesky, False), d.reshape(-1, self.size).T)
+        chi2 = np.einsum('in,in->n', d.reshape(-1, self.size).T, y)
+        if d.ndim == 1:
+            return float(chi2[0])
+        return chi2.reshape(d.shape[:-1])
+
+    def log_determinant(self):
+        return 2 * np.log(self.cholesky[self.bandwidth]).sum()
+
+    def simulate(self):
+        # x = U^T z, where U[j-k, j] is stored in cholesky[u-k, j]
+        z = np.random.randn(self.size)
+        u = self.bandwidth
+        x = self.cholesky[u] * z
+        for k in range(1, u + 1):
+            x[k:] += self.cholesky[u - k, k:] * z[:-k]
+        return x
+
+    def inverse(self):
+        return scipy.linalg.cho_solve_banded((self.cholesky, False), np.eye(self.size))
+
+    def matrix(self):
+        u = self.bandwidth
+        matrix = np.diag(self.bands[u])
+        for k in range(1, u + 1):
+            off_diagonal = np.diag(self.bands[u - k, k:], k)
+            matrix += off_diagonal + off_diagonal.T
+        return matrix
+
+
+class LowRankCovariance(Covariance):
+    """
+    A covariance matrix C = D + F F^T, where D is diagonal and F is
+    an (n, k) matrix with k much smaller than n, as for a diagonal noise
+    term plus a few systematic or super-sample modes.  The Woodbury
+    identity means everything costs O(n k^2) or less instead of O(n^3).
+    """
+    def __init__(self, variance, factor):
+        self.variance = np.atleast_1d(np.asarray(variance, dtype=float))
+        self.factor = np.asarray(factor, dtype=float).reshape(self.variance.size, -1)
+        self.size = self.variance.size
+        # The k x k "capacitance" matrix I + F^T D^-1 F and its decomposition
+        self.scaled_factor = self.factor / self.variance[:, np.newaxis]
+        capacitance = np.eye(self.factor.shape[1]) + np.dot(self.factor.T, self.scaled_factor)
+        self.capacitance_cholesky = np.linalg.cholesky(capacitance)
+
+    def chi2(self, d):
+        d = np.asarray(d)
+        v = np.dot(d, self.scaled_factor)
+        chi2 = np.sum(d**2 / self.variance, axis=-1) - _triangular_chi2(self.capacitance_cholesky, v)
+        return _scalar_if_single(chi2)
+
+    def log_determinant(self):
+        return np.log(self.variance).sum() + 2 * np.log(np.diag(self.capacitance_cholesky)).sum()
+
+    def simulate(self):
+        z = np.random.randn(self.size)
+        w = np.random.randn(self.factor.shape[1])
+        return np.sqrt(self.variance) * z + np.dot(self.factor, w)
+
+    def inverse(self):
+        # D^-1 - D^-1 F (I + F^T D^-1 F)^-1 F^T D^-1
+        M = scipy.linalg.solve_triangular(self.capacitance_cholesky, self.scaled_factor.T, lower=True)
+        return np.diag(1.0 / self.variance) - np.dot(M.T, M)
+
+    def matrix(self):
+        return np.diag(self.variance) + np.dot(self.factor, self.factor.T)
@@ -1,2 +1,2 @@
-from .cosmosis_py.block import DataBlock, BlockError, option_section, SectionOptions
+from .cosmosis_py.block import DataBlock, BlockError, BlockHandle, option_section, SectionOptions
 from .cosmosis_py import section_names as names
@@ -55,6 +55,95 @@ namespace
     }
     return res;
   }
+
+  // Point val at the storage of a 1D or n-D array of type T, whose
+  // type codes are given, and fill in its shape. If pin is not null it
+  // is set to a new reference to the entry holding the storage.
+  template <class T>
+  DATABLOCK_STATUS
+  view_array(c_datablock* s, const char* section, const char* name,
+             datablock_type_t type_1d, datablock_type_t type_nd,
+             T const** val, int* ndims, int* extents, int max_ndims,
+             void** pin)
+  {
+    if (s == nullptr) return DBS_DATABLOCK_NULL;
+    if (section == nullptr) return DBS_SECTION_NULL;
+    if (name == nullptr) return DBS_NAME_NULL;
+    if (val == nullptr) return DBS_VALUE_NULL;
+    if (ndims == nullptr) return DBS_SIZE_NULL;
+    if (extents == nullptr) return DBS_EXTENTS_NULL;
+    if (max_ndims < 1) return DBS_NDIM_NONPOSITIVE;
+
+    auto p = static_cast<DataBlock *>(s);
+    datablock_type_t dtype;
+    auto status = p->get_type(section, name, dtype);
+    if (status != DBS_SUCCESS) {
+      p->log_access(BLOCK_LOG_READ_FAIL, section, name, typeid(T));
+      return status;
+    }
+
+    try {
+      if (dtype == type_1d) {
+        vector<T> const& r = p->view<vector<T>>(section, name);
+        *val = r.empty() ? nullptr : r.data();
+        *ndims = 1;
+        extents[0] = clamp(r.size());
+      }
+      else if (dtype == type_nd) {
+        ndarray<T> const& r = p->view<ndarray<T>>(section, name);
+        if (clamp(r.ndims()) > max_ndims) return DBS_NDIM_OVERFLOW;
+        *val = (r.size() == 0) ? nullptr : r.data();
+        *ndims = clamp(r.ndims());
+        for (auto ext : r.extents()) *extents++ = clamp(ext);
+      }
+      else {
+        p->log_access(BLOCK_LOG_READ_FAIL, section, name, typeid(T));
+        return DBS_WRONG_VALUE_TYPE;
+      }
+      if (pin != nullptr) *pin = new std::shared_ptr<Entry>(p->share_entry(section, name));
+    }
+    catch (DataBlock::BadDataBlockAccess const&) { return DBS_SECTION_NOT_FOUND; }
+    catch (Section::BadSectionAccess const&) { return DBS_NAME_NOT_FOUND; }
+    catch (Entry::BadEntry const&) { return DBS_WRONG_VALUE_TYPE; }
+    catch (...) { return DBS_LOGIC_ERROR; }
+    return DBS_SUCCESS;
+  }
+
+  // Put or replace n values, stopping at the first failure, whose
+  // index is returned in 'failed'.
+  template <class T>
+  DATABLOCK_STATUS
+  put_many(c_datablock* s, int n, int const* handles, T const* vals, int* failed)
+  {
+    if (s == nullptr) return DBS_DATABLOCK_NULL;
+    if (n > 0 && (handles == nullptr || vals == nullptr)) return DBS_VALUE_NULL;
+    auto p = static_cast<DataBlock*>(s);
+    for (int i = 0; i < n; i++) {
+      auto status = p->set_val(handles[i], vals[i]);
+      if (status != DBS_SUCCESS) {
+        if (failed != nullptr) *failed = i;
+        return status;
+      }
+    }
+    return DBS_SUCCESS;
+  }
+
+  template <class T>
+  DATABLOCK_STATUS
+  get_many(c_datablock* s, int n, int const* handles, T* vals, int* failed)
+  {
+    if (s == nullptr) return DBS_DATABLOCK_NULL;
+    if (n > 0 && (handles == nullptr || vals == nullptr)) return DBS_VALUE_NULL;
+    auto p = static_cast<DataBlock*>(s);
+    for (int i = 0; i < n; i++) {
+      auto status = p->get_val(handles[i], vals[i]);
+      if (status != DBS_SUCCESS) {
+        if (failed != nullptr) *failed = i;
+        return status;
+      }
+    }
+    return DBS_SUCCESS;
+  }
 }
 
 extern "C"
@@ -98,6 +187,27 @@ extern "C"
     return p->copy_section(source, dest);
   }
 
+  int c_datablock_merge(c_datablock* s, c_datablock const* source, bool replace,
+                        int nexclude, const char* exclude)
+  {
+    if (s == nullptr || source == nullptr) return DBS_DATABLOCK_NULL;
+    if (nexclude > 0 && exclude == nullptr) return DBS_VALUE_NULL;
+    auto p = static_cast<DataBlock*>(s);
+    auto src = static_cast<DataBlock const*>(source);
+    std::map<string, std::set<string>> skip;
+    for (int i = 0; i < nexclude; i++) {
+      string section(exclude);
+      exclude += section.size() + 1;
+      string name(exclude);
+      exclude += name.size() + 1;
+      cosmosis::downcase(section);
+      cosmosis::downcase(name);
+      skip[section].insert(name);
+    }
+    p->merge(*src, replace, skip);
+    return DBS_SUCCESS;
+  }
+
 
   int c_datablock_num_sections(c_datablock const* s)
   {
@@ -225,6 +335,196 @@ extern "C"
     return res;
   }
 
+  DATABLOCK_STATUS
+  c_datablock_get_keys_size(c_datablock const* s, int* nkeys, int* nchars)
+  {
+    if (s == nullptr) return DBS_DATABLOCK_NULL;
+    if (nkeys == nullptr || nchars == nullptr) return DBS_SIZE_NULL;
+    DataBlock const* p = static_cast<DataBlock const*>(s);
+    size_t n = 0, c = 0;
+    p->for_each_value([&](string const& section, string const& name, datablock_type_t, int)
+      {
+        n += 1;
+        c += section.size() + name.size() + 2;
+      });
+    *nkeys = clamp(n);
+    *nchars = clamp(c);
+    return DBS_SUCCESS;
+  }
+
+  DATABLOCK_STATUS
+  c_datablock_get_keys(c_datablock const* s, int nkeys, int nchars,
+                       char* names, int* types, int* sizes)
+  {
+    if (s == nullptr) return DBS_DATABLOCK_NULL;
+    if (names == nullptr || types == nullptr || sizes == nullptr) return DBS_VALUE_NULL;
+    DataBlock const* p = static_cast<DataBlock const*>(s);
+    int n = 0;
+    char* end = names + nchars;
+    bool overflow = false;
+    p->for_each_value([&](string const& section, string const& name, datablock_type_t t, int size)
+      {
+        if (overflow) return;
+        if (n == nkeys || names + section.size() + name.size() + 2 > end) {
+          overflow = true;
+          return;
+        }
+        names = std::copy(section.begin(), section.end(), names);
+        *names++ = '\0';
+        names = std::copy(name.begin(), name.end(), names);
+        *names++ = '\0';
+        types[n] = t;
+        sizes[n] = size;
+        n++;
+      });
+    if (overflow || n != nkeys) return DBS_SIZE_INSUFFICIENT;
+    return DBS_SUCCESS;
+  }
+
+  DATABLOCK_STATUS
+  c_datablock_get_handle(const char* section, const char* name, int* handle)
+  {
+    if (section == nullptr) return DBS_SECTION_NULL;
+    if (name == nullptr) return DBS_NAME_NULL;
+    if (handle == nullptr) return DBS_VALUE_NULL;
+    *handle = DataBlock::get_handle(section, name);
+    return DBS_SUCCESS;
+  }
+
+  DATABLOCK_STATUS
+  c_datablock_get_handles(int n, const char* keys, int* handles)
+  {
+    if (n > 0 && (keys == nullptr || handles == nullptr)) return DBS_VALUE_NULL;
+    for (int i = 0; i < n; i++) {
+      string section(keys);
+      keys += section.size() + 1;
+      string name(keys);
+      keys += name.size() + 1;
+      handles[i] = DataBlock::get_handle(section, name);
+    }
+    return DBS_SUCCESS;
+  }
+
+  DATABLOCK_STATUS
+  c_datablock_put_int_many(c_datablock* s, int n, int const* handles, int const* vals, int* failed)
+  {
+    return put_many(s, n, handles, vals, failed);
+  }
+
+  DATABLOCK_STATUS
+  c_datablock_put_bool_many(c_datablock* s, int n, int const* handles, bool const* vals, int* failed)
+  {
+    return put_many(s, n, handles, vals, failed);
+  }
+
+  DATABLOCK_STATUS
+  c_datablock_put_double_many(c_datablock* s, int n, int const* handles, double const* vals, int* failed)
+  {
+    return put_many(s, n, handles, vals, failed);
+  }
+
+  DATABLOCK_STATUS
+  c_datablock_get_int_many(c_datablock* s, int n, int const* handles, int* vals, int* failed)
+  {
+    return get_many(s, n, handles, vals, failed);
+  }
+
+  DATABLOCK_STATUS
+  c_datablock_get_bool_many(c_datablock* s, int n, int const* handles, bool* vals, int* failed)
+  {
+    return get_many(s, n, handles, vals, failed);
+  }
+
+  DATABLOCK_STATUS
+  c_datablock_get_double_many(c_datablock* s, int n, int const* handles, double* vals, int* failed)
+  {
+    return get_many(s, n, handles, vals, failed);
+  }
+
+  DATABLOCK_STATUS
+  c_datablock_get_type_by_handle(c_datablock* s, int handle, datablock_type_t* val)
+  {
+    if (s == nullptr) return DBS_DATABLOCK_NULL;
+    if (val == nullptr) return DBS_VALUE_NULL;
+    auto p = static_cast<DataBlock*>(s);
+    return p->get_type(handle, *val);
+  }
+
+  DATABLOCK_STATUS
+  c_datablock_get_int_by_handle(c_datablock* s, int handle, int* val)
+  {
+    if (s == nullptr) return DBS_DATABLOCK_NULL;
+    if (val == nullptr) return DBS_VALUE_NULL;
+    auto p = static_cast<DataBlock*>(s);
+    return p->get_val(handle, *val);
+  }
+
+  DATABLOCK_STATUS
+  c_datablock_put_int_by_handle(c_datablock* s, int handle, int val)
+  {
+    if (s == nullptr) return DBS_DATABLOCK_NULL;
+    auto p = static_cast<DataBlock*>(s);
+    return p->put_val(handle, val);
+  }
+
+  DATABLOCK_STATUS
+  c_datablock_replace_int_by_handle(c_datablock* s, int handle, int val)
+  {
+    if (s == nullptr) return DBS_DATABLOCK_NULL;
+    auto p = static_cast<DataBlock*>(s);
+    return p->replace_val(handle, val);
+  }
+
+  DATABLOCK_STATUS
+  c_datablock_get_bool_by_handle(c_datablock* s, int handle, bool* val)
+  {
+    if (s == nullptr) return DBS_DATABLOCK_NULL;
+    if (val == nullptr) return DBS_VALUE_NULL;
+    auto p = static_cast<DataBlock*>(s);
+    return p->get_val(handle, *val);
+  }
+
+  DATABLOCK_STATUS
+  c_datablock_put_bool_by_handle(c_datablock* s, int handle, bool val)
+  {
+    if (s == nullptr) return DBS_DATABLOCK_NULL;
+    auto p = static_cast<DataBlock*>(s);
+    return p->put_val(handle, val);
+  }
+
+  DATABLOCK_STATUS
+  c_datablock_replace_bool_by_handle(c_datablock* s, int handle, bool val)
+  {
+    if (s == nullptr) return DBS_DATABLOCK_NULL;
+    auto p = static_cast<DataBlock*>(s);
+    return p->replace_val(handle, val);
+  }
+
+  DATABLOCK_STATUS
+  c_datablock_get_double_by_handle(c_datablock* s, int handle, double* val)
+  {
+    if (s == nullptr) return DBS_DATABLOCK_NULL;
+    if (val == nullptr) return DBS_VALUE_NULL;
+    auto p = static_cast<DataBlock*>(s);
+    return p->get_val(handle, *val);
+  }
+
+  DATABLOCK_STATUS
+  c_datablock_put_double_by_handle(c_datablock* s, int handle, double val)
+  {
+    if (s == nullptr) return DBS_DATABLOCK_NULL;
+    auto p = static_cast<DataBlock*>(s);
+    return p->put_val(handle, val);
+  }
+
+  DATABLOCK_STATUS
+  c_datablock_replace_double_by_handle(c_datablock* s, int handle, double val)
+  {
+    if (s == nullptr) return DBS_DATABLOCK_NULL;
+    auto p = static_cast<DataBlock*>(s);
+    return p->replace_val(handle, val);
+  }
+
   DATABLOCK_STATUS destroy_c_datablock(c_datablock* s)
   {
     if (s == nullptr) return DBS_DATABLOCK_NULL;
@@ -1125,6 +1425,40 @@ extern "C"
     return DBS_SUCCESS;
   }
 
+  DATABLOCK_STATUS
+  c_datablock_view_int_array(c_datablock* s,
+                             const char* section,
+                             const char* name,
+                             int const** val,
+                             int* ndims,
+                             int* extents,
+                             int max_ndims,
+                             void** pin)
+  {
+    return view_array<int>(s, section, name, DBT_INT1D, DBT_INTND,
+                           val, ndims, extents, max_ndims, pin);
+  }
+
+  DATABLOCK_STATUS
+  c_datablock_view_double_array(c_datablock* s,
+                                const char* section,
+                                const char* name,
+                                double const** val,
+                                int* ndims,
+                                int* extents,
+                                int max_ndims,
+                                void** pin)
+  {
+    return view_array<double>(s, section, name, DBT_DOUBLE1D, DBT_DOUBLEND,
+                              val, ndims, extents, max_ndims, pin);
+  }
+
+  void
+  c_datablock_release_view(void* pin)
+  {
+    delete static_cast<std::shared_ptr<Entry>*>(pin);
+  }
+
   DATABLOCK_STATUS
   c_datablock_put_complex_array(c_datablock* s,
                                 const char* section,
@@ -1477,6 +1811,65 @@ c_datablock_get_log_entry(c_datablock* s,
   return DBS_SUCCESS;
 }
 
+DATABLOCK_STATUS
+c_datablock_set_log_level(c_datablock* s, int level)
+{
+  if (s == nullptr) return DBS_DATABLOCK_NULL;
+  if (level < BLOCK_LOG_LEVEL_OFF || level > BLOCK_LOG_LEVEL_FULL) return DBS_LOGIC_ERROR;
+  auto p = static_cast<DataBlock*>(s);
+  p->set_log_level(level);
+  return DBS_SUCCESS;
+}
+
+int c_datablock_get_log_level(c_datablock* s)
+{
+  if (s == nullptr) return -1;
+  auto p = static_cast<DataBlock*>(s);
+  return p->get_log_level();
+}
+
+DATABLOCK_STATUS
+c_datablock_get_bytes_accessed(c_datablock const* s, long long* nread, long long* nwritten)
+{
+  if (s == nullptr) return DBS_DATABLOCK_NULL;
+  if (nread == nullptr || nwritten == nullptr) return DBS_VALUE_NULL;
+  auto p = static_cast<DataBlock const*>(s);
+  *nread = p->bytes_read();
+  *nwritten = p->bytes_written();
+  return DBS_SUCCESS;
+}
+
+DATABLOCK_STATUS
+c_datablock_get_log_ids(c_datablock* s, int start, int n, int* ids)
+{
+  if (s == nullptr) return DBS_DATABLOCK_NULL;
+  if (ids == nullptr) return DBS_VALUE_NULL;
+  auto p = static_cast<DataBlock*>(s);
+  return p->get_log_ids(start, n, ids);
+}
+
+int c_datablock_get_log_string_count(c_datablock* s)
+{
+  if (s == nullptr) return -1;
+  auto p = static_cast<DataBlock*>(s);
+  return p->get_log_string_count();
+}
+
+DATABLOCK_STATUS
+c_datablock_get_log_string(c_datablock* s, int id, int smax, char* val)
+{
+  if (s == nullptr) return DBS_DATABLOCK_NULL;
+  if (val == nullptr) return DBS_VALUE_NULL;
+  if (smax < 1) return DBS_SIZE_NONPOSITIVE;
+  auto p = static_cast<DataBlock*>(s);
+  std::string str;
+  DATABLOCK_STATUS status = p->get_log_string(id, str);
+  if (status) return status;
+  strncpy(val, str.c_str(), smax);
+  val[smax-1] = '\0';
+  return DBS_SUCCESS;
+}
+
 
 DATABLOCK_STATUS
 c_datablock_get_metadata(c_datablock* s, 
@@ -3,6 +3,7 @@
 
 #include "datablock_status.h"
 #include "datablock_types.h"
+#include "datablock_logging.h"
 #include "section_names.h"
 
 #ifdef __cplusplus
@@ -83,6 +84,15 @@ extern "C" {
   */
   int c_datablock_copy_section(c_datablock * s, const char * source, const char * dest);
 
+  /*
+    Add all the values from source to s, sharing their storage rather
+    than copying it, except for the nexclude values listed in exclude,
+    which is packed as "section\0name\0section\0name\0...". Existing
+    values in s are overwritten if replace is true, and kept otherwise.
+  */
+  int c_datablock_merge(c_datablock* s, c_datablock const* source, bool replace,
+                        int nexclude, const char* exclude);
+
 
 
 
@@ -114,6 +124,88 @@ extern "C" {
   c_datablock_get_value_name_by_section_index(c_datablock const* s,
 					      int i, int j);
 
+  /*
+    Enumerate every value in the datablock at once, which is much
+    faster than calling the functions above for each one.
+
+    c_datablock_get_keys_size sets 'nkeys' to the number of values in
+    the datablock, and 'nchars' to the space needed for all of their
+    section and name strings, including a terminating NUL for each.
+
+    c_datablock_get_keys then writes the section and name of each
+    value into 'names', one after the other and each NUL-terminated,
+    and its type (a datablock_type_t) and size into 'types' and
+    'sizes', which must have room for 'nkeys' ints. The size is the
+    total number of elements for arrays of any dimension and -1 for
+    scalars. The values are in the same order as given by the
+    functions above. DBS_SIZE_INSUFFICIENT is returned if 'nkeys' and
+    'nchars' do not match the datablock contents.
+  */
+  DATABLOCK_STATUS
+  c_datablock_get_keys_size(c_datablock const* s, int* nkeys, int* nchars);
+
+  DATABLOCK_STATUS
+  c_datablock_get_keys(c_datablock const* s, int nkeys, int nchars,
+		       char* names, int* types, int* sizes);
+
+  /*
+    Handles are integer keys for (section, name) pairs, for values that
+    are read or written many times, e.g. on every run of a pipeline.
+    c_datablock_get_handle sets 'handle' for the given section and name;
+    the same pair always gives the same handle, and handles can be used
+    with any datablock. Access through a handle skips the processing of
+    the strings, and after the first use in a datablock also the search
+    for the value.
+
+    The _by_handle functions behave in the same way as the functions
+    below without the suffix, returning DBS_NAME_NOT_FOUND for a handle
+    that was not made by c_datablock_get_handle.
+  */
+  DATABLOCK_STATUS
+  c_datablock_get_handle(const char* section, const char* name, int* handle);
+
+  DATABLOCK_STATUS
+  c_datablock_get_type_by_handle(c_datablock* s, int handle, datablock_type_t* val);
+
+  DATABLOCK_STATUS c_datablock_get_int_by_handle(c_datablock* s, int handle, int* val);
+  DATABLOCK_STATUS c_datablock_get_bool_by_handle(c_datablock* s, int handle, bool* val);
+  DATABLOCK_STATUS c_datablock_get_double_by_handle(c_datablock* s, int handle, double* val);
+
+  DATABLOCK_STATUS c_datablock_put_int_by_handle(c_datablock* s, int handle, int val);
+  DATABLOCK_STATUS c_datablock_put_bool_by_handle(c_datablock* s, int handle, bool val);
+  DATABLOCK_STATUS c_datablock_put_double_by_handle(c_datablock* s, int handle, double val);
+
+  DATABLOCK_STATUS c_datablock_replace_int_by_handle(c_datablock* s, int handle, int val);
+  DATABLOCK_STATUS c_datablock_replace_bool_by_handle(c_datablock* s, int handle, bool val);
+  DATABLOCK_STATUS c_datablock_replace_double_by_handle(c_datablock* s, int handle, double val);
+
+  /*
+    Transfer many values in one call. c_datablock_get_handles sets the
+    'n' handles for the sections and names packed in 'keys' as
+    "section\0name\0section\0name\0...".
+
+    The _put_TYPE_many functions put each of the 'n' values with the
+    given handles, or replace it if there is one already, which must
+    have the same type. The _get_TYPE_many functions get each value.
+    Both stop at the first failure, returning its status and setting
+    'failed' to its index if 'failed' is not null.
+  */
+  DATABLOCK_STATUS
+  c_datablock_get_handles(int n, const char* keys, int* handles);
+
+  DATABLOCK_STATUS
+  c_datablock_put_int_many(c_datablock* s, int n, int const* handles, int const* vals, int* failed);
+  DATABLOCK_STATUS
+  c_datablock_put_bool_many(c_datablock* s, int n, int const* handles, bool const* vals, int* failed);
+  DATABLOCK_STATUS
+  c_datablock_put_double_many(c_datablock* s, int n, int const* handles, double const* vals, int* failed);
+  DATABLOCK_STATUS
+  c_datablock_get_int_many(c_datablock* s, int n, int const* handles, int* vals, int* failed);
+  DATABLOCK_STATUS
+  c_datablock_get_bool_many(c_datablock* s, int n, int const* handles, bool* vals, int* failed);
+  DATABLOCK_STATUS
+  c_datablock_get_double_many(c_datablock* s, int n, int const* handles, double* vals, int* failed);
+
 
   /*
     Return the length of the named array in the given section.  If any
@@ -186,6 +278,55 @@ extern "C" {
 			 const char* section,
 			 const char* name);
 
+  int c_datablock_get_log_count(c_datablock* s);
+
+  DATABLOCK_STATUS
+  c_datablock_get_log_entry(c_datablock* s,
+			    int i,
+			    int smax,
+			    char* log_type,
+			    char* section,
+			    char* name,
+			    char* dtype);
+
+  /*
+    Set how much of the access log is kept, using one of the
+    datablock_log_level values: BLOCK_LOG_LEVEL_OFF,
+    BLOCK_LOG_LEVEL_FIRST_USE or BLOCK_LOG_LEVEL_FULL (the default).
+    c_datablock_get_log_level returns the current level, or -1 if 's'
+    is NULL.
+  */
+  DATABLOCK_STATUS
+  c_datablock_set_log_level(c_datablock* s, int level);
+
+  int c_datablock_get_log_level(c_datablock* s);
+
+  /*
+    Get the total number of bytes of data that have been read from,
+    and put or replaced in, the datablock so far.
+  */
+  DATABLOCK_STATUS
+  c_datablock_get_bytes_accessed(c_datablock const* s, long long* nread, long long* nwritten);
+
+  /*
+    Read the log in bulk. The log stores each string (log types,
+    sections, names and type names) once, and refers to it by an
+    integer id. c_datablock_get_log_ids writes the four ids (log type,
+    section, name, type name) of each of entries start to start+n-1
+    into 'ids', which must have room for 4*n ints.
+    c_datablock_get_log_string copies the string for an id into 'val',
+    which has room for 'smax' chars, truncating it if needed. The ids
+    run from zero to c_datablock_get_log_string_count(s)-1, and stay
+    the same for the lifetime of the datablock.
+  */
+  DATABLOCK_STATUS
+  c_datablock_get_log_ids(c_datablock* s, int start, int n, int* ids);
+
+  int c_datablock_get_log_string_count(c_datablock* s);
+
+  DATABLOCK_STATUS
+  c_datablock_get_log_string(c_datablock* s, int id, int smax, char* val);
+
   /*
     Write an enumerator value into 't', corresponding to the type of
     the value stored in the given section, for the given name. Return
@@ -556,6 +697,52 @@ extern "C" {
 			       int ndims,
 			       int const* extents);
 
+  /*
+    The c_datablock_view_TYPE_array functions give read-only access to
+    an int or double array of any number of dimensions, including 1D
+    arrays, without copying it. They return DBS_SUCCESS if the given
+    section has an array of the given type, and an error status
+    otherwise.
+
+    On success '*val' is set to point to the values, which are stored
+    contiguously in row-major (C) order, '*ndims' is set to the number
+    of dimensions, and the first '*ndims' elements of 'extents' are set
+    to the extent of each dimension. 'extents' must have room for
+    'max_ndims' elements; DBS_NDIM_OVERFLOW is returned if the array
+    has more dimensions than that. '*val' is NULL for an empty array.
+
+    The pointer belongs to the datablock. It must not be freed. If
+    'pin' is NULL it is only valid until the value is replaced or
+    deleted or the datablock is cleared or destroyed. Otherwise '*pin'
+    is set on success to a handle that keeps the values unchanged and
+    alive, whatever then happens to the datablock, until it is passed
+    to c_datablock_release_view; replacing the value in the meantime
+    stores the new value separately.
+  */
+
+  DATABLOCK_STATUS
+  c_datablock_view_int_array(c_datablock* s,
+			     const char* section,
+			     const char* name,
+			     int const** val,
+			     int* ndims,
+			     int* extents,
+			     int max_ndims,
+			     void** pin);
+
+  DATABLOCK_STATUS
+  c_datablock_view_double_array(c_datablock* s,
+				const char* section,
+				const char* name,
+				double const** val,
+				int* ndims,
+				int* extents,
+				int max_ndims,
+				void** pin);
+
+  void
+  c_datablock_release_view(void* pin);
+
   DATABLOCK_STATUS
   c_datablock_get_complex_array(c_datablock* s,
 				const char* section,
@@ -1,3 +1,3 @@
-from .block import DataBlock, BlockError
+from .block import DataBlock, BlockError, BlockHandle
 from .import section_names as names
 from .lib import enable_cosmosis_segfault_handler
@@ -15,11 +15,86 @@ import tarfile
 import io
 from io import StringIO, BytesIO
 import sys
+import pickle
 
 
 
 option_section = "module_options"
 metadata_prefix = "cosmosis_metadata:"
+# The most dimensions an array view can have; the same as numpy's limit
+MAX_ARRAY_NDIM = 32
+# The levels of detail for the access log, from datablock_logging.h
+LOG_LEVELS = {
+	"off": 0,
+	"first-use": 1,
+	"full": 2,
+}
+
+class BlockHandle(object):
+	u"""A key for a (section, name) pair, made by :func:`DataBlock.handle`.
+
+	A handle can be used in place of the (section, name) tuple in
+	``block[handle]`` and ``block[handle] = value``, with any block.
+	Getting and setting scalar values this way is faster, since the
+	strings do not need to be converted and looked up each time, so it
+	is worth making handles in a module's setup for values that it uses
+	on every run.
+
+	"""
+	__slots__ = ['section', 'name', 'id']
+
+	def __init__(self, section, name, id):
+		self.section = section
+		self.name = name
+		self.id = id
+
+	def __iter__(self):
+		return iter((self.section, self.name))
+
+	def __len__(self):
+		return 2
+
+	def __repr__(self):
+		return "BlockHandle({!r}, {!r})".format(self.section, self.name)
+
+
+class _ViewPin(object):
+	u"""Keeps the values under an array view alive and unchanged until it is garbage collected."""
+	__slots__ = ['ptr']
+
+	def __init__(self, ptr):
+		self.ptr = ptr
+
+	def __del__(self):
+		try:
+			lib.c_datablock_release_view(self.ptr)
+		except:
+			pass
+
+
+# The functions to get a scalar through a handle, and to get and set
+# (i.e. put or replace) many of them, with their ctypes and numpy
+# types, for each type code
+_HANDLE_FUNCTIONS = {
+	types.DBT_INT: (lib.c_datablock_get_int_by_handle, lib.c_datablock_get_int_many,
+		lib.c_datablock_put_int_many, ct.c_int, np.intc),
+	types.DBT_BOOL: (lib.c_datablock_get_bool_by_handle, lib.c_datablock_get_bool_many,
+		lib.c_datablock_put_bool_many, ct.c_bool, np.bool_),
+	types.DBT_DOUBLE: (lib.c_datablock_get_double_by_handle, lib.c_datablock_get_double_many,
+		lib.c_datablock_put_double_many, ct.c_double, np.double),
+}
+
+def _scalar_type_code(value):
+	# The type code that a python scalar is stored with, or None
+	# if it is not one of the types with batched functions
+	if isinstance(value, (bool, np.bool_)):
+		return types.DBT_BOOL
+	if isinstance(value, (int, np.integer)):
+		return types.DBT_INT
+	if isinstance(value, (float, np.floating)):
+		return types.DBT_DOUBLE
+	return None
+
 
 class DataBlock(object):
 	u"""A map of (section,name)->value of parameters.
@@ -95,17 +170,36 @@ class DataBlock(object):
 
 				
 	def clone(self):
-		u"""Make a brand-new, completely independent object, a deep copy of the existing one.
+		u"""Make a brand-new, completely independent object, a copy of the existing one.
 
 		A new object will be returned from this method which has its own
-		underlying implementation, a deep copy of the parameter map we
-		are holding.  This WILL entail the attempted requisition of
-		enough new memory to hold the complete parameter structure.
+		underlying implementation.  The stored values themselves are
+		shared between the two blocks until one of them replaces a value,
+		at which point it gets its own copy, so cloning is cheap even
+		for blocks holding large arrays.
 
 		"""
 		ptr = lib.clone_c_datablock(self._ptr)
 		return DataBlock(ptr,own=True)
 
+	def merge(self, other, replace=True, exclude=()):
+		u"""Add all the values in the block `other` to this block.
+
+		Values are shared with `other` in the same way as in :func:`clone`,
+		and sections this block does not already have are added whole,
+		so this is much faster than setting the values one by one.
+
+		Values already in this block are overwritten if `replace` is True,
+		and kept otherwise.  Any (section, name) pairs in `exclude` are
+		not copied.
+
+		"""
+		exclude = list(exclude)
+		packed = "".join("{}\0{}\0".format(section, name) for section, name in exclude)
+		status = lib.c_datablock_merge(self._ptr, other._ptr, replace, len(exclude), packed.encode('utf-8'))
+		if status!=0:
+			raise BlockError.exception_for_status(status, "", "<tried to merge>")
+
 
 	@staticmethod
 	def python_to_c_complex(value):
@@ -139,20 +233,16 @@ class DataBlock(object):
 		most appropriate to the representation of the Python `numpy_type`.
 
 		"""
-		value = np.array(value, dtype=numpy_type)
+		#This only copies the data if it is not already
+		#contiguous and of the right type, e.g. if the object
+		#was made by looking at a slice through a matrix.
+		#The C code makes its own copy anyway.
+		value = np.ascontiguousarray(value, dtype=numpy_type)
 		#This function is for 1D arrays only
 		assert value.ndim==1
-		#check strides same as itemsize.
-		#This may be false if e.g. the object
-		#was made by looking at a slice through
-		#a matrix.
-		if value.itemsize != value.strides[0]:
-			#If so we need to copy the data to create
-			#a new object with sensible strides
-			value = value.copy()
-		assert value.itemsize==value.strides[0]
-		#Now return pointer to start of the data
-		array = np.ctypeslib.as_ctypes(value)
+		#Now return pointer to start of the data.  This also works
+		#for read-only arrays such as those from get_array_view.
+		array = value.ctypes.data_as(ct.POINTER(np.ctypeslib.as_ctypes_type(value.dtype)))
 		array_size = value.size
 		#OK, here's the difficult part.
 		# We have to return the value, as well as the
@@ -278,7 +368,7 @@ class DataBlock(object):
 
 		"""
 		n = lib.c_datablock_get_array_length(self._ptr, section.encode('ascii'), name.encode('ascii'))
-		r = np.zeros(n, dtype=np.intc)
+		r = np.empty(n, dtype=np.intc)
 		arr = np.ctypeslib.as_ctypes(r)
 		sz = lib.c_int()
 		status = lib.c_datablock_get_int_array_1d_preallocated(self._ptr, section.encode('ascii'), name.encode('ascii'), arr, ct.byref(sz), n)
@@ -297,7 +387,7 @@ class DataBlock(object):
 
 		"""
 		n = lib.c_datablock_get_array_length(self._ptr, section.encode('ascii'), name.encode('ascii'))
-		r = np.zeros(n, dtype=np.double)
+		r = np.empty(n, dtype=np.double)
 		arr = np.ctypeslib.as_ctypes(r)
 		sz = lib.c_int()
 		status = lib.c_datablock_get_double_array_1d_preallocated(self._ptr, section.encode('ascii'), name.encode('ascii'), arr, ct.byref(sz), n)
@@ -369,7 +459,7 @@ class DataBlock(object):
 
 		#Make the space for it
 		N = tuple([extent[i] for i in range(ndim.value)])
-		r = np.zeros(N, dtype=ctype)
+		r = np.empty(N, dtype=ctype)
 		arr = r.ctypes.data_as(ct.POINTER(ctype))
 
 		#Fill in with the data
@@ -379,12 +469,13 @@ class DataBlock(object):
 		return r
 
 	def _put_replace_array_nd(self, section, name, value, dtype, mode):
+		# A C-contiguous array of the right type is passed
+		# straight to the C code without any copying here
+		value = np.ascontiguousarray(value, dtype=dtype)
 		shape = value.shape
 		ndim = len(shape)
-		extent = (ct.c_int * ndim)()
-		for i in range(ndim): extent[i] = shape[i]
-		value = value.flatten()
-		p, arr, arr_size = self.python_to_1d_c_array(value, dtype)
+		extent = (ct.c_int * ndim)(*shape)
+		arr = value.ctypes.data_as(ct.POINTER(np.ctypeslib.as_ctypes_type(value.dtype)))
 		put_function={
 			(np.intc, self.PUT):lib.c_datablock_put_int_array,
 			(np.double, self.PUT):lib.c_datablock_put_double_array,
@@ -466,6 +557,55 @@ class DataBlock(object):
 		"""
 		return self._get_array_nd(section, name, int)
 
+	def get_array_view(self, section, name):
+		u"""Get a read-only view of an integer or floating-point array without copying it.
+
+		The array can be 1D or any other shape.  Unlike the other getters,
+		which copy the values out of the block each time, the NumPy array
+		returned here looks directly at the block's own storage, which is
+		much faster for large arrays that are read many times.
+
+		The view always shows the values as they were when it was made.
+		If the value is replaced while the view is alive the block stores
+		the new value separately, and deleting the value or clearing or
+		destroying the block leaves the view's values in place.  Writing
+		to the view is not allowed - use the put or replace methods
+		instead.
+
+		"""
+		type_code = lib.c_datatype()
+		status = lib.c_datablock_get_type(self._ptr, section.encode('ascii'), name.encode('ascii'), ct.byref(type_code))
+		if status==0 and type_code.value in (types.DBT_INT1D, types.DBT_INTND):
+			ctype, dtype, view_function = ct.c_int, np.intc, lib.c_datablock_view_int_array
+		else:
+			# Missing values and other types are reported
+			# (and logged) by the C function
+			ctype, dtype, view_function = ct.c_double, np.double, lib.c_datablock_view_double_array
+
+		data = ct.POINTER(ctype)()
+		ndim = lib.c_int()
+		extent = (ct.c_int * MAX_ARRAY_NDIM)()
+		pin = ct.c_void_p()
+		status = view_function(self._ptr, section.encode('ascii'), name.encode('ascii'), ct.byref(data), ct.byref(ndim), extent, MAX_ARRAY_NDIM, ct.byref(pin))
+		if status:
+			raise BlockError.exception_for_status(status, section, name)
+		pin = _ViewPin(pin.value)
+		shape = tuple(extent[i] for i in range(ndim.value))
+
+		if not data:
+			# Empty arrays have no storage to point to
+			r = np.zeros(shape, dtype=dtype)
+		else:
+			size = int(np.prod(shape))
+			buf = (ctype * size).from_address(ct.addressof(data.contents))
+			# The buffer, which is the base of the array, holds the
+			# reference to the block's storage, so it is neither freed
+			# nor changed under the array
+			buf._pin = pin
+			r = np.frombuffer(buf, dtype=dtype).reshape(shape)
+		r.flags.writeable = False
+		return r
+
 	#def get_complex_array_2d(self, section, name):
 	#	return self._get_array_2d(section, name, complex)
 
@@ -845,6 +985,8 @@ class DataBlock(object):
 		:class:`ValueError` will be raised.
 
 		"""
+		if type(section_name) is BlockHandle:
+			return self._get_by_handle(section_name)
 		try:
 			(section,name) = section_name
 		except ValueError:
@@ -861,6 +1003,8 @@ class DataBlock(object):
 
 		"""
 
+		if type(section_name) is BlockHandle and self._set_by_handle(section_name, value):
+			return
 		try:
 			(section,name) = section_name
 		except ValueError:
@@ -870,6 +1014,143 @@ class DataBlock(object):
 		else:
 			self.put(section, name, value)
 
+	@staticmethod
+	def handle(section, name):
+		u"""Make a :class:`BlockHandle` for the parameter with `name` in `section`.
+
+		The same section and name always give the same handle, and it can
+		be used with any block, whether or not the parameter is in it yet.
+
+		"""
+		h = ct.c_int()
+		status = lib.c_datablock_get_handle(section.encode('ascii'), name.encode('ascii'), ct.byref(h))
+		if status!=0:
+			raise BlockError.exception_for_status(status, section, name)
+		return BlockHandle(section, name, h.value)
+
+	def _get_by_handle(self, handle):
+		type_code = lib.c_datatype()
+		status = lib.c_datablock_get_type_by_handle(self._ptr, handle.id, ct.byref(type_code))
+		if status!=0:
+			raise BlockError.exception_for_status(status, handle.section, handle.name)
+		functions = _HANDLE_FUNCTIONS.get(type_code.value)
+		if functions is None:
+			# Arrays and other types go through the usual route
+			method = self._method_for_datatype_code(type_code.value, self.GET)
+			if method is None:
+				raise ValueError("Cosmosis internal error; unknown type of data. section: %s, name: %s, type_code: %s" % (handle.section, handle.name, type_code.value))
+			return method(handle.section, handle.name)
+		get, _, _, c_type, _ = functions
+		r = c_type()
+		status = get(self._ptr, handle.id, r)
+		if status!=0:
+			raise BlockError.exception_for_status(status, handle.section, handle.name)
+		return r.value
+
+	def _set_by_handle(self, handle, value):
+		# Returns False for types that have to be set the usual way
+		type_code = _scalar_type_code(value)
+		if type_code is None:
+			return False
+		self._set_many_typed([handle], [value], type_code)
+		return True
+
+	@staticmethod
+	def handles(keys):
+		u"""Make a list of :class:`BlockHandle` objects for a list of (section, name) pairs.
+
+		This is the same as calling :func:`handle` for each pair,
+		but with a single call to the C library.
+
+		"""
+		keys = [tuple(key) for key in keys]
+		packed = "".join("{}\0{}\0".format(section, name) for (section, name) in keys)
+		ids = np.empty(len(keys), dtype=np.intc)
+		status = lib.c_datablock_get_handles(len(keys), packed.encode('ascii'), ids.ctypes.data_as(lib.c_int_p))
+		if status!=0:
+			raise BlockError.exception_for_status(status, "", "")
+		return [BlockHandle(section, name, i) for ((section, name), i) in zip(keys, ids.tolist())]
+
+	@classmethod
+	def _as_handles(cls, keys):
+		keys = list(keys)
+		if all(type(key) is BlockHandle for key in keys):
+			return keys
+		return cls.handles(keys)
+
+	def _set_many_typed(self, handles, values, type_code):
+		_, _, put_many, c_type, dtype = _HANDLE_FUNCTIONS[type_code]
+		ids = np.array([h.id for h in handles], dtype=np.intc)
+		values = np.ascontiguousarray(values, dtype=dtype)
+		failed = ct.c_int(0)
+		status = put_many(self._ptr, len(ids), ids.ctypes.data_as(lib.c_int_p),
+			values.ctypes.data_as(ct.POINTER(c_type)), ct.byref(failed))
+		if status!=0:
+			h = handles[failed.value]
+			raise BlockError.exception_for_status(status, h.section, h.name)
+
+	def put_many(self, keys, values=None):
+		u"""Set the values of many parameters at once.
+
+		The `keys` can be a list of (section, name) pairs or of
+		:class:`BlockHandle` objects, with the `values` in a matching
+		sequence or numpy array, or a dictionary mapping keys to values.
+		As with ``block[section, name] = value`` each value is put in the
+		block or replaces the existing one.
+
+		Integer, floating-point and boolean values are each transferred
+		in a single call to the C library, so this is much faster than
+		setting them one by one.  Any other values are set individually.
+
+		"""
+		if values is None:
+			keys, values = list(keys.keys()), list(keys.values())
+		handles = self._as_handles(keys)
+		if len(handles) != len(values):
+			raise ValueError("put_many was given {} keys but {} values".format(len(handles), len(values)))
+
+		# Arrays of numbers all have the same type and go in one call.
+		# Others, like object arrays, may mix types so are checked below.
+		if isinstance(values, np.ndarray) and values.ndim == 1 and values.dtype.kind in 'biuf':
+			self._set_many_typed(handles, values, _scalar_type_code(values.dtype.type(0)))
+			return
+
+		groups = {}
+		for h, value in zip(handles, values):
+			type_code = _scalar_type_code(value)
+			if type_code is None:
+				self[h] = value
+			else:
+				group = groups.setdefault(type_code, ([], []))
+				group[0].append(h)
+				group[1].append(value)
+		for type_code, (group_handles, group_values) in groups.items():
+			self._set_many_typed(group_handles, group_values, type_code)
+
+	def get_many(self, keys, dtype=float):
+		u"""Get the values of many parameters at once, as a numpy array.
+
+		The `keys` can be a list of (section, name) pairs or of
+		:class:`BlockHandle` objects.  Every value must have the type given
+		by `dtype`, which can be float, int or bool; if any is missing or
+		of another type then a :class:`BlockError` is raised for it.
+
+		"""
+		type_code = _scalar_type_code(np.dtype(dtype).type(0))
+		if type_code is None:
+			raise ValueError("get_many can only get float, int or bool values, not {}".format(dtype))
+		_, get_many, _, c_type, np_type = _HANDLE_FUNCTIONS[type_code]
+		handles = self._as_handles(keys)
+		ids = np.array([h.id for h in handles], dtype=np.intc)
+		values = np.empty(len(ids), dtype=np_type)
+		failed = ct.c_int(0)
+		status = get_many(self._ptr, len(ids), ids.ctypes.data_as(lib.c_int_p),
+			values.ctypes.data_as(ct.POINTER(c_type)), ct.byref(failed))
+		if status!=0:
+			h = handles[failed.value]
+			raise BlockError.exception_for_status(status, h.section, h.name)
+		return values
+
 	def __contains__(self, section_name):
 		u"""Indicate whether there is a parameter with given section/name in the database.
 
@@ -906,18 +1187,54 @@ class DataBlock(object):
 		elements of each being the `section` and name of each parameter.
 
 		"""
-		if section is None:
-			sections = self.sections()
-		else:
-			sections = [section]
-		keys = []
-		for section in sections:
-			n_value = lib.c_datablock_num_values(self._ptr, section.encode('ascii'))
-			for i in range(n_value):
-				name = lib.c_datablock_get_value_name(self._ptr, section.encode('ascii'), i).decode('utf-8')
-				keys.append((section,name))
+		keys = [(s, name) for (s, name, _, _) in self.key_info()]
+		if section is not None:
+			section = section.lower()
+			keys = [k for k in keys if k[0]==section]
 		return keys
 
+	def key_info(self):
+		u"""Return a list of (section, name, type_code, size) for every value in the block.
+
+		This gets all the information in one go, which is much faster
+		than looping through the sections and names.  The type code is
+		one of the `dbt_types` values.  The size is the total number of
+		elements for arrays, and -1 for scalars.
+
+		"""
+		nkeys = lib.c_int()
+		nchars = lib.c_int()
+		status = lib.c_datablock_get_keys_size(self._ptr, ct.byref(nkeys), ct.byref(nchars))
+		if status:
+			raise BlockError.exception_for_status(status, "", "")
+		nkeys = nkeys.value
+		if nkeys == 0:
+			return []
+		names = ct.create_string_buffer(nchars.value)
+		types = np.empty(nkeys, dtype=np.intc)
+		sizes = np.empty(nkeys, dtype=np.intc)
+		status = lib.c_datablock_get_keys(self._ptr, nkeys, nchars.value, names,
+			types.ctypes.data_as(lib.c_int_p), sizes.ctypes.data_as(lib.c_int_p))
+		if status:
+			raise BlockError.exception_for_status(status, "", "")
+		# The buffer holds section\0name\0section\0name\0...
+		strings = names.raw.decode('utf-8').split('\0')
+		return list(zip(strings[0:-1:2], strings[1::2], types.tolist(), sizes.tolist()))
+
+	def items(self):
+		u"""Generate ((section, name), value) pairs for every value in the block.
+
+		As with a dictionary this is the quickest way to go through all
+		the contents of the block, since the keys and their types are all
+		looked up at once.
+
+		"""
+		for (section, name, type_code, _) in self.key_info():
+			method = self._method_for_datatype_code(type_code, self.GET)
+			if method is None:
+				raise ValueError("Cosmosis internal error; unknown type of data. section: %s, name: %s, type_code: %s" % (section, name, type_code))
+			yield (section, name), method(section, name)
+
 
 	def _delete_section(self, section):
 		"Internal use only!"
@@ -1063,20 +1380,18 @@ class DataBlock(object):
 				f.close()
 
 	def _save_paths(self):
-		keys = list(self.keys())
-		sections = set(k[0] for k in keys)
-		for section in sections:
+		values = collections.defaultdict(list)
+		for (section, name), value in self.items():
+			values[section].append((name, value))
+		for section, section_values in values.items():
 			scalar_outputs = []
 			meta = collections.defaultdict(dict)
 			vector_outputs = []
-			for k in keys:
-				sec, name = k
-				if sec!=section: continue
+			for name, value in section_values:
 				if name.startswith(metadata_prefix):
 					target, metakey = self._parse_metadata_key(name)
-					meta[target][metakey] = self[section,name]
+					meta[target][metakey] = value
 					continue
-				value = self[section,name]
 				if np.isscalar(value):
 					scalar_outputs.append((name,value))
 				else:
@@ -1108,6 +1423,20 @@ class DataBlock(object):
 		if status!=0:
 			raise BlockError.exception_for_status(status, "", "")
 
+	def get_bytes_accessed(self):
+		u"""Return the total numbers of bytes of data read from and written to this block.
+
+		Values that are put or replaced count as written.  The counts are
+		kept whatever the log level is set to.
+
+		"""
+		nread = ct.c_longlong()
+		nwritten = ct.c_longlong()
+		status = lib.c_datablock_get_bytes_accessed(self._ptr, ct.byref(nread), ct.byref(nwritten))
+		if status!=0:
+			raise BlockError.exception_for_status(status, "", "")
+		return nread.value, nwritten.value
+
 	def get_log_count(self):
 		u"""Return the number of entries in the log."""
 		return lib.c_datablock_get_log_count(self._ptr)
@@ -1130,6 +1459,68 @@ class DataBlock(object):
 			raise ValueError("Asked for log entry above maximum or less than zero")
 		return ptype.value.decode('utf-8'), section.value.decode('utf-8'), name.value.decode('utf-8'), dtype.value.decode('utf-8')
 
+	def get_log(self, start=0):
+		u"""Get all the log entries from number `start` onwards.
+
+		The return is a list of tuples, in the same form as from
+		:func:`get_log_entry`.  This is much faster than calling that
+		function for each entry, since all the entries are fetched in
+		one call, and the log stores each string only once.
+
+		"""
+		n = self.get_log_count() - start
+		if n <= 0:
+			return []
+		ids = np.empty((n, 4), dtype=np.intc)
+		status = lib.c_datablock_get_log_ids(self._ptr, start, n, ids.ctypes.data_as(lib.c_int_p))
+		if status:
+			raise ValueError("Asked for log entry above maximum or less than zero")
+		strings = self._get_log_strings()
+		return [tuple(strings[i] for i in entry) for entry in ids.tolist()]
+
+	def _get_log_strings(self):
+		# The strings in the log never change their ids, so
+		# we only need to fetch any new ones each time
+		strings = self.__dict__.setdefault('_log_strings', [])
+		nstring = lib.c_datablock_get_log_string_count(self._ptr)
+		smax = 128
+		buf = ct.create_string_buffer(smax)
+		for i in range(len(strings), nstring):
+			while True:
+				status = lib.c_datablock_get_log_string(self._ptr, i, smax, buf)
+				if status:
+					raise BlockError.exception_for_status(status, "", "")
+				# The string is cut short if it does not fit in the
+				# buffer, so if it fills it we try again with a bigger one
+				if len(buf.value) < smax - 1:
+					break
+				smax *= 2
+				buf = ct.create_string_buffer(smax)
+			strings.append(buf.value.decode('utf-8'))
+		return strings
+
+	def set_log_level(self, level):
+		u"""Choose how much of the access log to keep.
+
+		The `level` should be one of "off", "first-use", or "full" (the
+		default), or the corresponding number 0, 1, or 2 from
+		`LOG_LEVELS`.  With "first-use" each kind of access to each
+		value is only recorded the first time it happens, though the
+		start of each module is always recorded.  Entries already in
+		the log are kept.
+
+		"""
+		level = LOG_LEVELS.get(level, level)
+		if level not in LOG_LEVELS.values():
+			raise ValueError("Unknown log level {}: should be one of {}".format(level, ", ".join(LOG_LEVELS)))
+		status = lib.c_datablock_set_log_level(self._ptr, level)
+		if status!=0:
+			raise BlockError.exception_for_status(status, "", "")
+
+	def get_log_level(self):
+		u"""Return the current log level, as a number from `LOG_LEVELS`."""
+		return lib.c_datablock_get_log_level(self._ptr)
+
 	def log_access(self, log_type, section, name):
 		u"""Add an entry to the end of this :class:`DataBlock` access log.
 
@@ -1296,8 +1687,7 @@ class DataBlock(object):
 		#now actually parse the log
 		current_module = None
 		current_name = "None"
-		for i in range(self.get_log_count()):
-			ptype, section, name, _ = self.get_log_entry(i)
+		for ptype, section, name, _ in self.get_log():
 			if ptype=="MODULE-START":
 				# The previous current_module is already the
 				#last element in params_by_module (unless it's the
@@ -1349,14 +1739,11 @@ class DataBlock(object):
 		else:
 			stream = filename_or_stream
 
-		data = {}
-		for section in self.sections():
-			data[section] = {}
-			for (_, key) in self.keys(section):
-				value = self[section, key]
-				if isinstance(value, np.ndarray):
-					value = value.tolist()
-				data[section][key] = value
+		data = {section: {} for section in self.sections()}
+		for (section, key), value in self.items():
+			if isinstance(value, np.ndarray):
+				value = value.tolist()
+			data[section][key] = value
 
 		yaml.dump(data, stream)
 
@@ -1385,8 +1772,58 @@ class DataBlock(object):
 		sio.seek(0)
 		return sio.read()
 
-	def __reduce__(self):
-		return (datablock_from_string, (self.to_string(),))
+	def to_binary(self, protocol=pickle.HIGHEST_PROTOCOL):
+		u"""Pack the block into a section/key index and a list of raw array buffers.
+
+		The index is a list of (section, name, type_code, value) tuples.
+		Scalars and string arrays are stored directly as the value; for
+		numeric arrays the value is instead a (dtype, shape, buffer_index)
+		triple pointing into the returned buffer list.  Metadata entries
+		are ordinary string values so are carried along unchanged.
+
+		If `protocol` is 5 or above the buffers are wrapped in
+		:class:`pickle.PickleBuffer` objects so that the pickle machinery
+		can send them out-of-band without any copying; otherwise they are
+		plain bytes.
+
+		"""
+		index = []
+		buffers = []
+		for (section, name, type_code, _) in self.key_info():
+			value = self.get(section, name)
+			if type_code in _binary_array_types:
+				value = np.ascontiguousarray(value)
+				if protocol >= 5:
+					buf = pickle.PickleBuffer(value)
+				else:
+					buf = value.tobytes()
+				value = (value.dtype.str, value.shape, len(buffers))
+				buffers.append(buf)
+			elif type_code == types.DBT_STRING1D:
+				value = value.tolist()
+			index.append((section, name, type_code, value))
+		return index, buffers
+
+	@classmethod
+	def from_binary(cls, index, buffers):
+		u"""Rebuild a block from the output of :func:`to_binary`."""
+		block = cls()
+		for (section, name, type_code, value) in index:
+			if type_code in _binary_array_types:
+				dtype, shape, i = value
+				value = np.frombuffer(buffers[i], dtype=dtype).reshape(shape)
+			method = block._method_for_datatype_code(type_code, cls.PUT)
+			if method is None:
+				raise ValueError("Cannot unpack value of type code %s for %s, %s" % (type_code, section, name))
+			method(section, name, value)
+		return block
+
+	def __reduce_ex__(self, protocol):
+		# The YAML text format is much slower and loses
+		# array dtypes, so we only use it for ancient pickle protocols
+		if protocol < 2:
+			return (datablock_from_string, (self.to_string(),))
+		return (datablock_from_binary, self.to_binary(protocol))
 
 
 # This is not needed under python 3, where, the __reduce__ method
@@ -1394,6 +1831,16 @@ class DataBlock(object):
 def datablock_from_string(s):
 	return DataBlock.from_string(s)
 
+def datablock_from_binary(index, buffers):
+	return DataBlock.from_binary(index, buffers)
+
+_binary_array_types = (
+	types.DBT_INT1D,
+	types.DBT_DOUBLE1D,
+	types.DBT_INTND,
+	types.DBT_DOUBLEND,
+)
+
 
 
 
@@ -63,6 +63,9 @@ load_function_types(locals(), c_str, 'string')
 
 load_array_function_types(locals(), ct.c_int, 'int')
 load_array_function_types(locals(), ct.c_double, 'double')
+load_library_function(locals(), "c_datablock_view_int_array", [c_block, c_str, c_str, ct.POINTER(ct.POINTER(ct.c_int)), c_int_p, c_int_p, c_int, ct.POINTER(ct.c_void_p)], c_status)
+load_library_function(locals(), "c_datablock_view_double_array", [c_block, c_str, c_str, ct.POINTER(ct.POINTER(ct.c_double)), c_int_p, c_int_p, c_int, ct.POINTER(ct.c_void_p)], c_status)
+load_library_function(locals(), "c_datablock_release_view", [ct.c_void_p], None)
 #load_array_function_types(locals(), ct.c_complex, 'complex')
 
 load_library_function(
@@ -137,6 +140,52 @@ load_library_function(
 	c_str
 	)
 
+load_library_function(
+	locals(),
+	"c_datablock_get_keys_size",
+	[c_block, c_int_p, c_int_p],
+	c_status
+	)
+
+load_library_function(
+	locals(),
+	"c_datablock_get_keys",
+	[c_block, ct.c_int, ct.c_int, ct.c_char_p, c_int_p, c_int_p],
+	c_status
+	)
+
+load_library_function(
+	locals(),
+	"c_datablock_get_handle",
+	[c_str, c_str, c_int_p],
+	c_status
+	)
+
+load_library_function(
+	locals(),
+	"c_datablock_get_type_by_handle",
+	[c_block, ct.c_int, ct.POINTER(c_datatype)],
+	c_status
+	)
+
+load_library_function(
+	locals(),
+	"c_datablock_get_handles",
+	[c_int, c_str, c_int_p],
+	c_status
+	)
+
+def load_handle_function_types(namespace, c_type, c_name):
+	load_library_function(namespace, "c_datablock_get_%s_by_handle"%c_name, [c_block, c_int, ct.POINTER(c_type)], c_status)
+	load_library_function(namespace, "c_datablock_put_%s_by_handle"%c_name, [c_block, c_int, c_type], c_status)
+	load_library_function(namespace, "c_datablock_replace_%s_by_handle"%c_name, [c_block, c_int, c_type], c_status)
+	load_library_function(namespace, "c_datablock_put_%s_many"%c_name, [c_block, c_int, c_int_p, ct.POINTER(c_type), c_int_p], c_status)
+	load_library_function(namespace, "c_datablock_get_%s_many"%c_name, [c_block, c_int, c_int_p, ct.POINTER(c_type), c_int_p], c_status)
+
+load_handle_function_types(locals(), ct.c_int, 'int')
+load_handle_function_types(locals(), ct.c_bool, 'bool')
+load_handle_function_types(locals(), ct.c_double, 'double')
+
 load_library_function(
 	locals(),
 	"c_datablock_get_value_name_by_section_index",
@@ -166,6 +215,13 @@ load_library_function(
 	ct.c_int
 	)
 
+load_library_function(
+	locals(),
+	"c_datablock_merge",
+	[c_block, c_block, ct.c_bool, c_int, c_str],
+	ct.c_int
+	)
+
 
 load_library_function(
 	locals(),
@@ -204,6 +260,48 @@ load_library_function(
 	c_status
 	)
 
+load_library_function(
+	locals(),
+	"c_datablock_set_log_level",
+	[c_block, ct.c_int],
+	c_status
+	)
+
+load_library_function(
+	locals(),
+	"c_datablock_get_log_level",
+	[c_block],
+	ct.c_int
+	)
+
+load_library_function(
+	locals(),
+	"c_datablock_get_bytes_accessed",
+	[c_block, ct.POINTER(ct.c_longlong), ct.POINTER(ct.c_longlong)],
+	c_status
+	)
+
+load_library_function(
+	locals(),
+	"c_datablock_get_log_ids",
+	[c_block, ct.c_int, ct.c_int, c_int_p],
+	c_status
+	)
+
+load_library_function(
+	locals(),
+	"c_datablock_get_log_string_count",
+	[c_block],
+	ct.c_int
+	)
+
+load_library_function(
+	locals(),
+	"c_datablock_get_log_string",
+	[c_block, ct.c_int, ct.c_int, ct.c_char_p],
+	c_status
+	)
+
 
 
 
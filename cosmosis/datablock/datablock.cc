@@ -1,9 +1,22 @@
 #include "datablock.hh"
 #include "clamp.hh"
 #include <iostream>
+#include <cstdlib>
 #include "cxxabi.h"
+#include <deque>
+#include <mutex>
 using namespace std;
 
+// Handles are only ever added to the registry, and a deque does not
+// move its elements when it grows, so DataBlocks can keep pointers to
+// the keys without holding the lock.
+struct cosmosis::DataBlock::handle_registry
+{
+  std::mutex mutex;
+  std::deque<handle_key> keys;
+  std::map<std::pair<std::string, std::string>, int> ids;
+};
+
 bool cosmosis::DataBlock::has_val(string section,
                                               string name) const
 {
@@ -79,14 +92,11 @@ std::string const& cosmosis::DataBlock::value_name(std::string section, int j) c
 
 void cosmosis::DataBlock::print_log()
 {
-  for (auto L=access_log_.begin(); L!=access_log_.end(); ++L){
-    auto l = *L;
-    auto access_type = std::get<0>(l);
-    auto section = std::get<1>(l);
-    auto name = std::get<2>(l);
-    bool new_module = access_type == std::string(BLOCK_LOG_START_MODULE);
+  for (auto const& l : access_log_){
+    auto const& access_type = log_strings_[l.log_type];
+    bool new_module = access_type == BLOCK_LOG_START_MODULE;
     if (new_module) std::cout << std::endl << std::endl;
-      std::cout << access_type << "    " << section << "    " << name << std::endl;
+      std::cout << access_type << "    " << log_strings_[l.section] << "    " << log_strings_[l.name] << std::endl;
     if (new_module) std::cout << std::endl;
   }
 
@@ -105,12 +115,51 @@ cosmosis::DataBlock::copy_section(std::string source, std::string dest)
   return DBS_SUCCESS;
 }
 
+void
+cosmosis::DataBlock::merge(DataBlock const& other, bool replace,
+                           std::map<std::string, std::set<std::string>> const& exclude)
+{
+  std::set<std::string> const nothing;
+  for (auto const& sec : other.sections_) {
+    auto iex = exclude.find(sec.first);
+    auto isec = sections_.find(sec.first);
+    if (isec == sections_.end() && iex == exclude.end()) {
+      // The whole section can be grafted in
+      sections_.emplace(sec);
+    }
+    else {
+      auto const& skip = (iex == exclude.end()) ? nothing : iex->second;
+      if (isec != sections_.end()) {
+        isec->second.merge(sec.second, replace, skip);
+      }
+      else {
+        Section merged;
+        merged.merge(sec.second, replace, skip);
+        if (merged.number_values() == 0) continue;
+        sections_.emplace(sec.first, std::move(merged));
+      }
+    }
+    log_access(BLOCK_LOG_MERGE, sec.first, "", typeid(sec.first));
+  }
+}
 
 void cosmosis::DataBlock::clear()
 {
   std::string t = std::string("");
   log_access(BLOCK_LOG_CLEAR, "", "", typeid(t));
   sections_.clear();
+  forget_handle_entries();
+}
+
+std::shared_ptr<cosmosis::Entry>
+cosmosis::DataBlock::share_entry(std::string section, std::string name)
+{
+  downcase(section); downcase(name);
+  auto isec = sections_.find(section);
+  if (isec == sections_.end()) return nullptr;
+  auto entry = isec->second.find_entry(name);
+  if (entry == nullptr) return nullptr;
+  return *entry;
 }
 
 DATABLOCK_STATUS 
@@ -120,19 +169,63 @@ cosmosis::DataBlock::delete_section(std::string section)
   auto isec = sections_.find(section);
   if (isec == sections_.end()) return DBS_SECTION_NOT_FOUND;
   sections_.erase(isec);
+  forget_handle_entries();
   std::string t = std::string("");
   log_access(BLOCK_LOG_DELETE, section, "", typeid(t));
 
   return DBS_SUCCESS;
 }
 
+int cosmosis::DataBlock::intern_log_string(std::string const& s)
+{
+  auto i = log_string_ids_.find(s);
+  if (i != log_string_ids_.end()) return i->second;
+  int id = log_strings_.size();
+  log_strings_.push_back(s);
+  log_string_ids_[s] = id;
+  return id;
+}
+
+int cosmosis::DataBlock::intern_log_type(std::type_info const& type)
+{
+  std::type_index info(type);
+  auto i = log_type_ids_.find(info);
+  if (i != log_type_ids_.end()) return i->second;
+  // We only need to demangle each type name once
+  int status;
+  char* type_name = abi::__cxa_demangle(info.name(), nullptr, nullptr, &status);
+  int id = intern_log_string(status ? info.name() : type_name);
+  free(type_name);
+  log_type_ids_[info] = id;
+  return id;
+}
+
 void cosmosis::DataBlock::log_access(const std::string& log_type, 
   const std::string& section, const std::string &name, const std::type_info& type)
 {
-  auto entry = log_entry(log_type, section, name, type);
+  if (log_level_ == BLOCK_LOG_LEVEL_OFF) return;
+  log_entry entry;
+  entry.log_type = intern_log_string(log_type);
+  entry.section = intern_log_string(section);
+  entry.name = intern_log_string(name);
+  if (log_level_ == BLOCK_LOG_LEVEL_FIRST_USE && log_type != BLOCK_LOG_START_MODULE){
+    auto use = std::make_tuple(entry.log_type, entry.section, entry.name);
+    if (!logged_uses_.insert(use).second) return;
+  }
+  entry.type = intern_log_type(type);
   access_log_.push_back(entry);
 }
 
+void cosmosis::DataBlock::set_log_level(int level)
+{
+  log_level_ = level;
+}
+
+int cosmosis::DataBlock::get_log_level() const
+{
+  return log_level_;
+}
+
 int cosmosis::DataBlock::get_log_count()
 {
   return access_log_.size();
@@ -149,32 +242,47 @@ cosmosis::DataBlock::get_log_entry(int i,
   if (i<0) return DBS_SIZE_INSUFFICIENT;
   unsigned int j = (unsigned int) i;
   if (j>=access_log_.size()) return DBS_SIZE_INSUFFICIENT;
-  const log_entry entry = access_log_[j];
-  log_type = std::get<0>(entry);
-  section = std::get<1>(entry);
-  name = std::get<2>(entry);
-  std::type_index info(std::get<3>(entry));
-  char type_name[128];
-  int status;
-  size_t len = 128;
-  abi::__cxa_demangle(info.name(), type_name, &len, &status); 
-  if (status){
-    type = info.name();
-  }
-  else{
-    type = type_name;
+  log_entry const& entry = access_log_[j];
+  log_type = log_strings_[entry.log_type];
+  section = log_strings_[entry.section];
+  name = log_strings_[entry.name];
+  type = log_strings_[entry.type];
+  return DBS_SUCCESS;
+}
+
+DATABLOCK_STATUS
+cosmosis::DataBlock::get_log_ids(int start, int n, int* ids) const
+{
+  if (start < 0 || n < 0) return DBS_SIZE_NONPOSITIVE;
+  if (static_cast<size_t>(start) + n > access_log_.size()) return DBS_SIZE_INSUFFICIENT;
+  for (auto e = access_log_.begin() + start; n > 0; ++e, --n){
+    *ids++ = e->log_type;
+    *ids++ = e->section;
+    *ids++ = e->name;
+    *ids++ = e->type;
   }
+  return DBS_SUCCESS;
+}
 
+DATABLOCK_STATUS
+cosmosis::DataBlock::get_log_string(int id, std::string& s) const
+{
+  if (id < 0 || static_cast<size_t>(id) >= log_strings_.size()) return DBS_SIZE_INSUFFICIENT;
+  s = log_strings_[id];
   return DBS_SUCCESS;
 }
 
+int cosmosis::DataBlock::get_log_string_count() const
+{
+  return log_strings_.size();
+}
+
 void cosmosis::DataBlock::report_failures(std::ostream &output)
 {
-   for (auto L=access_log_.begin(); L!=access_log_.end(); ++L){
-      auto l = *L;
-      auto access_type = std::get<0>(l);
-      auto section = std::get<1>(l);
-      auto name = std::get<2>(l);
+   for (auto const& l : access_log_){
+      auto const& access_type = log_strings_[l.log_type];
+      auto const& section = log_strings_[l.section];
+      auto const& name = log_strings_[l.name];
       if(access_type==BLOCK_LOG_READ_FAIL){
         output << "Failed to read " << name << " from " << section << std::endl;
       }
@@ -238,3 +346,73 @@ cosmosis::DataBlock::get_metadata(std::string section,
     return get_val(section, metadata_key, value);
 
 }
+
+cosmosis::DataBlock::handle_registry&
+cosmosis::DataBlock::registry()
+{
+  static handle_registry r;
+  return r;
+}
+
+int
+cosmosis::DataBlock::get_handle(std::string section, std::string name)
+{
+  downcase(section); downcase(name);
+  auto& r = registry();
+  std::lock_guard<std::mutex> lock(r.mutex);
+  auto id = r.ids.emplace(std::make_pair(section, name), r.keys.size());
+  if (id.second) r.keys.push_back({section, name});
+  return id.first->second;
+}
+
+cosmosis::DataBlock::handle_key const*
+cosmosis::DataBlock::find_handle_key(int handle)
+{
+  auto& r = registry();
+  std::lock_guard<std::mutex> lock(r.mutex);
+  if (handle < 0 || static_cast<std::size_t>(handle) >= r.keys.size()) return nullptr;
+  return &r.keys[handle];
+}
+
+cosmosis::DataBlock::handle_slot*
+cosmosis::DataBlock::resolve_handle(int handle)
+{
+  auto& slots = handles_.slots;
+  if (handle < 0) return nullptr;
+  if (static_cast<std::size_t>(handle) >= slots.size())
+    {
+      if (find_handle_key(handle) == nullptr) return nullptr;
+      slots.resize(handle + 1);
+    }
+  handle_slot& slot = slots[handle];
+  if (slot.key == nullptr) slot.key = find_handle_key(handle);
+  if (slot.entry == nullptr)
+    {
+      auto isec = sections_.find(slot.key->section);
+      if (isec != sections_.end()) slot.entry = isec->second.find_entry(slot.key->name);
+    }
+  return &slot;
+}
+
+void
+cosmosis::DataBlock::forget_handle_entries()
+{
+  for (auto& slot : handles_.slots) slot.entry = nullptr;
+}
+
+DATABLOCK_STATUS
+cosmosis::DataBlock::missing_status(handle_key const& key) const
+{
+  if (sections_.find(key.section) == sections_.end()) return DBS_SECTION_NOT_FOUND;
+  return DBS_NAME_NOT_FOUND;
+}
+
+DATABLOCK_STATUS
+cosmosis::DataBlock::get_type(int handle, datablock_type_t& t)
+{
+  t = DBT_UNKNOWN;
+  handle_slot* slot = resolve_handle(handle);
+  if (slot == nullptr) return DBS_NAME_NOT_FOUND;
+  if (slot->entry == nullptr) return missing_status(*slot->key);
+  return Section::entry_type(**slot->entry, t);
+}
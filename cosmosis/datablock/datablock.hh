@@ -38,6 +38,11 @@
 
 #include <string>
 #include <map>
+#include <memory>
+#include <set>
+#include <tuple>
+#include <unordered_map>
+#include <vector>
 #include <cctype>
 #include <ostream>
 
@@ -53,6 +58,28 @@ namespace cosmosis
   inline
   void downcase(std::string& s) { for (auto& x : s) { x = std::tolower(x); } }
 
+  // The size in bytes of the data in a value, used to count how much
+  // is read from and written to a DataBlock.
+  template <class T>
+  std::size_t value_nbytes(T const&) { return sizeof(T); }
+
+  inline
+  std::size_t value_nbytes(std::string const& s) { return s.size(); }
+
+  template <class T>
+  std::size_t value_nbytes(std::vector<T> const& v) { return v.size() * sizeof(T); }
+
+  inline
+  std::size_t value_nbytes(std::vector<std::string> const& v)
+  {
+    std::size_t n = 0;
+    for (auto const& s : v) n += s.size();
+    return n;
+  }
+
+  template <class T>
+  std::size_t value_nbytes(ndarray<T> const& a) { return a.size() * sizeof(T); }
+
   class DataBlock
   {
   public:
@@ -122,6 +149,15 @@ namespace cosmosis
     bool has_section(std::string name) const;
     DATABLOCK_STATUS copy_section(std::string source, std::string dest);
 
+    // Add all the values from other to this DataBlock, apart from
+    // those listed in exclude, which maps (lower-case) section names
+    // to the names to skip in them. The values are shared with other
+    // rather than copied, as in a clone, and whole sections are added
+    // in one step. Existing values are overwritten if replace is true
+    // and kept otherwise.
+    void merge(DataBlock const& other, bool replace,
+               std::map<std::string, std::set<std::string>> const& exclude);
+
     DATABLOCK_STATUS
     delete_section(std::string section);
 
@@ -173,15 +209,123 @@ namespace cosmosis
     template <class T>
     T const& view(std::string section, std::string name);
 
+    // Return a new reference to the entry holding the value for the
+    // given section and name, or nullptr if there is none. While the
+    // reference is held the entry is left unchanged and alive: a
+    // replace gives the section a new entry instead, and a delete or
+    // clear only drops the section's own reference.
+    std::shared_ptr<Entry> share_entry(std::string section, std::string name);
+
+    // Call f(section, name, type, size) for every value in the
+    // DataBlock, in the order given by section_name and value_name,
+    // but without looking each one up. See Section::for_each_value.
+    template <class F>
+    void for_each_value(F f) const;
+
+    // Handles are integer keys for (section, name) pairs that are used
+    // over and over again, for example by a module on every run of the
+    // pipeline. The strings are normalized once, when the handle is
+    // made, and each DataBlock remembers where it stores the value for
+    // each handle it has seen, so accessing a value through its handle
+    // skips both the string handling and the search. Handles are
+    // shared by all DataBlocks in the process; get_handle returns the
+    // same handle every time for the same section and name.
+    static int get_handle(std::string section, std::string name);
+
+    // As the functions above, but for the value with the given handle.
+    // An invalid handle gives DBS_NAME_NOT_FOUND.
+    DATABLOCK_STATUS get_type(int handle, datablock_type_t& t);
+
+    template <class T>
+    DATABLOCK_STATUS get_val(int handle, T& val);
+
+    template <class T>
+    DATABLOCK_STATUS put_val(int handle, T const& val);
+
+    template <class T>
+    DATABLOCK_STATUS replace_val(int handle, T const& val);
+
+    // Put the value if there is none for the handle, or otherwise
+    // replace it, which requires it to be of the same type.
+    template <class T>
+    DATABLOCK_STATUS set_val(int handle, T const& val);
+
     void print_log();
     void report_failures(std::ostream& output);
     void log_access(const std::string& log_type, const std::string& section, const std::string& name, const std::type_info& type);
     int get_log_count();
     DATABLOCK_STATUS
     get_log_entry(int i, std::string& log_type, std::string& section, std::string &name, std::string & type);
+
+    // The log level is one of the datablock_log_level values. Changing
+    // it does not affect entries already in the log.
+    void set_log_level(int level);
+    int get_log_level() const;
+
+    // The total size in bytes of the values that have been read from,
+    // and put or replaced in, this DataBlock. These are counted
+    // whatever the log level.
+    std::size_t bytes_read() const { return bytes_read_; }
+    std::size_t bytes_written() const { return bytes_written_; }
+
+    // Copy the string ids of log entries start to start+n-1 into
+    // 'ids', four per entry: log type, section, name and type name.
+    // The strings themselves can be looked up with get_log_string.
+    DATABLOCK_STATUS
+    get_log_ids(int start, int n, int* ids) const;
+    DATABLOCK_STATUS
+    get_log_string(int id, std::string& s) const;
+    int get_log_string_count() const;
+
   private:
+    int intern_log_string(std::string const& s);
+    int intern_log_type(std::type_info const& type);
+
+    struct handle_key
+    {
+      std::string section;
+      std::string name;
+    };
+    struct handle_registry;
+    static handle_registry& registry();
+    static handle_key const* find_handle_key(int handle);
+
+    // Where this DataBlock keeps the value for a handle. The entry is
+    // nullptr if the value has not been found yet.
+    struct handle_slot
+    {
+      handle_key const* key = nullptr;
+      std::shared_ptr<Entry>* entry = nullptr;
+    };
+    // The slots point into this DataBlock's own sections, so they are
+    // not copied along with it.
+    struct handle_cache
+    {
+      std::vector<handle_slot> slots;
+      handle_cache() = default;
+      handle_cache(handle_cache const&) {}
+      handle_cache& operator=(handle_cache const&) { slots.clear(); return *this; }
+    };
+
+    // Return the slot for the handle, or nullptr if it is not valid.
+    handle_slot* resolve_handle(int handle);
+    // Forget the stored entries, when sections are removed.
+    void forget_handle_entries();
+    // The error status for a handle whose value does not exist.
+    DATABLOCK_STATUS missing_status(handle_key const& key) const;
+
     std::map<std::string, Section> sections_;
+    handle_cache handles_;
+    int log_level_ = BLOCK_LOG_LEVEL_FULL;
+    std::size_t bytes_read_ = 0;
+    std::size_t bytes_written_ = 0;
     std::vector<log_entry> access_log_;
+    std::vector<std::string> log_strings_;
+    std::unordered_map<std::string, int> log_string_ids_;
+    std::unordered_map<std::type_index, int> log_type_ids_;
+    // The (log type, section, name) accesses already logged,
+    // for BLOCK_LOG_LEVEL_FIRST_USE
+    std::set<std::tuple<int, int, int>> logged_uses_;
   };
 }
 
@@ -220,7 +364,11 @@ cosmosis::DataBlock::get_val(std::string section,
       return DBS_SECTION_NOT_FOUND;
     }
   DATABLOCK_STATUS status = isec->second.get_val(name, val);
-  if (status == DBS_SUCCESS) { log_access(BLOCK_LOG_READ, section, name, typeid(val)); }
+  if (status == DBS_SUCCESS)
+    {
+      bytes_read_ += value_nbytes(val);
+      log_access(BLOCK_LOG_READ, section, name, typeid(val));
+    }
   else { log_access(BLOCK_LOG_READ_FAIL, section, name, typeid(val)); }
   return status;
 }
@@ -242,7 +390,11 @@ cosmosis::DataBlock::get_val(std::string section,
       return DBS_SUCCESS;
     }
   DATABLOCK_STATUS status = isec->second.get_val(name, def, val);
-  if (status == DBS_SUCCESS) { log_access(BLOCK_LOG_READ, section, name, typeid(val)); }
+  if (status == DBS_SUCCESS)
+    {
+      bytes_read_ += value_nbytes(val);
+      log_access(BLOCK_LOG_READ, section, name, typeid(val));
+    }
   else if (status == DBS_USED_DEFAULT)
     {
       log_access(BLOCK_LOG_READ_DEFAULT, section, name, typeid(val));
@@ -263,7 +415,10 @@ cosmosis::DataBlock::put_val(std::string section,
   auto& sec = sections_[section]; // create one if needed
   DATABLOCK_STATUS status = sec.put_val(name, val);
   if (status == DBS_SUCCESS)
-    { log_access(BLOCK_LOG_WRITE, section, name, typeid(val)); }
+    {
+      bytes_written_ += value_nbytes(val);
+      log_access(BLOCK_LOG_WRITE, section, name, typeid(val));
+    }
   else
     { log_access(BLOCK_LOG_WRITE_FAIL, section, name, typeid(val)); }
   return status;
@@ -284,12 +439,103 @@ cosmosis::DataBlock::replace_val(std::string section,
     }
   DATABLOCK_STATUS status = isec->second.replace_val(name, val);
   if (status == DBS_SUCCESS)
-    { log_access(BLOCK_LOG_REPLACE, section, name, typeid(val)); }
+    {
+      bytes_written_ += value_nbytes(val);
+      log_access(BLOCK_LOG_REPLACE, section, name, typeid(val));
+    }
   else
     { log_access(BLOCK_LOG_REPLACE_FAIL, section, name, typeid(val)); }
   return status;
 }
 
+template <class T>
+DATABLOCK_STATUS
+cosmosis::DataBlock::get_val(int handle, T& val)
+{
+  handle_slot* slot = resolve_handle(handle);
+  if (slot == nullptr) return DBS_NAME_NOT_FOUND;
+  auto const& key = *slot->key;
+  if (slot->entry == nullptr)
+    {
+      log_access(BLOCK_LOG_READ_FAIL, key.section, key.name, typeid(val));
+      return missing_status(key);
+    }
+  Entry const& e = **slot->entry;
+  if (not e.is<T>())
+    {
+      log_access(BLOCK_LOG_READ_FAIL, key.section, key.name, typeid(val));
+      return DBS_WRONG_VALUE_TYPE;
+    }
+  val = e.val<T>();
+  bytes_read_ += value_nbytes(val);
+  log_access(BLOCK_LOG_READ, key.section, key.name, typeid(val));
+  return DBS_SUCCESS;
+}
+
+template <class T>
+DATABLOCK_STATUS
+cosmosis::DataBlock::put_val(int handle, T const& val)
+{
+  handle_slot* slot = resolve_handle(handle);
+  if (slot == nullptr) return DBS_NAME_NOT_FOUND;
+  auto const& key = *slot->key;
+  if (slot->entry != nullptr)
+    {
+      log_access(BLOCK_LOG_WRITE_FAIL, key.section, key.name, typeid(val));
+      return DBS_NAME_ALREADY_EXISTS;
+    }
+  auto& sec = sections_[key.section]; // create one if needed
+  DATABLOCK_STATUS status = sec.put_val(key.name, val);
+  slot->entry = sec.find_entry(key.name);
+  bytes_written_ += value_nbytes(val);
+  log_access(BLOCK_LOG_WRITE, key.section, key.name, typeid(val));
+  return status;
+}
+
+template <class T>
+DATABLOCK_STATUS
+cosmosis::DataBlock::replace_val(int handle, T const& val)
+{
+  handle_slot* slot = resolve_handle(handle);
+  if (slot == nullptr) return DBS_NAME_NOT_FOUND;
+  auto const& key = *slot->key;
+  if (slot->entry == nullptr)
+    {
+      log_access(BLOCK_LOG_REPLACE_FAIL, key.section, key.name, typeid(val));
+      return missing_status(key);
+    }
+  if (not (*slot->entry)->is<T>())
+    {
+      log_access(BLOCK_LOG_REPLACE_FAIL, key.section, key.name, typeid(val));
+      return DBS_WRONG_VALUE_TYPE;
+    }
+  Section::replace_entry(*slot->entry, val);
+  bytes_written_ += value_nbytes(val);
+  log_access(BLOCK_LOG_REPLACE, key.section, key.name, typeid(val));
+  return DBS_SUCCESS;
+}
+
+template <class T>
+DATABLOCK_STATUS
+cosmosis::DataBlock::set_val(int handle, T const& val)
+{
+  handle_slot* slot = resolve_handle(handle);
+  if (slot == nullptr) return DBS_NAME_NOT_FOUND;
+  if (slot->entry == nullptr) return put_val(handle, val);
+  return replace_val(handle, val);
+}
+
+template <class F>
+void
+cosmosis::DataBlock::for_each_value(F f) const
+{
+  for (auto const& sec : sections_) {
+    sec.second.for_each_value(
+      [&](std::string const& name, datablock_type_t t, int size)
+      { f(sec.first, name, t, size); });
+  }
+}
+
 template <class T>
 T const&
 cosmosis::DataBlock::view(std::string section, std::string name)
@@ -298,7 +544,9 @@ cosmosis::DataBlock::view(std::string section, std::string name)
   auto isec = sections_.find(section);
   if (isec == sections_.end()) {log_access(BLOCK_LOG_READ_FAIL, section, name, typeid(void*)); throw BadDataBlockAccess(); }
   log_access(BLOCK_LOG_READ, section, name, typeid(void*)); 
-  return isec->second.view<T>(name);
+  T const& val = isec->second.view<T>(name);
+  bytes_read_ += value_nbytes(val);
+  return val;
 }
 
 
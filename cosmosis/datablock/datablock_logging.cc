@@ -13,5 +13,6 @@ const char * BLOCK_LOG_CLEAR = "CLEAR";
 const char * BLOCK_LOG_DELETE = "DELETE";
 const char * BLOCK_LOG_START_MODULE = "MODULE-START";
 const char * BLOCK_LOG_COPY = "COPY";
+const char * BLOCK_LOG_MERGE = "MERGE";
 
 }
\ No newline at end of file
@@ -1,3 +1,6 @@
+#ifndef COSMOSIS_DATABLOCK_LOGGING_H
+#define COSMOSIS_DATABLOCK_LOGGING_H
+
 #ifdef __cplusplus
 extern "C" {
 #endif
@@ -12,6 +15,17 @@ extern const char* BLOCK_LOG_CLEAR;
 extern const char* BLOCK_LOG_DELETE;
 extern const char* BLOCK_LOG_START_MODULE;
 extern const char* BLOCK_LOG_COPY;
+extern const char* BLOCK_LOG_MERGE;
+
+/* How much of the access log a datablock keeps.
+   BLOCK_LOG_LEVEL_FIRST_USE records only the first time each kind of
+   access is made to each value, together with all the other events
+   such as the start of each module. */
+typedef enum {
+  BLOCK_LOG_LEVEL_OFF = 0,
+  BLOCK_LOG_LEVEL_FIRST_USE = 1,
+  BLOCK_LOG_LEVEL_FULL = 2
+} datablock_log_level;
 
 #ifdef __cplusplus
 }
@@ -25,9 +39,17 @@ extern const char* BLOCK_LOG_COPY;
 #include <typeinfo>
 namespace cosmosis
 {
-  typedef std::tuple<std::string, std::string, std::string, std::type_index> log_entry;
+  // One entry in the access log. The log type, section, name and
+  // type name strings are each stored once in the DataBlock, and the
+  // entry refers to them by their index.
+  struct log_entry
+  {
+    int log_type;
+    int section;
+    int name;
+    int type;
+  };
 }
 #endif
 
-
-
+#endif
@@ -72,6 +72,10 @@ namespace cosmosis {
     // of all the extents.
     std::size_t size() const;
 
+    // data() returns a pointer to the elements, stored contiguously in
+    // row-major order.
+    T const* data() const;
+
     // general n-D element access - LHS
     // Use of this function on an ndarray "x" looks like:
     //
@@ -178,6 +182,13 @@ cosmosis::ndarray<T>::size() const
   return data_.size();
 }
 
+template <typename T>
+T const*
+cosmosis::ndarray<T>::data() const
+{
+  return data_.data();
+}
+
 template <typename T>
 template <typename... Args>
 T&
@@ -1,4 +1,5 @@
 #include "section.hh"
+#include "clamp.hh"
 
 using std::string;
 
@@ -19,7 +20,7 @@ cosmosis::Section::get_size(string const& name) const
 {
   auto ival = vals_.find(name);
   if (ival == vals_.end()) return -1;
-  return ival->second.size();
+  return ival->second->size();
 }
 
 std::string const& cosmosis::Section::value_name(std::size_t i) const
@@ -38,19 +39,55 @@ cosmosis::Section::get_type(std::string const&name, datablock_type_t &t) const
   t = DBT_UNKNOWN;
   // Find the right entry
   if (ival == vals_.end()) return DBS_NAME_NOT_FOUND;
+  return entry_type(*ival->second, t);
+}
+
+void
+cosmosis::Section::merge(Section const& other, bool replace,
+                         std::set<std::string> const& exclude)
+{
+  for (auto const& v : other.vals_) {
+    if (exclude.count(v.first)) continue;
+    if (replace) vals_[v.first] = v.second;
+    else vals_.insert(v);
+  }
+}
+
+std::shared_ptr<cosmosis::Entry>*
+cosmosis::Section::find_entry(std::string const& name)
+{
+  auto ival = vals_.find(name);
+  if (ival == vals_.end()) return nullptr;
+  return &ival->second;
+}
 
-  if      (ival->second.is<int>())          t = DBT_INT;
-  else if (ival->second.is<bool>())         t = DBT_BOOL;
-  else if (ival->second.is<double>())       t = DBT_DOUBLE;
-  else if (ival->second.is<complex_t>())    t = DBT_COMPLEX;
-  else if (ival->second.is<string>())       t = DBT_STRING;
-  else if (ival->second.is<vint_t>())       t = DBT_INT1D;
-  else if (ival->second.is<vdouble_t>())    t = DBT_DOUBLE1D;
-  else if (ival->second.is<vcomplex_t>())   t = DBT_COMPLEX1D;
-  else if (ival->second.is<vstring_t>())    t = DBT_STRING1D;
-  else if (ival->second.is<nd_int_t>())     t = DBT_INTND;
-  else if (ival->second.is<nd_double_t>())  t = DBT_DOUBLEND;
-  else if (ival->second.is<nd_complex_t>()) t = DBT_COMPLEXND;
+DATABLOCK_STATUS
+cosmosis::Section::entry_type(Entry const& e, datablock_type_t &t)
+{
+  t = DBT_UNKNOWN;
+  if      (e.is<int>())          t = DBT_INT;
+  else if (e.is<bool>())         t = DBT_BOOL;
+  else if (e.is<double>())       t = DBT_DOUBLE;
+  else if (e.is<complex_t>())    t = DBT_COMPLEX;
+  else if (e.is<string>())       t = DBT_STRING;
+  else if (e.is<vint_t>())       t = DBT_INT1D;
+  else if (e.is<vdouble_t>())    t = DBT_DOUBLE1D;
+  else if (e.is<vcomplex_t>())   t = DBT_COMPLEX1D;
+  else if (e.is<vstring_t>())    t = DBT_STRING1D;
+  else if (e.is<nd_int_t>())     t = DBT_INTND;
+  else if (e.is<nd_double_t>())  t = DBT_DOUBLEND;
+  else if (e.is<nd_complex_t>()) t = DBT_COMPLEXND;
   else return DBS_LOGIC_ERROR;
   return DBS_SUCCESS;
 }
+
+int
+cosmosis::Section::entry_size(Entry const& e, datablock_type_t t)
+{
+  switch (t) {
+    case DBT_INTND:     return cosmosis::clamp(e.view<nd_int_t>().size());
+    case DBT_DOUBLEND:  return cosmosis::clamp(e.view<nd_double_t>().size());
+    case DBT_COMPLEXND: return cosmosis::clamp(e.view<nd_complex_t>().size());
+    default:            return e.size();
+  }
+}
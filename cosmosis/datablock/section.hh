@@ -3,6 +3,8 @@
 
 #include <initializer_list>
 #include <map>
+#include <memory>
+#include <set>
 #include <string>
 
 #include "exceptions.hh"
@@ -16,6 +18,11 @@ namespace cosmosis
   // provides 'get', 'put', and 'replace' ability for each type of
   // quantity.
   //
+  // The entries are held through shared pointers, so that copying a
+  // Section (and so cloning a DataBlock) shares the stored values
+  // rather than duplicating them. An entry that is shared is never
+  // modified; replacing it gives this Section a new entry of its own.
+  //
   // Original author: Marc Paterno (paterno@fnal.gov)
 
   class Section
@@ -83,11 +90,49 @@ namespace cosmosis
     template <class T>
     T const& view(std::string const& name) const;
 
+    // Call f(name, type, size) for each value in the section, in the
+    // same order as value_name. The size is the number of elements for
+    // arrays of any dimension, and -1 for scalars.
+    template <class F>
+    void for_each_value(F f) const;
+
+    // Add the values from other to this section, sharing their
+    // storage, except for those with names in exclude. Values that
+    // already exist here are overwritten if replace is true and kept
+    // otherwise.
+    void merge(Section const& other, bool replace,
+               std::set<std::string> const& exclude);
+
+    // Return the stored pointer to the entry with the given name, or
+    // nullptr if there is none. Values are never removed from a
+    // Section, so this stays valid for as long as the Section does.
+    std::shared_ptr<Entry>* find_entry(std::string const& name);
+
+    // Set the value held by the stored entry e, which must already
+    // hold a T, giving e a new Entry if the old one is shared.
+    template <class T>
+    static void replace_entry(std::shared_ptr<Entry>& e, T const& v);
+
+    static DATABLOCK_STATUS entry_type(Entry const& e, datablock_type_t& t);
+
   private:
-    std::map<std::string, Entry> vals_;
+    static int entry_size(Entry const& e, datablock_type_t t);
+
+    std::map<std::string, std::shared_ptr<Entry>> vals_;
   };
 }
 
+template <class F>
+void
+cosmosis::Section::for_each_value(F f) const
+{
+  for (auto const& v : vals_) {
+    datablock_type_t t;
+    entry_type(*v.second, t);
+    f(v.first, t, entry_size(*v.second, t));
+  }
+}
+
 template <class T>
 DATABLOCK_STATUS
 cosmosis::Section::put_val(std::string const& name, T const& v)
@@ -95,7 +140,7 @@ cosmosis::Section::put_val(std::string const& name, T const& v)
   auto i = vals_.find(name);
   if (i == vals_.end() )
     {
-      vals_.emplace(name, Entry(v));
+      vals_.emplace(name, std::make_shared<Entry>(v));
       return DBS_SUCCESS;
     }
   return DBS_NAME_ALREADY_EXISTS;
@@ -107,17 +152,26 @@ cosmosis::Section::replace_val(std::string const& name, T const& v)
 {
   auto i = vals_.find(name);
   if (i == vals_.end()) return DBS_NAME_NOT_FOUND;
-  if (not i->second.is<T>()) return DBS_WRONG_VALUE_TYPE;
-  i->second.set_val(v);
+  if (not i->second->is<T>()) return DBS_WRONG_VALUE_TYPE;
+  replace_entry(i->second, v);
   return DBS_SUCCESS;
 }
 
+template <class T>
+void
+cosmosis::Section::replace_entry(std::shared_ptr<Entry>& e, T const& v)
+{
+  // Another section may be sharing this entry
+  if (e.use_count() == 1) e->set_val(v);
+  else e = std::make_shared<Entry>(v);
+}
+
 template <class T>
 bool
 cosmosis::Section::has_value(std::string const& name) const
 {
   auto i = vals_.find(name);
-  return (i != vals_.end()) && i->second.is<T>();
+  return (i != vals_.end()) && i->second->is<T>();
 }
 
 template <class T>
@@ -126,8 +180,8 @@ cosmosis::Section::get_val(std::string const& name, T& v) const
 {
   auto i = vals_.find(name);
   if (i == vals_.end()) return DBS_NAME_NOT_FOUND;
-  if (not i->second.is<T>()) return DBS_WRONG_VALUE_TYPE;
-  v = i->second.val<T>();
+  if (not i->second->is<T>()) return DBS_WRONG_VALUE_TYPE;
+  v = i->second->val<T>();
   return DBS_SUCCESS;
 }
 
@@ -141,8 +195,8 @@ cosmosis::Section::get_val(std::string const& name, T const& def, T& v) const
       v = def;
       return DBS_USED_DEFAULT;
     }
-  if (not i->second.is<T>()) return DBS_WRONG_VALUE_TYPE;
-  v = i->second.val<T>();
+  if (not i->second->is<T>()) return DBS_WRONG_VALUE_TYPE;
+  v = i->second->val<T>();
   return DBS_SUCCESS;
 }
 
@@ -154,7 +208,7 @@ cosmosis::Section::get_array_shape(std::string const& name,
   auto i = vals_.find(name);
   if (i == vals_.end()) return DBS_NAME_NOT_FOUND;
   typedef ndarray<T> array_t;
-  if (not i->second.is<array_t>()) return DBS_WRONG_VALUE_TYPE;
+  if (not i->second->is<array_t>()) return DBS_WRONG_VALUE_TYPE;
   auto const& r = view<array_t>(name);
   extents = r.extents();
   return DBS_SUCCESS;
@@ -166,7 +220,7 @@ cosmosis::Section::view(std::string const& name) const
 {
   auto i = vals_.find(name);
   if (i == vals_.end()) throw BadSectionAccess();
-  return i->second.view<T>();
+  return i->second->view<T>();
 }
 
 #endif
@@ -1,20 +1,58 @@
 import scipy.interpolate
 import scipy.integrate
+import scipy.sparse
 import numpy as np
-from .datablock import names, SectionOptions
+import itertools
+import weakref
+from .datablock import names, SectionOptions, DataBlock
 from .runtime import FunctionModule
+from .runtime.shared_arrays import shared_array
+from .covariance import Covariance, DenseCovariance, InverseCovariance, DiagonalCovariance
 import traceback 
 
-try:
-    from packaging.version import parse as parse_version
-    min_hermitian_version = parse_version('1.17.0')
-    use_hermitian_keyword = parse_version(np.version.version) > min_hermitian_version
-except ImportError: # fall back to not using hermitian
-    use_hermitian_keyword = False
-
 
 MISSING = "if_you_see_this_there_was_a_mistake_creating_a_gaussian_likelihood"
 
+# The likelihoods in this process that can make simulations on request.
+# Each has its own number, which it saves to the blocks it runs on, so
+# that likelihoods with the same like_name do not get mixed up.
+_simulators = weakref.WeakValueDictionary()
+_simulator_ids = itertools.count()
+
+
+def _interpolation_basis(theory_x, kind, chunk_size=256):
+    # Generate (start, end, f) where f interpolates the unit vectors for
+    # the points start to end of theory_x, done a chunk at a time to limit
+    # the memory used.  Interpolation is linear in the values, so this is
+    # enough to build a matrix that does the same interpolation.
+    n = theory_x.size
+    for start in range(0, n, chunk_size):
+        end = min(start + chunk_size, n)
+        unit = np.zeros((n, end - start))
+        unit[np.arange(start, end), np.arange(end - start)] = 1.0
+        yield start, end, scipy.interpolate.interp1d(theory_x, unit, kind=kind, axis=0)
+
+
+def simulate_from_block(block, like_name):
+    """
+    Return the simulated data vector NAME_simulation for the named
+    likelihood from a block that the pipeline has been run on.
+
+    Gaussian likelihoods do not save a simulation on each evaluation
+    unless save_simulation=T, since it is expensive for long data vectors
+    and rarely used; instead it is made here, from the saved theory, when
+    it is first asked for, and then saved to the block.
+    """
+    section = names.data_vector
+    likelihood = None
+    if block.has_value(section, like_name + "_simulator"):
+        likelihood = _simulators.get(block[section, like_name + "_simulator"])
+    if likelihood is None or block.has_value(section, like_name + "_simulation"):
+        return block[section, like_name + "_simulation"]
+    sim = likelihood.simulate_data_vector(block[section, like_name + "_theory"])
+    block[section, like_name + "_simulation"] = sim
+    return sim
+
 
 class GaussianLikelihood:
     """
@@ -22,6 +60,11 @@ class GaussianLikelihood:
     
     Subclasses must override build_data and build_covariance,
     e.g. to load from file.
+
+    The covariance can be a numpy array or one of the structured types in
+    cosmosis.covariance (diagonal, block diagonal, banded or low-rank plus
+    diagonal).  It is factorized once, and the factorization is used for
+    the chi^2, the log-determinant and simulations.
     """
     x_section = MISSING
     x_name    = MISSING
@@ -33,18 +76,70 @@ class GaussianLikelihood:
     #each cosmology instead of once at the start
     constant_covariance = True
 
+    #Interpolation into the theory is done with a precomputed
+    #matrix once the theory x values stop changing.  Weights
+    #smaller than this are dropped from the matrix.
+    use_interpolation_operator = True
+    interpolation_operator_tolerance = 1e-14
+    _operator_x = None
+    _operator = None
+
+    #The factorized covariance (a cosmosis.covariance.Covariance)
+    covariance = None
+    cov = None
+    chol = None
+    _inv_cov = None
+    _structured_covariance = None
+
+    #The values saved to every block that do not change,
+    #stored once and shared between the blocks
+    constant_block = None
+    save_simulation = False
+
     def __init__(self, options):
         self.options=options
         self.data_x, self.data_y = self.build_data()
         self.likelihood_only = options.get_bool('likelihood_only', False)
 
-        if self.constant_covariance:
-            self.cov = self.build_covariance()
-            self.inv_cov = self.build_inverse_covariance()
-
-            if not self.likelihood_only:
-                self.chol = np.linalg.cholesky(self.cov)
+        # With shared_memory=T the constant arrays are stored once on
+        # each node and shared by all the processes there.
+        self.shared_memory = options.get_bool('shared_memory', False)
+        if self.shared_memory:
+            if isinstance(self.data_x, np.ndarray):
+                self.data_x = self.share("data_x", self.data_x)
+            if isinstance(self.data_y, np.ndarray):
+                self.data_y = self.share("data_y", self.data_y)
 
+        if self.constant_covariance:
+            # With shared memory only one process on each node builds
+            # the covariance, unless it is a structured one
+            cov = self.share("covariance", self._build_covariance_array)
+            if cov.size == 0:
+                cov = self._structured_covariance
+                if cov is None:
+                    cov = self.build_covariance()
+            if isinstance(cov, Covariance):
+                # Structured covariances are never made into dense matrices
+                self.covariance = cov
+            else:
+                self.cov = cov
+                # The Cholesky decomposition is only computed by the
+                # process that shares it
+                try:
+                    self.chol = self.share("cholesky", lambda: np.linalg.cholesky(self.cov))
+                except np.linalg.LinAlgError:
+                    # Not positive definite, so we fall back to the pseudo-inverse
+                    self.chol = None
+                self.covariance = DenseCovariance(self.cov, self.chol)
+
+            # Subclasses can supply their own estimate of the inverse,
+            # which is then used for the chi^2.  Otherwise we only need
+            # the inverse to save it to the block.
+            if type(self).build_inverse_covariance is not GaussianLikelihood.build_inverse_covariance:
+                self.inv_cov = self.share("inverse_covariance", self.build_inverse_covariance)
+                self.covariance = InverseCovariance(self.inv_cov, self.cov, self.chol)
+            elif not self.likelihood_only:
+                self.inv_cov = self.share("inverse_covariance", self.build_inverse_covariance)
 
             # We may want to include the normalization of the likelihood
             # via the log |C| term.
@@ -58,6 +153,7 @@ class GaussianLikelihood:
 
         #Interpolation type, when interpolating into theory vectors
         self.kind = self.options.get_string("kind", "cubic")
+        self.use_interpolation_operator = self.options.get_bool("interpolation_operator", True)
 
         #Allow over-riding where the inputs come from in 
         #the options section
@@ -72,6 +168,14 @@ class GaussianLikelihood:
         if options.has_value("like_name"):
             self.like_name = options['like_name']
 
+        #Simulations are made only when asked for with simulate_from_block,
+        #unless save_simulation=T, for modules that read NAME_simulation
+        #directly
+        self.save_simulation = options.get_bool("save_simulation", self.save_simulation)
+        if not self.save_simulation:
+            self.simulator_id = next(_simulator_ids)
+            _simulators[self.simulator_id] = self
+
 
 
     def build_data(self):
@@ -108,13 +212,43 @@ class GaussianLikelihood:
 
         When the covariance is generated from a suite of simulations,
         for example, the simple inverse is not the best estimate.
+        If you override it the chi^2 is computed with your inverse.
 
         """
-        # inverse of symmetric matrix should remain symmetric
-        if np.allclose(self.cov, self.cov.T) and use_hermitian_keyword:
-            return np.linalg.pinv(self.cov, hermitian=True)
-        return np.linalg.inv(self.cov)
-
+        return self.covariance.inverse()
+
+    @property
+    def inv_cov(self):
+        "The inverse covariance as a dense matrix, computed when first needed"
+        if self._inv_cov is None and self.covariance is not None:
+            self._inv_cov = self.covariance.inverse()
+        return self._inv_cov
+
+    @inv_cov.setter
+    def inv_cov(self, value):
+        self._inv_cov = value
+
+
+    def _build_covariance_array(self):
+        # Covariance objects cannot be put in shared memory, so they are
+        # kept here and other processes are sent an empty array instead,
+        # telling them to build their own
+        cov = self.build_covariance()
+        if isinstance(cov, Covariance):
+            self._structured_covariance = cov
+            return np.empty(0)
+        return cov
+
+    def share(self, name, value):
+        """
+        Return an array to store in this object, shared between processes
+        if the shared_memory option is set.  The value can be the array
+        or a function that generates it.  See cosmosis.runtime.shared_arrays.
+        """
+        if not self.shared_memory:
+            return value() if callable(value) else value
+        like_name = self.options.get_string("like_name", self.like_name)
+        return shared_array("{}/{}/{}".format(type(self).__name__, like_name, name), value)
 
     def cleanup(self):
         """
@@ -129,7 +263,8 @@ class GaussianLikelihood:
         Override this and set constant_covariance=False
         to enable a cosmology-dependent covariance.
 
-        Load the covariance from the block here.
+        Load the covariance from the block here.  It can be an array
+        or a cosmosis.covariance.Covariance object.
         """
         raise RuntimeError("You need to implement the method "
             "'extract_covariance' if you set constant_covariance=False "
@@ -142,9 +277,10 @@ class GaussianLikelihood:
         covariance matrix.
 
         By default the inverse is just directly calculated from
-        the covariance, but you might have a different method.
+        the covariance, but you might have a different method,
+        which is then used for the chi^2.
         """
-        return np.linalg.inv(self.cov)
+        return self.covariance.inverse()
 
     def extract_covariance_log_determinant(self, block):
         """
@@ -152,17 +288,29 @@ class GaussianLikelihood:
         for the dependence of the covariance matrix on parameters
         in the likelihood.
 
-        Override this method if you have a faster way to get |C|
-        rather than just taking the determinant of directly (e.g.
-        if you know it is diagonal or block-diagonal).
+        By default this uses the factorization of the covariance,
+        which is already cheap for the structured covariance types,
+        but you can override it if you have a faster way.
+        """
+        return self.covariance.log_determinant()
 
-        Since we know that we must have the inverse covariance,
-        whereas the covariance itself is optional, we use the former
-        in the default implementation.
+    def update_covariance(self, block):
         """
-        sign, log_inv_det = np.linalg.slogdet(self.inv_cov)
-        log_det = -log_inv_det
-        return log_det
+        Get the covariance for the current parameters from the block
+        and factorize it, once, for the chi^2, |C| and simulations.
+        """
+        cov = self.extract_covariance(block)
+        self.inv_cov = None
+        if isinstance(cov, Covariance):
+            self.cov = None
+            self.covariance = cov
+            return
+        self.cov = np.atleast_2d(cov)
+        if type(self).extract_inverse_covariance is not GaussianLikelihood.extract_inverse_covariance:
+            self.inv_cov = np.atleast_2d(self.extract_inverse_covariance(block))
+            self.covariance = InverseCovariance(self.inv_cov, self.cov)
+        else:
+            self.covariance = DenseCovariance(self.cov)
 
 
     def do_likelihood(self, block):
@@ -173,13 +321,38 @@ class GaussianLikelihood:
         #If covariance is a function of parameters, compute the 
         #new one now.
         if not self.constant_covariance:
-            self.cov = np.atleast_2d(self.extract_covariance(block))
-            self.inv_cov = np.atleast_2d(self.extract_inverse_covariance(block))
+            self.update_covariance(block)
+        elif self.covariance is None:
+            #For subclasses that set up cov and inv_cov themselves
+            self.covariance = InverseCovariance(self.inv_cov, self.cov)
 
         #gaussian likelihood
         d = x-mu
-        chi2 = np.einsum('i,ij,j', d, self.inv_cov, d)
-        chi2 = float(chi2)
+        chi2 = self.covariance.chi2(d)
+        self.save_likelihood(block, x, mu, float(chi2))
+
+    def do_likelihood_batch(self, blocks):
+        """
+        Compute the likelihood for a list of blocks at once.  With a
+        constant covariance the chi^2 values are computed together;
+        otherwise, or if a subclass overrides do_likelihood, this just
+        calls do_likelihood on each block.
+        """
+        if ((not self.constant_covariance) or self.covariance is None
+                or type(self).do_likelihood is not GaussianLikelihood.do_likelihood):
+            for block in blocks:
+                self.do_likelihood(block)
+            return
+
+        x = np.array([np.atleast_1d(self.extract_theory_points(block)) for block in blocks])
+        mu = np.atleast_1d(self.data_y)
+        d = x - mu
+        chi2 = self.covariance.chi2(d)
+        for block, x_i, chi2_i in zip(blocks, x, chi2):
+            self.save_likelihood(block, x_i, mu, float(chi2_i))
+
+    def save_likelihood(self, block, x, mu, chi2):
+        "Save the likelihood and associated values to the block, given the theory x and its chi^2"
         like = -0.5*chi2
 
         #It can be useful to save the chi^2 as well as the likelihood,
@@ -213,31 +386,42 @@ class GaussianLikelihood:
 
         #And also the predicted data points - the vector of observables 
         # that in a fisher approch we want the derivatives of.
-        #and inverse cov mat which also goes into the fisher matrix.
         block[names.data_vector, self.like_name + "_theory"] = x
+
+        #The data and inverse cov mat, which also goes into the fisher matrix.
+        #If they are constant they are put in a block once, and the stored
+        #values are shared with each new block instead of being copied.
+        if self.constant_covariance:
+            if self.constant_block is None:
+                self.constant_block = DataBlock()
+                self.save_constant_values(self.constant_block, mu)
+            block.merge(self.constant_block)
+        else:
+            self.save_constant_values(block, mu)
+
+        #If asked to, also save a simulation of the data - the mean with
+        #added noise.  This uses the same factorization of the covariance
+        #as the chi^2.  Otherwise simulate_from_block makes it when it is
+        #needed, for example by the ABC sampler.
+        if self.save_simulation:
+            sim = self.simulate_data_vector(x)
+            block[names.data_vector, self.like_name + "_simulation"] = sim
+        else:
+            block[names.data_vector, self.like_name + "_simulator"] = self.simulator_id
+
+    def save_constant_values(self, block, mu):
+        "Save the data and (inverse) covariance to the block"
         block[names.data_vector, self.like_name + "_data"] = mu
         block[names.data_vector, self.like_name + "_inverse_covariance"] = self.inv_cov
 
-        #We might just be calculating the inverse cov and ignoring the covmat.
-        #in that case we do not try to save it
+        #We might just be calculating the inverse cov, or using a structured
+        #covariance, and not have the dense covmat.  In that case we do not try to save it
         if self.cov is not None:
             block[names.data_vector, self.like_name + "_covariance"] = self.cov
-            #Also save a simulation of the data - the mean with added noise
-            #these can be used among other places by the ABC sampler.
-            #This also requires the cov mat.
-            # If we have a parameter-dependent covariance we need
-            # to re-calculate the Cholesky decomposition to simulate some data.
-            if not self.constant_covariance:
-                self.chol = np.linalg.cholesky(self.cov)
-            sim = self.simulate_data_vector(x)
-            block[names.data_vector, self.like_name + "_simulation"] = sim
 
     def simulate_data_vector(self, x):
         "Simulate a data vector by adding a realization of the covariance to the mean"
-        #generate a vector of normal deviates
-
-        r = np.random.randn(x.size)
-        return x + np.dot(self.chol, r)
+        return x + self.covariance.simulate()
 
 
     def extract_theory_points(self, block):
@@ -248,9 +432,52 @@ class GaussianLikelihood:
 
     def generate_theory_points(self, theory_x, theory_y):
         "Generate theory predicted data points by interpolation into the theory"
+        theory_x = np.asarray(theory_x)
+        theory_y = np.asarray(theory_y)
+        if self.use_interpolation_operator and theory_y.ndim == 1 and np.ndim(self.data_x) <= 1:
+            W = self.interpolation_operator(theory_x)
+            if W is not None:
+                return np.atleast_1d(W @ theory_y)
         f = scipy.interpolate.interp1d(theory_x, theory_y, kind=self.kind)
         return np.atleast_1d(f(self.data_x))
 
+    def interpolation_operator(self, theory_x):
+        """
+        Return a matrix W such that W @ theory_y is the interpolation of
+        theory_y at the data x values, or None if there is none yet.
+
+        Interpolation is linear in theory_y, so while theory_x stays the
+        same W can be reused.  It is built the second time in a row that
+        theory_x is the same, and thrown away when theory_x changes.
+        """
+        x = self._operator_x
+        if x is not None and x.shape == theory_x.shape and np.array_equal(x, theory_x):
+            if self._operator is None:
+                self._operator = self.build_interpolation_operator(theory_x)
+            return self._operator
+        self._operator_x = theory_x.copy()
+        self._operator = None
+        return None
+
+    def build_interpolation_operator(self, theory_x, chunk_size=256):
+        """
+        Build the matrix that interpolates from values at theory_x to the
+        data x values, using the same interpolation as the spline.  The
+        matrix is sparse unless most of the weights are non-negligible,
+        as they can be for a cubic spline on a short grid.
+        """
+        data_x = np.atleast_1d(self.data_x)
+        n = theory_x.size
+        chunks = []
+        for start, end, f in _interpolation_basis(theory_x, self.kind, chunk_size):
+            w = f(data_x).reshape(data_x.size, end - start)
+            w[np.abs(w) < self.interpolation_operator_tolerance] = 0.0
+            chunks.append(scipy.sparse.csr_matrix(w))
+        W = scipy.sparse.hstack(chunks, format='csr')
+        if W.nnz > 0.25 * data_x.size * n:
+            W = W.toarray()
+        return W
+
     @classmethod
     def build_module(cls):
 
@@ -270,10 +497,27 @@ class GaussianLikelihood:
 
         return setup, execute, cleanup
 
+    @classmethod
+    def build_execute_batch(cls):
+        """
+        Return an execute_batch function for the module made by build_module,
+        which pipelines use to run the likelihood on many blocks at once.
+        A module file can define it alongside the others:
+        setup, execute, cleanup = MyLikelihood.build_module()
+        execute_batch = MyLikelihood.build_execute_batch()
+        """
+        def execute_batch(blocks, config):
+            likelihoodCalculator = config
+            likelihoodCalculator.do_likelihood_batch(blocks)
+            return 0
+
+        return execute_batch
+
     @classmethod
     def as_module(cls, name):
         setup, execute, cleanup = cls.build_module()
-        return FunctionModule(name, setup, execute, cleanup)
+        execute_batch = cls.build_execute_batch()
+        return FunctionModule(name, setup, execute, cleanup, execute_batch)
 
 
 class SingleValueGaussianLikelihood(GaussianLikelihood):
@@ -307,6 +551,7 @@ class SingleValueGaussianLikelihood(GaussianLikelihood):
         self.data_y = np.array([mean])
         self.cov = np.array([[sigma**2]])
         self.inv_cov = np.array([[sigma**-2]])
+        self.covariance = DiagonalCovariance([sigma**2])
 
         include_norm = self.options.get_bool("include_norm", False)
         if include_norm:
@@ -335,9 +580,23 @@ class SingleValueGaussianLikelihood(GaussianLikelihood):
 
 
 class WindowedGaussianLikelihood(GaussianLikelihood):
+    """
+    A Gaussian likelihood where each data point is the integral of the
+    theory times a window function.
+
+    The integrals are linear in the theory, so for each theory x grid we
+    compute a matrix once that does them all.  It uses Gauss-Legendre
+    quadrature with window_quadrature_order points between each of the x
+    values of the window and theory, which is exact for interpolation up
+    to cubic.  Set window_check=T to compare it with direct adaptive
+    integration whenever a new grid is used.
+    """
     def __init__(self, options):
         super(WindowedGaussianLikelihood, self).__init__(options)
         self.windows = self.build_windows()
+        self.quadrature_order = options.get_int("window_quadrature_order", 4)
+        self.window_check = options.get_bool("window_check", False)
+        self.window_tolerance = options.get_double("window_tolerance", 1e-6)
 
     def build_windows(self):
         #This method should return a list of pairs of window_x, window_y:
@@ -347,15 +606,84 @@ class WindowedGaussianLikelihood(GaussianLikelihood):
 
     def generate_theory_points(self, theory_x, theory_y):
         "Generate theory predicted data points using window function"
-        f = scipy.interpolate.interp(theory_x, theory_y, kind=self.kind)
+        theory_x = np.asarray(theory_x)
+        theory_y = np.asarray(theory_y)
+        x = self._operator_x
+        if x is None or x.shape != theory_x.shape or not np.array_equal(x, theory_x):
+            self._operator_x = theory_x.copy()
+            self._operator = self.build_window_matrix(theory_x)
+            if self.window_check:
+                self.check_window_matrix(theory_x, theory_y)
+        return np.atleast_1d(self._operator @ theory_y)
+
+    def _window_range(self, window_x, theory_x):
+        # The range to integrate over, and the points within it where
+        # the interpolated window or theory can change form
+        xmin = max(window_x.min(), theory_x.min())
+        xmax = min(window_x.max(), theory_x.max())
+        edges = np.unique(np.concatenate([[xmin, xmax], window_x, theory_x]))
+        return xmin, xmax, edges[(edges >= xmin) & (edges <= xmax)]
+
+    def build_window_matrix(self, theory_x, chunk_size=256):
+        """
+        Build the matrix Q for which Q @ theory_y gives the integrals of
+        the interpolated theory against each of the windows.
+        """
+        nodes, weights = np.polynomial.legendre.leggauss(self.quadrature_order)
+        # The quadrature points in each window and the weight for each,
+        # including the window function itself
+        quadrature = []
+        for window_x, window_y in self.windows:
+            window_x = np.asarray(window_x)
+            xmin, xmax, edges = self._window_range(window_x, theory_x)
+            if xmax <= xmin:
+                quadrature.append(None)
+                continue
+            half_width = 0.5 * np.diff(edges)[:, np.newaxis]
+            centre = 0.5 * (edges[1:] + edges[:-1])[:, np.newaxis]
+            x = (centre + half_width * nodes).ravel()
+            w = scipy.interpolate.interp1d(window_x, window_y, kind=self.kind)(x)
+            quadrature.append((x, (half_width * weights).ravel() * w))
+
+        Q = np.zeros((len(self.windows), theory_x.size))
+        for start, end, f in _interpolation_basis(theory_x, self.kind, chunk_size):
+            for i, q in enumerate(quadrature):
+                if q is not None:
+                    x, w = q
+                    Q[i, start:end] = w @ f(x)
+
+        # Windows are usually narrow, so most of the matrix can be zero
+        if np.count_nonzero(Q) < 0.25 * Q.size:
+            Q = scipy.sparse.csr_matrix(Q)
+        return Q
+
+    def integrate_windows(self, theory_x, theory_y):
+        "Integrate the theory against each window directly, with adaptive quadrature"
+        theory_x = np.asarray(theory_x)
+        f = scipy.interpolate.interp1d(theory_x, theory_y, kind=self.kind)
         values = []
         for window_x, window_y in self.windows:
-            xmin = max(window_x.min(), theory_x.min())
-            xmax = min(window_x.max(), theory_x.max())
-            w = scipy.interpolate.interp(window_x, window_y, kind=self.kind)
-            g = lambda x: w(x)*f(x)
-            v = scipy.integrate.romberg(g, xmin, xmax)
+            window_x = np.asarray(window_x)
+            xmin, xmax, edges = self._window_range(window_x, theory_x)
+            if xmax <= xmin:
+                values.append(0.0)
+                continue
+            w = scipy.interpolate.interp1d(window_x, window_y, kind=self.kind)
+            points = edges[1:-1]
+            v, _ = scipy.integrate.quad(lambda x: w(x)*f(x), xmin, xmax,
+                points=points, limit=max(50, 2 * len(points)))
             values.append(v)
         return np.atleast_1d(values)
+
+    def check_window_matrix(self, theory_x, theory_y):
+        "Check the window matrix against direct integration, raising ValueError if they disagree"
+        fast = np.atleast_1d(self._operator @ theory_y)
+        slow = self.integrate_windows(theory_x, theory_y)
+        scale = np.abs(slow).max()
+        error = np.abs(fast - slow).max() / scale if scale > 0 else np.abs(fast).max()
+        if error > self.window_tolerance:
+            raise ValueError("The window function integrals in {} are only accurate to {:.2g}; "
+                "try increasing window_quadrature_order".format(self.like_name, error))
+        print("Window function integrals in {} agree with direct integration to {:.2g}".format(self.like_name, error))
         
 
@@ -72,13 +72,16 @@ def sampler_main_loop(sampler, output, pool, is_root):
     # a sampler can "converge" just by reaching the 
     # limit of the number of samples it is allowed.
     if is_root:
-        while not sampler.is_converged():
-            sampler.execute()
-            #Flush any output. This is to stop
-            #a problem in some MPI cases where loads
-            #of output is built up before being written.
-            if output:
-                output.flush()
+        try:
+            while not sampler.is_converged():
+                sampler.execute()
+                #Flush any output. This is to stop
+                #a problem in some MPI cases where loads
+                #of output is built up before being written.
+                if output:
+                    output.flush()
+        finally:
+            sampler.cleanup()
         # If we are in parallel tell the other processors to end the 
         # loop and prepare for the next sampler
         if pool and sampler.is_parallel_sampler:
@@ -297,6 +300,9 @@ def run_cosmosis(args, pool=None, ini=None, pipeline=None, values=None):
         if output:
             output.close()
 
+    # Combine the module timing statistics from all the processes
+    pipeline.write_module_stats(pool)
+
     if cleanup_pipeline:
         pipeline.cleanup()
 
@@ -354,6 +360,9 @@ def main():
         parser = argparse.ArgumentParser(description="Run a pipeline with a single set of parameters", add_help=True)
         parser.add_argument("inifile", help="Input ini file of parameters")
         parser.add_argument("--mpi",action='store_true',help="Run in MPI mode.")
+        parser.add_argument("--mpi-schedule",default="strided",choices=mpi_pool.MPIPool.schedules,help="How to distribute tasks among MPI processes: fixed strides over the ranks (reproducible), or dynamically in chunks as processes become free.")
+        parser.add_argument("--mpi-chunk-size",type=int,default=1,help="Number of tasks to send at once to each process with --mpi-schedule=dynamic.")
+        parser.add_argument("--mpi-debug",action='store_true',help="Print diagnostics from the MPI pool, including how long each process was busy and idle.")
         parser.add_argument("--smp",type=int,default=0,help="Run with the given number of processes in shared memory multiprocessing (this is experimental and does not work for multinest).")
         parser.add_argument("--pdb",action='store_true',help="Start the python debugger on an uncaught error. Only in serial mode.")
         parser.add_argument("--segfaults", "--experimental-fault-handling", action='store_true',help="Activate a mode that gives more info on segfault")
@@ -377,7 +386,7 @@ def main():
 
         # initialize parallel workers
         if args.mpi:
-            with mpi_pool.MPIPool() as pool:
+            with mpi_pool.MPIPool(debug=args.mpi_debug, schedule=args.mpi_schedule, chunksize=args.mpi_chunk_size) as pool:
                 return run_cosmosis(args,pool)
         elif args.smp:
             with process_pool.Pool(args.smp) as pool:
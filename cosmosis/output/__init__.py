@@ -3,6 +3,7 @@ from .cosmomc_output import CosmoMCOutput
 from .null_output import NullOutput
 from .fits_output import FitsOutput
 from .in_memory_output import InMemoryOutput
+from .binary_output import BinaryOutput
 from .output_base import output_registry
 import logging
 
@@ -54,7 +55,11 @@ I know about these format names:
 
 	verb = options.get("verbosity", "standard")
 	set_verbosity(verb)
-	return output_class.from_options(options,resume)
+	output = output_class.from_options(options,resume)
+	# Samplers flush the output after every iteration;
+	# this lets users do so less often for fast pipelines
+	output.flush_interval = float(options.get("flush_interval", 0.0))
+	return output
 
 def input_from_options(options):
     format = options['format']
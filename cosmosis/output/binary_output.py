@@ -0,0 +1,272 @@
+from .output_base import OutputBase
+from . import utils
+from ..runtime.utils import mkdir
+import numpy as np
+import json
+import os
+import struct
+from glob import glob
+
+comment_indicator = "_cosmosis_comment_indicator_"
+
+NPY_MAGIC = b"\x93NUMPY\x01\x00"
+# The header has a fixed size so that we can rewrite the number of
+# rows in place as the chain grows, without moving the data.
+NPY_HEADER_SIZE = 128
+
+
+def _npy_header(nrow, ncol):
+    header = "{{'descr': '<f8', 'fortran_order': False, 'shape': ({}, {}), }}".format(nrow, ncol)
+    padding = NPY_HEADER_SIZE - len(NPY_MAGIC) - 2 - len(header) - 1
+    header = header + " " * padding + "\n"
+    return NPY_MAGIC + struct.pack("<H", len(header)) + header.encode('latin1')
+
+
+class BinaryOutput(OutputBase):
+    """
+    Chains saved as binary columns in a .npy file, with the column
+    names and metadata in a JSON file alongside it.
+
+    Rows are buffered and appended to the end of the data file
+    whenever the output is flushed.  The number of rows in the npy
+    header is only updated after they have been written, so if a run
+    is killed part-way through a write the file still describes only
+    the complete rows, and resuming discards the rest.
+
+    The files can be loaded with numpy.load, and are memory-mapped when
+    read back in by load_from_options, so large chains are not read
+    into memory all at once.
+    """
+    FILE_EXTENSION = ".npy"
+    METADATA_EXTENSION = ".json"
+    _aliases = ["binary", "npy"]
+
+    def __init__(self, filename, rank=0, nchain=1, lock=True, resume=False, buffer_rows=1000):
+        super(BinaryOutput, self).__init__()
+
+        if filename.endswith(self.FILE_EXTENSION):
+            filename = filename[:-len(self.FILE_EXTENSION)]
+
+        if nchain > 1:
+            filename = filename + "_{}".format(rank+1)
+
+        self.filename_base = filename
+        self._filename = filename + self.FILE_EXTENSION
+        self._metadata_filename = filename + self.METADATA_EXTENSION
+        self.buffer_rows = buffer_rows
+
+        dirname, _ = os.path.split(self._filename)
+        mkdir(dirname)
+
+        # These lists contain (key, value, comment) triples, with
+        # a key starting with comment_indicator for comments.
+        self._metadata = []
+        self._final_metadata = []
+        self._rows = []
+        self._nbuffered = 0
+        self._nrow = 0
+        self._ncol = None
+
+        if resume and utils.file_exists_and_is_not_empty(self._filename):
+            print("Note: You set resume=T so I will resume from file {}".format(self._filename))
+            self._file = open(self._filename, "r+b")
+            self._nrow, self._ncol = self._read_shape(self._file)
+            # Throw away anything written after the last complete commit
+            self._file.truncate(NPY_HEADER_SIZE + 8 * self._nrow * self._ncol)
+            self._file.seek(0, 2)
+            with open(self._metadata_filename) as f:
+                info = json.load(f)
+            self._resumed_metadata = [tuple(m) for m in info["metadata"]]
+            self._final_metadata = [tuple(m) for m in info["final_metadata"]]
+            self.resumed = True
+        else:
+            if resume:
+                print("Note: You set resume=T but the file {} does not exist or is empty so I will start a new one".format(self._filename))
+            self._file = open(self._filename, "w+b")
+            self.resumed = False
+
+        if lock:
+            try:
+                self.lock_file(self._file)
+            except IOError:
+                raise IOError("Another CosmoSIS process was trying to use the same output file ({}). "
+                    "You can set lock=F in the [output] section to disable this check.".format(self._filename))
+
+        self._start_row = None
+
+    @staticmethod
+    def _read_shape(f):
+        f.seek(0)
+        np.lib.format.read_magic(f)
+        shape, _, _ = np.lib.format.read_array_header_1_0(f)
+        return shape
+
+    def _begun_sampling(self, params):
+        ncol = len(params)
+        if self.resumed and self._ncol != ncol:
+            raise ValueError("Tried to resume from {} which has {} columns, but this run has {}".format(
+                self._filename, self._ncol, ncol))
+        self._ncol = ncol
+        if self.resumed:
+            # As with text output, the metadata from the original
+            # run is kept in place of the new one
+            self._metadata = self._resumed_metadata
+        else:
+            self._file.write(_npy_header(0, ncol))
+        self._write_metadata_file()
+        self._start_row = self._nrow
+
+    def _write_parameters(self, params):
+        self._rows.append(params)
+        self._nbuffered += 1
+        if self._nbuffered >= self.buffer_rows:
+            self._commit()
+
+    def _write_parameters_many(self, rows):
+        self._rows.append(np.asarray(rows, dtype='<f8'))
+        self._nbuffered += len(rows)
+        if self._nbuffered >= self.buffer_rows:
+            self._commit()
+
+    def _commit(self):
+        if not self._rows:
+            return
+        # The buffer can hold a mix of single rows and blocks of rows
+        rows = np.vstack([np.atleast_2d(np.asarray(r, dtype='<f8')) for r in self._rows])
+        self._rows = []
+        self._nbuffered = 0
+        self._file.seek(0, 2)
+        self._file.write(rows.tobytes())
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        # Only now that the data is safely on disk do we
+        # record that the rows are there.
+        self._nrow += len(rows)
+        self._file.seek(0)
+        self._file.write(_npy_header(self._nrow, self._ncol))
+        self._file.flush()
+        self._file.seek(0, 2)
+
+    def _write_metadata_file(self):
+        info = {
+            "columns": [c[0] for c in self.columns],
+            "metadata": self._metadata,
+            "final_metadata": self._final_metadata,
+        }
+        tmp_filename = self._metadata_filename + ".tmp"
+        with open(tmp_filename, "w") as f:
+            json.dump(info, f, indent=1)
+        os.replace(tmp_filename, self._metadata_filename)
+
+    def _write_metadata(self, key, value, comment=''):
+        self._metadata.append((key, str(value), comment))
+        if self.begun_sampling:
+            self._write_metadata_file()
+
+    def _write_comment(self, comment):
+        self._metadata.append((comment_indicator, comment, ""))
+        if self.begun_sampling:
+            self._write_metadata_file()
+
+    def _write_final(self, key, value, comment=''):
+        self._final_metadata.append((key, str(value), comment))
+
+    def _flush(self):
+        if self.begun_sampling:
+            self._commit()
+
+    def _close(self):
+        if self.begun_sampling:
+            self._commit()
+            self._write_metadata_file()
+        self._file.close()
+
+    def reset_to_chain_start(self):
+        if self._start_row is None:
+            return
+        self._rows = []
+        self._nbuffered = 0
+        self._nrow = self._start_row
+        self._file.seek(0)
+        self._file.write(_npy_header(self._nrow, self._ncol))
+        self._file.truncate(NPY_HEADER_SIZE + 8 * self._nrow * self._ncol)
+        self._file.flush()
+        self._file.seek(0, 2)
+
+    def name_for_sampler_resume_info(self):
+        return self.filename_base + '.sampler_status'
+
+    @classmethod
+    def from_options(cls, options, resume=False):
+        filename = options['filename']
+        rank = options.get('rank', 0)
+        nchain = options.get('parallel', 1)
+        lock = utils.boolean_string(options.get('lock', True))
+        buffer_rows = int(options.get('buffer_rows', 1000))
+        return cls(filename, rank, nchain, lock=lock, resume=resume, buffer_rows=buffer_rows)
+
+    @classmethod
+    def load_from_options(cls, options):
+        """
+        Load chains from the file or files.  As with text output, the
+        option usecols can be set to load only some of the columns.
+        """
+        filename = options['filename']
+        usecols = options.get('usecols', None)
+
+        if filename.endswith(cls.FILE_EXTENSION):
+            filename = filename[:-len(cls.FILE_EXTENSION)]
+
+        if os.path.exists(filename+cls.FILE_EXTENSION):
+            datafiles = [filename+cls.FILE_EXTENSION]
+        else:
+            datafiles = sorted(glob(filename+"_[0-9]*"+cls.FILE_EXTENSION))
+            if not datafiles:
+                raise RuntimeError("No datafiles found starting with %s!"%filename)
+
+        metadata = []
+        final_metadata = []
+        data = []
+        comments = []
+        column_names = None
+
+        for datafile in datafiles:
+            print('LOADING CHAIN FROM FILE: ', datafile)
+            with open(datafile[:-len(cls.FILE_EXTENSION)] + cls.METADATA_EXTENSION) as f:
+                info = json.load(f)
+            column_names = info["columns"]
+
+            chain_metadata = {}
+            chain_comments = []
+            for key, value, comment in info["metadata"]:
+                if key == comment_indicator:
+                    chain_comments.append(value)
+                else:
+                    chain_metadata[key] = utils.parse_value(value)
+            chain_final_metadata = {key: utils.parse_value(value)
+                                    for key, value, comment in info["final_metadata"]}
+
+            # Copy-on-write, so that postprocessing can modify the
+            # data in memory without changing the file
+            with open(datafile, 'rb') as f:
+                shape = cls._read_shape(f)
+            if shape[0] == 0:
+                # Empty files cannot be memory-mapped
+                chain = np.zeros(shape)
+            else:
+                chain = np.load(datafile, mmap_mode='c')
+
+            if usecols is not None:
+                col_indices = utils.column_indices(column_names, usecols)
+                column_names = [column_names[c] for c in col_indices]
+                chain = chain[:, col_indices]
+
+            data.append(chain)
+            metadata.append(chain_metadata)
+            final_metadata.append(chain_final_metadata)
+            comments.append(chain_comments)
+
+        if column_names is None:
+            raise ValueError("Could not find column names in files starting %s"%filename)
+
+        return column_names, data, metadata, comments, final_metadata
@@ -9,8 +9,9 @@ PARAM_NAME = '.paramnames'
 
 
 class CosmoMCOutput(TextColumnOutput):
-    def __init__(self, filename, rank=0, nchain=1, delimiter='    ', lock=True, resume=False):
-        super(CosmoMCOutput, self).__init__(filename, rank, nchain, '', lock=lock, resume=resume)
+    def __init__(self, filename, rank=0, nchain=1, delimiter='    ', lock=True, resume=False, buffer_bytes=-1):
+        super(CosmoMCOutput, self).__init__(filename, rank, nchain, '', lock=lock, resume=resume,
+                                            buffer_bytes=buffer_bytes)
         if filename.endswith(self.FILE_EXTENSION):
             filename = filename[:-len(self.FILE_EXTENSION)]
         if rank == 0: 
@@ -49,6 +50,12 @@ class CosmoMCOutput(TextColumnOutput):
             self._last_params = params[:]
             self._multiplicity = 1
     
+    def _write_parameters_many(self, rows):
+        # Repeated rows are merged into one with a multiplicity,
+        # so we cannot use the bulk text writer
+        for row in rows:
+            self._write_parameters(self._row_values(row))
+
     def _write_parameters_multiplicity(self):
         if self._last_params:
             line = self.delimiter.join(('%16.7E'%x) for x
@@ -13,6 +13,9 @@ class InMemoryOutput(OutputBase):
     def _write_parameters(self, params):
         self.rows.append(params)
 
+    def _write_parameters_many(self, rows):
+        self.rows.extend(self._row_values(row) for row in rows)
+
     def _write_metadata(self, key, value, comment):
         self.meta[key] = (value,comment)
 
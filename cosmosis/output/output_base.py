@@ -5,6 +5,7 @@ import fcntl
 from future.utils import with_metaclass
 import datetime
 import os
+import time
 
 output_registry = {}
 LOG_LEVEL_NOISY = 15
@@ -47,6 +48,9 @@ class OutputBase(metaclass=OutputMetaclass):
         self.closed=False
         self.begun_sampling = False
         self.resumed = False
+        # Minimum time in seconds between flushes
+        self.flush_interval = 0.0
+        self._last_flush = time.time()
 
     def log_debug(self, message, *args, **kwargs):
         logging.debug(message, *args, **kwargs)
@@ -139,6 +143,48 @@ class OutputBase(metaclass=OutputMetaclass):
         #Pass to the subclasses to write output
         self._write_parameters(params)
 
+    def parameters_many(self, *param_groups):
+        """
+        Tell the outputter to save a whole batch of N rows of parameters
+        at once.
+
+        Each argument should be either a 2D array of shape (N, k),
+        supplying k columns, or a 1D array of length N, supplying one
+        column.  They are joined together in order, like the arguments
+        to the parameters method, to give an (N, ncol) array.
+        """
+        if self.closed:
+            raise RuntimeError("Tried to write parameters to closed output")
+
+        columns = []
+        for p in param_groups:
+            p = np.asarray(p)
+            if p.ndim == 1:
+                p = p[:, np.newaxis]
+            elif p.ndim != 2:
+                raise ValueError("Sampler error - parameter groups passed to parameters_many must be 1D or 2D")
+            columns.append(p)
+        nrow = {len(p) for p in columns}
+        if len(nrow) != 1:
+            raise ValueError("Sampler error - tried to save parameter groups with different numbers of rows")
+        rows = np.hstack(columns)
+
+        if not rows.shape[1]==len(self._columns):
+            raise ValueError("Sampler error - tried to save wrong number of parameters, or failed to set column names")
+        if len(rows) == 0:
+            return
+
+        if not self.begun_sampling:
+            self._begun_sampling(self._row_values(rows[0]))
+            self.begun_sampling=True
+        self._write_parameters_many(rows)
+
+    def _row_values(self, row):
+        # Convert a row from a numpy array to a list,
+        # restoring integer types for integer columns
+        return [int(x) if (dtype is int and np.isfinite(x)) else x
+                for x, (name, dtype, comment) in zip(row.tolist(), self._columns)]
+
     def reset_to_chain_start(self):
         """
         Seek the start of the chain so previous output can be overwritten.
@@ -147,10 +193,18 @@ class OutputBase(metaclass=OutputMetaclass):
         """
         pass
 
-    def flush(self):
+    def flush(self, force=False):
         """
-        For supported output classes, flush all pending output
+        For supported output classes, flush all pending output.
+
+        If flush_interval is set then this is skipped unless it is
+        at least that many seconds since the last flush, or force is True.
         """
+        if not force and self.flush_interval:
+            now = time.time()
+            if now - self._last_flush < self.flush_interval:
+                return
+            self._last_flush = now
         self._flush()
 
     def metadata(self, key, value, comment=""):
@@ -208,7 +262,8 @@ class OutputBase(metaclass=OutputMetaclass):
 
 
     #These are the methods that subclasses should
-    #implement.  _begun_sampling and _close are optional.
+    #implement.  _begun_sampling, _close, _flush, and
+    #_write_parameters_many are optional.
     #The others are mandatory
 
     def _begun_sampling(self, params):
@@ -224,6 +279,12 @@ class OutputBase(metaclass=OutputMetaclass):
     def _write_parameters(self, params):
         pass
 
+    def _write_parameters_many(self, rows):
+        # Subclasses can override this to write
+        # the whole (N, ncol) array in one go
+        for row in rows:
+            self._write_parameters(self._row_values(row))
+
     @abc.abstractmethod
     def _write_metadata(self, key, value, comment):
         pass
@@ -3,6 +3,9 @@ from . import utils
 from ..runtime.utils import mkdir
 import numpy as np
 import os
+import io
+import mmap
+import concurrent.futures
 from glob import glob
 from collections import OrderedDict
 
@@ -13,7 +16,7 @@ class TextColumnOutput(OutputBase):
     FILE_EXTENSION = ".txt"
     _aliases = ["text", "txt"]
 
-    def __init__(self, filename, rank=0, nchain=1, delimiter='\t', lock=True, resume=False):
+    def __init__(self, filename, rank=0, nchain=1, delimiter='\t', lock=True, resume=False, buffer_bytes=-1):
         super(TextColumnOutput, self).__init__()
         self.delimiter = delimiter
 
@@ -33,18 +36,18 @@ class TextColumnOutput(OutputBase):
 
         if resume and utils.file_exists_and_is_empty(self._filename):
             print("You set resume=T but the file {} is empty so I will start afresh".format(self._filename))
-            self._file = open(self._filename, "w")
+            self._file = open(self._filename, "w", buffering=buffer_bytes)
             self.resumed = False
         elif resume and os.path.exists(self._filename):
             print("Note: You set resume=T so I will resume from file {}".format(self._filename))
-            self._file = open(self._filename, "r+")
+            self._file = open(self._filename, "r+", buffering=buffer_bytes)
             # Jump to the end of the file
             self._file.seek(0,2)
             self.resumed = True
         else:
             if resume:
                 print("Note: You set resume=T but the file {} does not exist so I will start a new one".format(self._filename))
-            self._file = open(self._filename, "w")
+            self._file = open(self._filename, "w", buffering=buffer_bytes)
             self.resumed = False
         if lock:
             try:
@@ -114,6 +117,11 @@ In the last case you can set lock=F in the [output] section to disable this feat
         line = self.delimiter.join(str(x) for x in params) + '\n'
         self._file.write(line)
 
+    def _write_parameters_many(self, rows):
+        lines = ''.join(self.delimiter.join(str(x) for x in self._row_values(row)) + '\n'
+                        for row in rows)
+        self._file.write(lines)
+
     def _write_final(self, key, value, comment=''):
         #I suppose we can put this at the end - why not?
         self._final_metadata[key]= (value, comment)
@@ -144,12 +152,24 @@ In the last case you can set lock=F in the [output] section to disable this feat
         rank = options.get('rank', 0)
         nchain = options.get('parallel', 1)
         lock = utils.boolean_string(options.get('lock', True))
-        return cls(filename, rank, nchain, delimiter=delimiter, lock=lock, resume=resume)
+        # The size of the write buffer for the file; by default
+        # python chooses one based on the file system.
+        buffer_bytes = int(options.get('buffer_bytes', -1))
+        return cls(filename, rank, nchain, delimiter=delimiter, lock=lock, resume=resume,
+                   buffer_bytes=buffer_bytes)
 
     @classmethod
     def load_from_options(cls, options):
+        """
+        Load chains from the text file, or from all the _N files made by
+        a parallel run (in parallel threads).
+
+        If the option usecols is set, as a list or space-separated string
+        of column names or numbers, then only those columns are loaded.
+        """
         filename = options['filename']
         delimiter = options.get('delimiter', None)
+        usecols = options.get('usecols', None)
 
         cut = False
         if filename.endswith(cls.FILE_EXTENSION):
@@ -165,56 +185,181 @@ In the last case you can set lock=F in the [output] section to disable this feat
             if not datafiles:
                 raise RuntimeError("No datafiles found starting with %s!"%filename)
 
-        #Read the metadata
-        started_data = False
-        metadata = []
-        final_metadata = []
+        for datafile in datafiles:
+            print('LOADING CHAIN FROM FILE: ', datafile)
+
+        def load(datafile):
+            return _load_text_chain(datafile, delimiter, usecols)
+
+        if len(datafiles) == 1:
+            chains = [load(datafiles[0])]
+        else:
+            with concurrent.futures.ThreadPoolExecutor(len(datafiles)) as executor:
+                chains = list(executor.map(load, datafiles))
+
+        column_names = None
         data = []
+        metadata = []
         comments = []
-        column_names = None
+        final_metadata = []
+        for chain_column_names, chain, chain_metadata, chain_comments, chain_final_metadata in chains:
+            if chain_column_names is not None:
+                column_names = chain_column_names
+            data.append(chain)
+            metadata.append(chain_metadata)
+            comments.append(chain_comments)
+            final_metadata.append(chain_final_metadata)
 
-        for datafile in datafiles:
-            print('LOADING CHAIN FROM FILE: ', datafile)
-            chain = []
-            chain_metadata = {}
-            chain_final_metadata = {}
-            chain_comments = []
-            for i,line in enumerate(open(datafile)):
-                line = line.strip()
-                if not line: continue
-                if line.startswith('#'):
-                    #remove the first #
-                    #if there is another then this is a comment,
-                    #not metadata
-                    line=line[1:]
-                    if i == 0:
-                        column_names = line.split()
-                    elif line.startswith('#'):
-                        comment = line[1:]
-                        chain_comments.append(comment)
-                    else:
-                        #parse form '#key=value #comment'
-                        if line.count('#') == 0:
-                            key_val = line.strip()
-                            comment = ''
-                        else:
-                            key_val, comment = line.split('#', 1)
-                        key,val = key_val.split('=',1)
-                        val = utils.parse_value(val)
-                        if started_data:
-                            chain_final_metadata[key] = val
-                        else:
-                            chain_metadata[key] = val
+        if column_names is None:
+            raise ValueError("Could not find column names header in file starting %s"%filename)
+
+        return column_names, data, metadata, comments, final_metadata
+
+
+class _BoundedReader(io.RawIOBase):
+    """
+    A read-only file object for a range of bytes within another file.
+    """
+    def __init__(self, f, start, end):
+        self.f = f
+        self.f.seek(start)
+        self.remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(len(b), self.remaining)
+        if n <= 0:
+            return 0
+        n = self.f.readinto(memoryview(b)[:n])
+        self.remaining -= n
+        return n
+
+
+def _parse_metadata_line(line, metadata, comments):
+    # Parse a line which has already had the first # removed.
+    # If there is another then this is a comment, not metadata
+    if line.startswith('#'):
+        comments.append(line[1:])
+        return
+    #parse form '#key=value #comment'
+    if line.count('#') == 0:
+        key_val = line.strip()
+    else:
+        key_val, _ = line.split('#', 1)
+    key,val = key_val.split('=',1)
+    metadata[key] = utils.parse_value(val)
+
+
+def _embedded_comment_lines(f, start, end):
+    # Find the lines between bytes start and end of the file that begin
+    # with #, with the # removed.  These are rare, so we search for the
+    # character rather than reading every line.
+    lines = []
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        i = m.find(b"#", start, end)
+        while i != -1:
+            line_start = max(m.rfind(b"\n", start, i) + 1, start)
+            line_end = m.find(b"\n", i, end)
+            if line_end == -1:
+                line_end = end
+            text = m[line_start:line_end].decode('utf-8').strip()
+            # A # later in a line of data is a trailing comment, which we ignore
+            if text.startswith('#'):
+                lines.append(text[1:])
+            i = m.find(b"#", line_end, end)
+    return lines
+
+
+def _load_text_chain(datafile, delimiter=None, usecols=None, tail_block_size=65536):
+    column_names = None
+    chain_metadata = {}
+    chain_final_metadata = {}
+    chain_comments = []
+
+    with open(datafile, 'rb') as f:
+        # The names, metadata and comments are at the start of the file.
+        # Read them line by line until we get to the data.
+        data_start = 0
+        i = 0
+        for raw_line in f:
+            line = raw_line.decode('utf-8').strip()
+            if line and not line.startswith('#'):
+                break
+            data_start += len(raw_line)
+            if line:
+                line = line[1:]
+                if i == 0:
+                    column_names = line.split()
                 else:
-                    started_data = True
-                    words = line.split(delimiter)
-                    vals = [float(word) for word in words]
-                    chain.append(vals)
-            ncol = len(column_names)
-            line_lengths = np.array([len(row) for row in chain])
+                    _parse_metadata_line(line, chain_metadata, chain_comments)
+            i += 1
+
+        # Any final metadata comes after the data, so we work
+        # backwards from the end of the file to find it and
+        # the last line of data.
+        f.seek(0, 2)
+        position = f.tell()
+        final_lines = []
+        last_line = None
+        # part of a line left over from the previous block
+        pending = b""
+        while last_line is None and position > data_start:
+            block_start = max(data_start, position - tail_block_size)
+            f.seek(block_start)
+            lines = (f.read(position - block_start) + pending).split(b"\n")
+            position = block_start
+            if block_start > data_start:
+                # The first line may be incomplete, so
+                # we leave it for the next block
+                pending = lines.pop(0)
+                offset = block_start + len(pending) + 1
+            else:
+                pending = b""
+                offset = block_start
+            starts = []
+            for line in lines:
+                starts.append(offset)
+                offset += len(line) + 1
+            for start, line in zip(reversed(starts), reversed(lines)):
+                text = line.decode('utf-8').strip()
+                if not text:
+                    continue
+                if text.startswith('#'):
+                    final_lines.append(text[1:])
+                    continue
+                last_line = (start, start + len(line), text)
+                break
+
+        # Metadata and comments may also be in among the data.
+        # Metadata after the start of the data counts as final metadata.
+        if last_line is not None:
+            for line in _embedded_comment_lines(f, data_start, last_line[0]):
+                _parse_metadata_line(line, chain_final_metadata, chain_comments)
+
+        for line in reversed(final_lines):
+            _parse_metadata_line(line, chain_final_metadata, chain_comments)
+
+        if column_names is None:
+            return None, None, chain_metadata, chain_comments, chain_final_metadata
+
+        ncol = len(column_names)
+
+        if usecols is None:
+            col_indices = None
+        else:
+            col_indices = utils.column_indices(column_names, usecols)
+            column_names = [column_names[c] for c in col_indices]
+
+        if last_line is None:
+            data_end = data_start
+        else:
+            start, end, text = last_line
+            data_end = end
             #strip off the last line if it is incompletely written as often
             #the chain is interrupted
-            if line_lengths[-1]!=ncol:
+            if len(text.split(delimiter)) != ncol:
                 print("Skipping last line of chain as it seems to have been cut off")
                 print("This could conceivably cause problems for some samplers, though")
                 print("not the ones like metropolis and emcee where it is most likely to happen.")
@@ -223,19 +368,17 @@ In the last case you can set lock=F in the [output] section to disable this feat
                 print("You should probably check the final lines of the other files for errors")
                 print("that are harder to detect, like values being truncated.")
                 print()
-                chain = chain[:-1]
-                line_lengths = line_lengths[:-1]
-            #if any more are the wrong length then something has gone wrong:
-            if np.any(line_lengths!=ncol):
-                raise ValueError("Your chain file is corrupted somehow: not all the lines have {} columns".format(ncol))
+                data_end = start
 
+        if data_end <= data_start:
+            chain = np.zeros((0, len(column_names)))
+        else:
+            body = io.TextIOWrapper(io.BufferedReader(_BoundedReader(f, data_start, data_end)))
+            try:
+                chain = np.loadtxt(body, delimiter=delimiter, comments='#',
+                                   usecols=col_indices, ndmin=2)
+            except ValueError:
+                #if any more are the wrong length then something has gone wrong:
+                raise ValueError("Your chain file is corrupted somehow: not all the lines have {} columns".format(ncol))
 
-            data.append(np.array(chain))
-            metadata.append(chain_metadata)
-            final_metadata.append(chain_final_metadata)
-            comments.append(chain_comments)
-
-        if column_names is None:
-            raise ValueError("Could not find column names header in file starting %s"%filename)
-
-        return column_names, data, metadata, comments, final_metadata
+    return column_names, chain, chain_metadata, chain_comments, chain_final_metadata
@@ -36,6 +36,23 @@ def parse_value(x):
         x=False
     return x
 
+def column_indices(column_names, usecols):
+    """
+    Convert a list of column names or numbers (or a space-separated
+    string of them) to a list of column numbers.
+    """
+    if isinstance(usecols, str):
+        usecols = usecols.split()
+    indices = []
+    for c in usecols:
+        if isinstance(c, int):
+            indices.append(c)
+        elif c.isdigit():
+            indices.append(int(c))
+        else:
+            indices.append(column_names.index(c))
+    return indices
+
 def file_exists_and_is_empty(fpath):
     """
     
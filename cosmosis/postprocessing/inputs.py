@@ -1,10 +1,11 @@
 from cosmosis.output.text_output import TextColumnOutput
 from cosmosis.output.fits_output import FitsOutput
+from cosmosis.output.binary_output import BinaryOutput
 from cosmosis.runtime.config import Inifile
 import os
 
 
-def read_input(filename, force_text=False, weighted=False):
+def read_input(filename, force_text=False, weighted=False, usecols=None):
     """
     Read cosmosis output data, either by:
      - specifying a cosmosis .txt output file
@@ -17,12 +18,13 @@ def read_input(filename, force_text=False, weighted=False):
         filename: string, paths to any of the options described above
         force_text: bool, default=False - regardless of the file ending assume it is text columns
         weighted: bool, default=False - if a non-cosmosis file is passed, assume that its samples have weights
+        usecols: list, default=None - names or numbers of the only columns to load from text or binary files
     Returns:
         sampler - string with the name of the sampler in
         ini - a dictionary of information containing the output and metadata, suitable for instantiating a postprocessor.
     """
     if filename.endswith("txt") or force_text:
-        output_info = TextColumnOutput.load_from_options({"filename":filename})
+        output_info = TextColumnOutput.load_from_options({"filename":filename, "usecols":usecols})
         metadata=output_info[2][0]
         sampler = metadata.get("sampler")
         if sampler is None:
@@ -50,6 +52,21 @@ def read_input(filename, force_text=False, weighted=False):
         else:
             ini = {"sampler":sampler, sampler:metadata, "data":output_info, "output":dict(format="fits", filename=filename)}
 
+    elif filename.endswith("npy"):
+        output_info = BinaryOutput.load_from_options({"filename":filename, "usecols":usecols})
+        metadata=output_info[2][0]
+        sampler = metadata.get("sampler")
+        if sampler is None:
+            print("No sampler was recorded in this file.")
+            print("So I will assume it is a generic MCMC file")
+            if weighted:
+                sampler = "weighted_metropolis"
+            else:
+                sampler = "metropolis"
+            ini = output_info
+        else:
+            ini = {"sampler":sampler, sampler:metadata, "data":output_info, "output":dict(format="binary", filename=filename)}
+
     elif os.path.isdir(filename):
         ini = Inifile(None)
         ini.add_section("runtime")
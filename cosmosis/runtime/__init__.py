@@ -4,4 +4,5 @@ from .module import Module, SetupError, FunctionModule, ClassModule
 from .prior import Prior
 from .pipeline import LikelihoodPipeline, MissingLikelihoodError
 from .mpi_pool import MPIPool
+from .shared_arrays import shared_array
 from .utils import stdout_redirected
@@ -0,0 +1,192 @@
+#coding: utf-8
+
+u"""A single-file archive of many :class:`DataBlock` objects.
+
+This is used by the samplers' `save=` option to store the block from
+every sample they run.  The archive is a sequence of records, one per
+block, appended to the file as each sample finishes.  Each record has
+a short header giving the sample number, followed by a table of the
+sections in the block and then the contents of each section, pickled
+and compressed separately.
+
+The records are packed by :func:`pack_block`, which can run in the
+worker processes, so that the process writing the file only has to
+append the bytes it is sent.  A :class:`BlockArchive` can then read any
+section of any sample without unpacking the rest of the archive.
+
+"""
+import os
+import pickle
+import struct
+import zlib
+from ..datablock import DataBlock
+from ..datablock.cosmosis_py import dbt_types as types
+
+ARCHIVE_EXTENSION = ".blocks"
+RECORD_MAGIC = b"CBLK"
+# magic, sample number, size of the section table, size of the section data
+RECORD_HEADER = struct.Struct("<4sqQQ")
+
+
+def pack_block(block, sample, level=6):
+    u"""Pack `block` into a record for sample number `sample`.
+
+    The result is a bytes object which can be passed to
+    :func:`BlockArchiveWriter.append`.  `level` is the zlib
+    compression level, from 0 (none) to 9.
+
+    """
+    sections = {}
+    for (section, name, type_code, _) in block.key_info():
+        method = block._method_for_datatype_code(type_code, block.GET)
+        if method is None:
+            raise ValueError("Cannot save value of type code %s for %s, %s" % (type_code, section, name))
+        value = method(section, name)
+        if type_code == types.DBT_STRING1D:
+            value = value.tolist()
+        sections.setdefault(section, []).append((name, type_code, value))
+
+    table = []
+    chunks = []
+    offset = 0
+    for section, entries in sections.items():
+        chunk = zlib.compress(pickle.dumps(entries, protocol=4), level)
+        table.append((section, offset, len(chunk)))
+        chunks.append(chunk)
+        offset += len(chunk)
+    table = pickle.dumps(table, protocol=4)
+    return b"".join([RECORD_HEADER.pack(RECORD_MAGIC, sample, len(table), offset), table] + chunks)
+
+
+
+class BlockArchiveWriter(object):
+    u"""Append records made by :func:`pack_block` to an archive file.
+
+    Any existing file is replaced, unless `append` is True, in which
+    case the new records are added after the complete records already
+    in it.  The file is flushed after each record, so an archive from a
+    run that was killed part-way through is still readable up to the
+    last complete record.
+
+    """
+    def __init__(self, filename, append=False):
+        self.filename = filename
+        if append and os.path.exists(filename):
+            # Drop any record that was only partly written before the
+            # earlier run stopped
+            with BlockArchive(filename) as archive:
+                end = archive.end
+            self._file = open(filename, "r+b")
+            self._file.truncate(end)
+            self._file.seek(end)
+        else:
+            self._file = open(filename, "wb")
+
+    def append(self, record):
+        self._file.write(record)
+        self._file.flush()
+
+    def write(self, block, sample):
+        u"""Pack and append `block` in one step."""
+        self.append(pack_block(block, sample))
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+
+class BlockArchive(object):
+    u"""Read blocks back from an archive made by :class:`BlockArchiveWriter`.
+
+    Opening the archive only reads the record headers, to find where each
+    sample is stored.  The sections of a sample are then read and
+    uncompressed only when they are asked for.  If a sample number
+    appears more than once the last record for it is used.
+
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = open(filename, "rb")
+        self._records = {}
+        # The end of the last complete record
+        self.end = 0
+        self._scan()
+
+    def _scan(self):
+        f = self._file
+        f.seek(0, 2)
+        size = f.tell()
+        offset = 0
+        while offset + RECORD_HEADER.size <= size:
+            f.seek(offset)
+            magic, sample, table_size, data_size = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+            if magic != RECORD_MAGIC:
+                raise ValueError("{} is not a block archive, or is corrupted at byte {}".format(self.filename, offset))
+            end = offset + RECORD_HEADER.size + table_size + data_size
+            # Ignore a final record that was only partly written
+            if end > size:
+                break
+            self._records[sample] = (offset + RECORD_HEADER.size, table_size)
+            offset = end
+        self.end = offset
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, sample):
+        return sample in self._records
+
+    def samples(self):
+        u"""Return a sorted list of the sample numbers in the archive."""
+        return sorted(self._records)
+
+    def _table(self, sample):
+        try:
+            start, table_size = self._records[sample]
+        except KeyError:
+            raise KeyError("No sample {} in block archive {}".format(sample, self.filename))
+        self._file.seek(start)
+        table = pickle.loads(self._file.read(table_size))
+        data_start = start + table_size
+        return {section: (data_start + offset, size) for (section, offset, size) in table}
+
+    def sections(self, sample):
+        u"""Return the names of the sections saved for `sample`."""
+        return list(self._table(sample))
+
+    def _read_entries(self, start, size):
+        self._file.seek(start)
+        return pickle.loads(zlib.decompress(self._file.read(size)))
+
+    def read_section(self, sample, section):
+        u"""Return a dictionary of the values in one section of one sample."""
+        table = self._table(sample)
+        try:
+            start, size = table[section.lower()]
+        except KeyError:
+            raise KeyError("No section {} saved for sample {} in {}".format(section, sample, self.filename))
+        return {name: value for (name, _, value) in self._read_entries(start, size)}
+
+    def read_block(self, sample):
+        u"""Rebuild the complete :class:`DataBlock` saved for `sample`."""
+        block = DataBlock()
+        for section, (start, size) in self._table(sample).items():
+            for (name, type_code, value) in self._read_entries(start, size):
+                method = block._method_for_datatype_code(type_code, block.PUT)
+                method(section, name, value)
+        return block
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,226 @@
+#coding: utf-8
+
+u"""Caches of :class:`DataBlock` objects keyed by a hash of their contents.
+
+These are used by the pipeline to store the results of partial pipeline
+runs so that they can be re-used instead of re-running modules.  The
+:class:`BlockCache` keeps recently used blocks in memory up to a budget
+in bytes, and can optionally also write every entry to a
+:class:`DiskBlockStore` directory.  Entries on disk persist between runs
+and can be picked up by any process running the same pipeline, such as
+the other workers in an --smp run.
+
+"""
+import collections
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import sys
+import tempfile
+import numpy as np
+from ..datablock import DataBlock
+from ..datablock.cosmosis_py import dbt_types as types
+
+
+def hash_block_values(items, context=""):
+    u"""Return a hex digest of a sequence of (section, name, value) triples.
+
+    Unlike the python built-in `hash` this is the same in every process
+    and every run, so it can be used to name files.  The `context` string
+    is mixed in so that different pipelines get different keys.
+
+    """
+    h = hashlib.sha1(context.encode('utf-8'))
+    for section, name, value in items:
+        value = np.ascontiguousarray(value)
+        h.update("{}\0{}\0{}\0{}\0".format(section, name, value.dtype.str, value.shape).encode('utf-8'))
+        h.update(value.tobytes())
+    return h.hexdigest()
+
+
+# The size of each element of the numeric array types
+_element_nbytes = {
+    types.DBT_INT1D: np.dtype(np.intc).itemsize,
+    types.DBT_INTND: np.dtype(np.intc).itemsize,
+    types.DBT_DOUBLE1D: 8,
+    types.DBT_DOUBLEND: 8,
+    types.DBT_COMPLEX1D: 16,
+    types.DBT_COMPELXND: 16,
+}
+
+
+def block_nbytes(block):
+    u"""Estimate the memory used by the values in `block`, without copying them out of it."""
+    # Scalars and strings are small; just count a fixed overhead for them
+    nbytes = 0
+    for _, _, type_code, size in block.key_info():
+        nbytes += 64 + _element_nbytes.get(type_code, 0) * max(size, 0)
+    return nbytes
+
+
+
+class DiskBlockStore(object):
+    u"""A directory of blocks, one file per key.
+
+    Each file contains a short pickled index followed by the raw array
+    data, which is memory-mapped when it is read back rather than loaded
+    into python objects.  Files are written to a temporary name and then
+    moved into place, so that several processes can share a directory.
+
+    """
+    header_format = '<Q'
+    alignment = 64
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def filename(self, key):
+        return os.path.join(self.directory, key + ".block")
+
+    def __contains__(self, key):
+        return os.path.exists(self.filename(key))
+
+    def _aligned(self, n):
+        return -(-n // self.alignment) * self.alignment
+
+    def write(self, key, index, buffers):
+        sizes = [memoryview(b).nbytes for b in buffers]
+        # The data offsets are relative to the end of the header,
+        # which is padded so that every array is aligned.
+        offsets = []
+        offset = 0
+        for size in sizes:
+            offsets.append(offset)
+            offset = self._aligned(offset + size)
+        header = pickle.dumps((index, list(zip(offsets, sizes))), protocol=4)
+        header_size = self._aligned(struct.calcsize(self.header_format) + len(header))
+
+        fd, tmp_filename = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(struct.pack(self.header_format, len(header)))
+                f.write(header)
+                for buf, start in zip(buffers, offsets):
+                    f.seek(header_size + start)
+                    f.write(buf)
+            os.replace(tmp_filename, self.filename(key))
+        except:
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+            raise
+
+    def read(self, key):
+        u"""Load the block for `key`, or return None if it is not in the store."""
+        try:
+            f = open(self.filename(key), 'rb')
+        except FileNotFoundError:
+            return None
+        with f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            view = memoryview(data)
+            n = struct.calcsize(self.header_format)
+            header_length, = struct.unpack(self.header_format, view[:n])
+            index, locations = pickle.loads(view[n:n+header_length])
+            header_size = self._aligned(n + header_length)
+            buffers = [view[header_size+start:header_size+start+size]
+                       for start, size in locations]
+            # The values are copied into the new block here,
+            # so we can release the map straight afterwards.
+            block = DataBlock.from_binary(index, buffers)
+            for buf in buffers:
+                buf.release()
+            view.release()
+        finally:
+            data.close()
+        return block
+
+
+
+class BlockCache(object):
+    u"""A least-recently-used cache of blocks with a memory budget.
+
+    Blocks are added with :func:`put` and looked up with :func:`get`.
+    When the total estimated size of the blocks in memory goes above
+    `memory_limit` bytes, the ones used least recently are dropped
+    (though the newest block is always kept).
+
+    If `directory` is set then each block is also written to a
+    :class:`DiskBlockStore` there, and blocks not found in memory are
+    looked for on disk before being counted as a miss.
+
+    """
+    def __init__(self, memory_limit, directory=None):
+        self.memory_limit = memory_limit
+        self.entries = collections.OrderedDict()
+        self.nbytes = 0
+        if directory:
+            self.disk = DiskBlockStore(directory)
+        else:
+            self.disk = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries or (self.disk is not None and key in self.disk)
+
+    def get(self, key):
+        u"""Return the block stored under `key`, or None if there is not one."""
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        if self.disk is not None:
+            block = self.disk.read(key)
+            if block is not None:
+                self.disk_hits += 1
+                self._store(key, block, block_nbytes(block))
+                return block
+
+        self.misses += 1
+        return None
+
+    def put(self, key, block):
+        u"""Store `block` under `key`.  The cache keeps a reference to the block, not a copy."""
+        if self.disk is not None and key not in self.disk:
+            self.disk.write(key, *block.to_binary())
+        self._store(key, block, block_nbytes(block))
+
+    def _store(self, key, block, nbytes):
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.nbytes -= old[1]
+        self.entries[key] = (block, nbytes)
+        self.nbytes += nbytes
+        while self.nbytes > self.memory_limit and len(self.entries) > 1:
+            _, (_, n) = self.entries.popitem(last=False)
+            self.nbytes -= n
+            self.evictions += 1
+
+    def clear(self):
+        u"""Empty the in-memory cache.  Anything on disk is kept."""
+        self.entries.clear()
+        self.nbytes = 0
+
+    def report(self, title="Block cache", stream=None):
+        u"""Print the hit and miss statistics for the cache."""
+        if stream is None:
+            stream = sys.stdout
+        lookups = self.hits + self.disk_hits + self.misses
+        if lookups == 0:
+            return
+        stream.write("{}: {} lookups, {} hits in memory, {} hits on disk, {} misses ({:.1f}% hit rate)\n".format(
+            title, lookups, self.hits, self.disk_hits, self.misses,
+            100.0 * (self.hits + self.disk_hits) / lookups))
+        stream.write("{}: {} blocks ({:.1f} MB) in memory, {} evicted\n".format(
+            title, len(self.entries), self.nbytes / 1e6, self.evictions))
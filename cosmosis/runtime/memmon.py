@@ -2,6 +2,7 @@ import time
 import psutil
 import threading
 import datetime
+from . import shared_arrays
 
 
 class MemoryMonitor:
@@ -90,6 +91,12 @@ class MemoryMonitor:
             f"Available mem: {avail:.1f} MB"
         )
 
+        # Arrays in shared memory are counted in the physical memory
+        # of every process using them, but only stored once per node
+        store = shared_arrays.get_store()
+        if store.arrays:
+            print(f"MemoryMonitor {store.report()}")
+
     def _run(self):
         # there are two ways to stop the monitor - it is automatically
         # ended if the main thread completes.  And it can be stopped
@@ -72,6 +72,13 @@ class Module(object):
     The optional /cleanup/ function is also passed the /setup/ʼs `data` object
     (only), and so may free any resources which that object clings on to.
 
+    Python modules may also define an /execute_batch/ function, which is
+    called with a list of :class:`DataBlock`s (and the /setup/ data, as for
+    /execute/) when the pipeline is run on many points at once, and returns
+    a list of statuses, one per block.  Modules that vectorise well over
+    parameters, like emulators or simple likelihoods, can use this to do a
+    whole batch in one call.  Otherwise /execute/ is run on each block.
+
     """
 
     def __init__(self, module_name, file_path,
@@ -93,6 +100,7 @@ class Module(object):
         self.setup_function = setup_function
         self.execute_function = execute_function
         self.cleanup_function = cleanup_function
+        self.execute_batch_function = None
 
         # identify module filename
         filename = file_path
@@ -149,8 +157,7 @@ class Module(object):
         """
         # Read the logs of all parameters that have been read.  This includes
         # everything from all module setups.  We trim it down below.
-        nlog = config.get_log_count()
-        logs = [config.get_log_entry(i) for i in range(nlog)]
+        logs = config.get_log()
 
         # get the names of all parameters that came from the
         # DEFAULT section of the config file
@@ -222,6 +229,10 @@ class Module(object):
             raise ValueError("Could not find a function 'execute' in module '"
                                  +  self.name + "'")
 
+        # The batch function is optional, and only for python modules
+        if self.is_python and self.library is not None:
+            self.execute_batch_function = getattr(self.library, "execute_batch", None)
+
     def setup(self, config, quiet=True):
         u"""Call the /Module/ after copying config information constructor.
         
@@ -251,6 +262,32 @@ class Module(object):
             return self.execute_function(data_block)
 
 
+    def execute_batch(self, data_blocks):
+        u"""Run the module on each of the list `data_blocks` and return a list of their statuses.
+
+        If the module has an /execute_batch/ function it is called once
+        on the whole list, otherwise /execute/ is called on each block.
+        A batch function may also return a single status, which then
+        applies to every block.
+
+        """
+        if self.execute_batch_function is None:
+            return [self.execute(data_block) for data_block in data_blocks]
+        if not hasattr(self, 'data'):
+            raise RuntimeError("Must set up module before executing it")
+        if self.data is not None:
+            status = self.execute_batch_function(data_blocks, self.data)
+        else:
+            status = self.execute_batch_function(data_blocks)
+        if status is None or np.ndim(status) == 0:
+            return [status] * len(data_blocks)
+        status = list(status)
+        if len(status) != len(data_blocks):
+            raise ValueError("Module {} returned {} statuses from execute_batch "
+                             "but was given {} blocks".format(self.name, len(status), len(data_blocks)))
+        return status
+
+
 
     def cleanup(self):
         u"""Run the /cleanup/ function.
@@ -394,7 +431,7 @@ class FunctionModule(Module):
     """
 
     def __init__(self, name, setup_function, execute_function,
-                 cleanup_function=None):
+                 cleanup_function=None, execute_batch_function=None):
         """
         Initialize the subclass from the functions themselves.
 
@@ -409,6 +446,9 @@ class FunctionModule(Module):
         def execute(block, config):
             ...
             return 0
+
+        and the optional execute_batch_function is like execute but
+        takes a list of blocks and returns a list of statuses.
     
         """
         self.name = name
@@ -417,6 +457,7 @@ class FunctionModule(Module):
         self.setup_function = setup_function
         self.execute_function = execute_function
         self.cleanup_function = cleanup_function
+        self.execute_batch_function = execute_batch_function
 
         self.library = None
 
@@ -443,6 +484,10 @@ class ClassModule(metaclass=abc.ABCMeta):
     def cleanup(config):
         pass
 
+    # Subclasses can define a method execute_batch(self, blocks), returning
+    # a list of statuses or None for success, to run on many blocks at once.
+    execute_batch = None
+
     @classmethod
     def as_module(cls, name):
         def setup(options):
@@ -457,5 +502,11 @@ class ClassModule(metaclass=abc.ABCMeta):
         def cleanup(mod):
             mod.cleanup()
 
+        if cls.execute_batch is None:
+            execute_batch = None
+        else:
+            def execute_batch(blocks, mod):
+                status = mod.execute_batch(blocks)
+                return 0 if status is None else status
 
-        return FunctionModule(name, setup, execute, cleanup)
+        return FunctionModule(name, setup, execute, cleanup, execute_batch)
@@ -0,0 +1,255 @@
+#coding: utf-8
+
+u"""Running statistics on how long each pipeline module takes.
+
+Every time a module is run the pipeline records how long it took,
+whether it failed, and how many bytes of data it read from and wrote to
+the block.  The times are binned in a fixed logarithmic histogram, so
+the median and upper percentiles can be estimated without keeping every
+time, and the statistics from different processes can simply be added
+together.
+
+The statistics from the workers of an --smp run are written to a spool
+directory when the workers exit, and those from MPI processes are
+gathered over the pool, so that :func:`PipelineStats.gather` can combine
+them all in the master process.  The result can be saved as a JSON or
+CSV report by setting the `module_stats` option in the [pipeline]
+section.
+
+"""
+import collections
+import csv
+import glob
+import json
+import math
+import multiprocessing.util
+import os
+import sys
+import tempfile
+
+# Times are binned from 1 microsecond to 1e5 seconds with this many bins
+# per decade, giving percentiles to within about 6%.
+BINS_PER_DECADE = 20
+MIN_LOG_TIME = -6
+NBIN = (5 - MIN_LOG_TIME) * BINS_PER_DECADE
+
+# The order of the columns in the reports
+REPORT_FIELDS = ["module", "calls", "failures", "cached", "total_time", "mean_time",
+                 "min_time", "max_time", "p50_time", "p95_time", "p99_time",
+                 "bytes_read", "bytes_written"]
+
+
+
+class ModuleStats(object):
+    u"""The statistics for one module."""
+    def __init__(self, name):
+        self.name = name
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.failures = 0
+        self.cached = 0
+        self.total_time = 0.0
+        self.min_time = math.inf
+        self.max_time = 0.0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.histogram = [0] * NBIN
+
+    def record(self, time_taken, failed=False, bytes_read=0, bytes_written=0):
+        u"""Record one run of the module."""
+        self.calls += 1
+        if failed:
+            self.failures += 1
+        self.total_time += time_taken
+        if time_taken < self.min_time:
+            self.min_time = time_taken
+        if time_taken > self.max_time:
+            self.max_time = time_taken
+        self.bytes_read += bytes_read
+        self.bytes_written += bytes_written
+        if time_taken > 0:
+            i = int((math.log10(time_taken) - MIN_LOG_TIME) * BINS_PER_DECADE)
+            i = min(max(i, 0), NBIN - 1)
+        else:
+            i = 0
+        self.histogram[i] += 1
+
+    def merge(self, other):
+        u"""Add the statistics in `other` to these ones."""
+        self.calls += other.calls
+        self.failures += other.failures
+        self.cached += other.cached
+        self.total_time += other.total_time
+        self.min_time = min(self.min_time, other.min_time)
+        self.max_time = max(self.max_time, other.max_time)
+        self.bytes_read += other.bytes_read
+        self.bytes_written += other.bytes_written
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+
+    def mean_time(self):
+        if self.calls == 0:
+            return 0.0
+        return self.total_time / self.calls
+
+    def percentile(self, q):
+        u"""Estimate the time below which `q` percent of the runs finished."""
+        if self.calls == 0:
+            return 0.0
+        target = q / 100.0 * self.calls
+        count = 0
+        for i, n in enumerate(self.histogram):
+            count += n
+            if count >= target and n:
+                break
+        # The geometric centre of the bin, but within the known range
+        t = 10 ** (MIN_LOG_TIME + (i + 0.5) / BINS_PER_DECADE)
+        return min(max(t, self.min_time), self.max_time)
+
+    def summary(self):
+        u"""Return a dictionary with the statistics for the report."""
+        return collections.OrderedDict([
+            ("module", self.name),
+            ("calls", self.calls),
+            ("failures", self.failures),
+            ("cached", self.cached),
+            ("total_time", self.total_time),
+            ("mean_time", self.mean_time()),
+            ("min_time", self.min_time if self.calls else 0.0),
+            ("max_time", self.max_time),
+            ("p50_time", self.percentile(50)),
+            ("p95_time", self.percentile(95)),
+            ("p99_time", self.percentile(99)),
+            ("bytes_read", self.bytes_read),
+            ("bytes_written", self.bytes_written),
+        ])
+
+    def to_dict(self):
+        d = dict(self.__dict__)
+        d["min_time"] = None if self.calls == 0 else self.min_time
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        stats = cls(d["name"])
+        stats.__dict__.update(d)
+        if stats.min_time is None:
+            stats.min_time = math.inf
+        return stats
+
+
+
+class PipelineStats(object):
+    u"""The statistics for every module in a pipeline.
+
+    The statistics are kept separately in each process.  If
+    `spool_workers` is set and this process forks workers then each of
+    them starts again from zero, and writes its own statistics to a spool
+    directory when it exits, to be picked up by :func:`gather`.
+
+    """
+    def __init__(self, module_names, spool_workers=False):
+        self.modules = [ModuleStats(name) for name in module_names]
+        self.pid = self.owner_pid = os.getpid()
+        self.spool_directory = os.path.join(tempfile.gettempdir(),
+            "cosmosis_module_stats_{}_{}".format(self.pid, id(self)))
+        self.spool_workers = spool_workers
+        if spool_workers:
+            multiprocessing.util.register_after_fork(self, PipelineStats._after_fork)
+
+    def __getitem__(self, i):
+        return self.modules[i]
+
+    def __len__(self):
+        return len(self.modules)
+
+    def _after_fork(self):
+        if not self.spool_workers:
+            return
+        # In a newly forked worker; count only what it does itself
+        for stats in self.modules:
+            stats.reset()
+        self.pid = os.getpid()
+        multiprocessing.util.Finalize(self, self._write_spool, exitpriority=10)
+
+    def _write_spool(self):
+        os.makedirs(self.spool_directory, exist_ok=True)
+        filename = os.path.join(self.spool_directory, "{}.json".format(os.getpid()))
+        with open(filename + ".tmp", "w") as f:
+            json.dump(self.to_list(), f)
+        os.replace(filename + ".tmp", filename)
+
+    def to_list(self):
+        return [stats.to_dict() for stats in self.modules]
+
+    def merge_list(self, data):
+        u"""Merge in statistics in the form returned by :func:`to_list`."""
+        for stats, d in zip(self.modules, data):
+            stats.merge(ModuleStats.from_dict(d))
+
+    def collect_workers(self):
+        u"""Merge in and remove the statistics written by forked workers that have finished."""
+        # Only the process that made these statistics owns the spool
+        if os.getpid() != self.owner_pid:
+            return
+        for filename in glob.glob(os.path.join(self.spool_directory, "*.json")):
+            with open(filename) as f:
+                self.merge_list(json.load(f))
+            os.remove(filename)
+        if os.path.isdir(self.spool_directory):
+            try:
+                os.rmdir(self.spool_directory)
+            except OSError:
+                pass
+
+    def close(self):
+        u"""Stop any workers forked from now on spooling their statistics, and collect those already written."""
+        self.spool_workers = False
+        self.collect_workers()
+
+    def gather(self, pool=None):
+        u"""Combine the statistics from every process into these ones.
+
+        This must be called by every process in an MPI pool.  It returns
+        True in the master process, where the statistics now include all
+        the others, and False elsewhere.
+
+        """
+        self.collect_workers()
+        if pool is None:
+            return True
+        all_stats = pool.gather(self.to_list())
+        if not pool.is_master():
+            return False
+        # The first entry is our own
+        for data in all_stats[1:]:
+            self.merge_list(data)
+        return True
+
+    def summaries(self):
+        return [stats.summary() for stats in self.modules]
+
+    def write(self, filename):
+        u"""Write a report to a CSV file if `filename` ends with .csv, or otherwise a JSON file."""
+        summaries = self.summaries()
+        tmp_filename = filename + ".tmp"
+        with open(tmp_filename, "w") as f:
+            if filename.endswith(".csv"):
+                writer = csv.DictWriter(f, REPORT_FIELDS)
+                writer.writeheader()
+                writer.writerows(summaries)
+            else:
+                json.dump({"modules": summaries}, f, indent=1)
+        os.replace(tmp_filename, filename)
+
+    def report(self, stream=None):
+        u"""Print a table of the main statistics."""
+        if stream is None:
+            stream = sys.stdout
+        stream.write("{:<24} {:>9} {:>8} {:>12} {:>10} {:>10} {:>10} {:>10} {:>10}\n".format(
+            "Module", "Calls", "Failed", "Total (s)", "Mean (s)", "p50 (s)", "p95 (s)", "Read (MB)", "Write (MB)"))
+        for s in self.summaries():
+            stream.write("{:<24} {:>9} {:>8} {:>12.3f} {:>10.4f} {:>10.4f} {:>10.4f} {:>10.2f} {:>10.2f}\n".format(
+                s["module"][:24], s["calls"], s["failures"], s["total_time"], s["mean_time"],
+                s["p50_time"], s["p95_time"], s["bytes_read"] / 1e6, s["bytes_written"] / 1e6))
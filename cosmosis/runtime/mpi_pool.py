@@ -1,3 +1,8 @@
+import time
+import sys
+import collections
+from . import shared_arrays
+
 class _close_pool_message(object):
     def __repr__(self):
         return "<Close pool message>"
@@ -9,26 +14,85 @@ class _function_wrapper(object):
         self.callback = callback
 
 
+class _Future(object):
+    """
+    The pending result of a task submitted to an MPIPool.
+    """
+    def __init__(self, pool, task):
+        self.pool = pool
+        self.task = task
+        self._finished = False
+        self._result = None
+
+    def done(self):
+        return self._finished
+
+    def result(self):
+        # Keep collecting results from the workers until ours comes back
+        while not self._finished:
+            self.pool._receive_one()
+        return self._result
+
+
 def _error_function(task):
     raise RuntimeError("Pool was sent tasks before being told what "
                        "function to apply.")
 
 
 class MPIPool(object):
-    def __init__(self, debug=False):
+    """
+    A pool of MPI processes, where the root process sends out
+    tasks and the others wait to be told what to do.
+
+    There are two ways of distributing the tasks in a map:
+
+    - "strided" (the default) gives each rank a fixed, round-robin
+      slice tasks[rank::size] of the tasks, including the root.
+      The assignment of tasks to ranks is then reproducible.
+
+    - "dynamic" has the root hand out chunks of chunksize tasks to
+      the other ranks on demand, sending each one a new chunk as soon
+      as it returns its previous one.  One slow evaluation then holds
+      up only the rank doing it instead of the whole map.  The root
+      does no evaluations itself in this mode.
+
+    In both modes the pool records how long each rank spends working
+    on its tasks.  With debug=True it prints the busy and idle times when
+    it is closed; they are also available from timing_report.
+    """
+    schedules = ["strided", "dynamic"]
+
+    def __init__(self, debug=False, schedule="strided", chunksize=1):
         try:
             from mpi4py import MPI
             self.MPI = MPI
         except ImportError:
             raise RuntimeError("MPI environment not found!")
 
+        if schedule not in self.schedules:
+            raise ValueError("Unknown MPI pool schedule {}; should be one of {}".format(
+                schedule, ", ".join(self.schedules)))
+
         self.comm = MPI.COMM_WORLD
         self.rank = self.comm.Get_rank()
         self.size = self.comm.Get_size()
         self.debug = debug
+        self.schedule = schedule
+        self.chunksize = max(int(chunksize), 1)
 
         self.function = _error_function
         self.callback = None
+        self.reset_timing()
+
+        # State for asynchronous task submission
+        self._free_ranks = list(range(self.size - 1, 0, -1))
+        self._running = {}
+        self._queued = collections.deque()
+        self._async_start = None
+
+        # Modules running under this pool share their constant
+        # arrays between the processes on each node
+        shared_arrays.use_mpi(self.comm)
 
     def is_master(self):
         return self.rank == 0
@@ -49,15 +113,11 @@ class MPIPool(object):
                 self.callback = task.callback
                 continue
 
-            if self.callback:
-                def compose(x):
-                    result = self.function(x)
-                    self.callback(x, result)
-                    return result
-                results = list(map(compose, task))
-            else:
-                results = list(map(self.function, task))
-            self.comm.send(results, dest=0, tag=status.tag)
+            # Send back the time spent on the tasks too,
+            # so the master can report on load balancing
+            t0 = time.time()
+            results = list(map(self._local_function(), task))
+            self.comm.send((results, time.time() - t0), dest=0, tag=status.tag)
 
     def map(self, function, tasks, callback=None):
         # Should be called by the master only
@@ -65,7 +125,22 @@ class MPIPool(object):
             self.wait()
             return
 
+        if self._running or self._queued:
+            raise RuntimeError("MPIPool.map called while submitted tasks "
+                               "are still running")
+
         tasks= list(tasks)
+        self._set_function(function, callback)
+
+        t0 = time.time()
+        if self.schedule == "dynamic" and self.size > 1:
+            results = self._map_dynamic(tasks)
+        else:
+            results = self._map_strided(tasks)
+        self.map_time += time.time() - t0
+        return results
+
+    def _set_function(self, function, callback):
         # send function if necessary
         if function is not self.function or callback is not self.callback:
             self.function = function
@@ -75,6 +150,90 @@ class MPIPool(object):
                         for i in range(1, self.size)]
             #self.MPI.Request.waitall(requests)
 
+    def submit(self, function, task):
+        """
+        Queue function(task) to be run on the next free worker, and
+        return a future object for it, with done() and result() methods.
+
+        Results are only collected from the workers in as_completed or
+        result, so one of those should be called on the futures.
+        """
+        if not self.is_master():
+            raise RuntimeError("Only the master process can submit tasks")
+
+        if function is not self.function or self.callback is not None:
+            if self._running or self._queued:
+                raise RuntimeError("Cannot change the function an MPIPool "
+                                   "applies while tasks are running")
+            self._set_function(function, None)
+
+        future = _Future(self, task)
+
+        # With no workers we just do the job ourselves
+        if self.size == 1:
+            t0 = time.time()
+            future._result = self.function(task)
+            future._finished = True
+            self.busy_time[0] += time.time() - t0
+            self.map_time += time.time() - t0
+            return future
+
+        self._queued.append(future)
+        self._dispatch()
+        return future
+
+    def _dispatch(self):
+        while self._free_ranks and self._queued:
+            if self._async_start is None:
+                self._async_start = time.time()
+            rank = self._free_ranks.pop()
+            future = self._queued.popleft()
+            self._running[rank] = future
+            self.comm.send([future.task], dest=rank)
+
+    def _receive_one(self):
+        if not self._running:
+            raise RuntimeError("Waiting for MPI results but no tasks are running")
+        status = self.MPI.Status()
+        result, busy = self.comm.recv(source=self.MPI.ANY_SOURCE, status=status)
+        rank = status.source
+        future = self._running.pop(rank)
+        future._result = result[0]
+        future._finished = True
+        self.busy_time[rank] += busy
+        self._free_ranks.append(rank)
+        self._dispatch()
+        if not self._running:
+            self.map_time += time.time() - self._async_start
+            self._async_start = None
+        return future
+
+    def as_completed(self, futures):
+        """
+        Generate the futures from the list as they finish, handing
+        queued tasks to the workers as they become free.
+        """
+        remaining = set(futures)
+        for future in futures:
+            if future.done():
+                remaining.discard(future)
+                yield future
+        while remaining:
+            future = self._receive_one()
+            if future in remaining:
+                remaining.discard(future)
+                yield future
+
+    def _local_function(self):
+        if self.callback:
+            def compose(x):
+                result = self.function(x)
+                self.callback(x, result)
+                return result
+            return compose
+        return self.function
+
+    def _map_strided(self, tasks):
         # distribute tasks to workers
         requests = []
         for i in range(1, self.size):
@@ -82,25 +241,79 @@ class MPIPool(object):
             requests.append(req)
 
         # process local work
+        t0 = time.time()
         results = [None]*len(tasks)
-
-        if self.callback:
-            def compose(x):
-                result = self.function(x)
-                self.callback(x, result)
-                return result
-            results[::self.size] = list(map(compose, tasks[::self.size]))
-        else:
-            results[::self.size] = list(map(self.function, tasks[::self.size]))
+        results[::self.size] = list(map(self._local_function(), tasks[::self.size]))
+        self.busy_time[0] += time.time() - t0
 
         # recover results from workers (in any order)
         status = self.MPI.Status()
         for i in range(self.size-1):
-            result = self.comm.recv(source=self.MPI.ANY_SOURCE,
-                                    status=status)
+            result, busy = self.comm.recv(source=self.MPI.ANY_SOURCE,
+                                          status=status)
             results[status.source::self.size] = result
+            self.busy_time[status.source] += busy
         return results
 
+    def _map_dynamic(self, tasks):
+        ntask = len(tasks)
+        results = [None]*ntask
+        chunks = [range(i, min(i + self.chunksize, ntask))
+                  for i in range(0, ntask, self.chunksize)]
+        chunks.reverse()
+
+        # Each worker has at most one chunk out at a time,
+        # so we know from the source of a result which
+        # tasks it corresponds to.
+        pending = {}
+
+        def send_next(rank):
+            indices = chunks.pop()
+            pending[rank] = indices
+            self.comm.send([tasks[i] for i in indices], dest=rank)
+
+        for rank in range(1, self.size):
+            if not chunks:
+                break
+            send_next(rank)
+
+        status = self.MPI.Status()
+        while pending:
+            result, busy = self.comm.recv(source=self.MPI.ANY_SOURCE, status=status)
+            rank = status.source
+            indices = pending.pop(rank)
+            self.busy_time[rank] += busy
+            for i, r in zip(indices, result):
+                results[i] = r
+            if chunks:
+                send_next(rank)
+        return results
+
+    def reset_timing(self):
+        self.map_time = 0.0
+        self.busy_time = [0.0 for i in range(self.size)]
+
+    def timing_report(self):
+        """
+        Return a list of (rank, busy_time, idle_time) tuples
+        for the time spent in map calls since the last reset.
+        The master in dynamic mode, which just hands out tasks,
+        is included with zero busy time.
+        """
+        return [(rank, busy, max(self.map_time - busy, 0.0))
+                for rank, busy in enumerate(self.busy_time)]
+
+    def print_timing_report(self, stream=None):
+        if stream is None:
+            stream = sys.stdout
+        stream.write("MPI pool ({} schedule) time in map: {:.2f}s\n".format(
+            self.schedule, self.map_time))
+        stream.write("    rank      busy (s)      idle (s)   busy (%)\n")
+        for rank, busy, idle in self.timing_report():
+            frac = 100 * busy / self.map_time if self.map_time else 0.0
+            stream.write("    {:<6d}  {:10.2f}    {:10.2f}    {:6.1f}\n".format(
+                rank, busy, idle, frac))
+
     def gather(self, data, root=0):
         return self.comm.gather(data, root)
 
@@ -117,6 +330,9 @@ class MPIPool(object):
         if self.is_master():
             for i in range(1, self.size):
                 self.comm.isend(_close_pool_message(), dest=i)
+            if self.debug and self.map_time > 0:
+                self.print_timing_report()
+                self.reset_timing()
 
     def __enter__(self):
         return self
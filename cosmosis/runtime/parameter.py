@@ -6,6 +6,7 @@ import random
 from . import config
 from . import prior as priors # to avoid breaking other stuff below
 import numpy as np
+from scipy.special import ndtr, ndtri
 
 
 
@@ -185,22 +186,44 @@ class Parameter(object):
 
 
     def denormalize_from_prior(self, p):
-        u"""Take `p` as a probability, and find the value which has that (cumulated) probability in the prior distribution."""
-        if 0.0 <= p <= 1.0:
-            return self.prior.denormalize_from_prior(p)
-        else:
+        u"""Take `p` as a probability, and find the value which has that (cumulated) probability in the prior distribution.
+
+        `p` may also be an array of probabilities, in which case an
+        array of values is returned.
+
+        """
+        if np.ndim(p) == 0:
+            if 0.0 <= p <= 1.0:
+                return self.prior.denormalize_from_prior(p)
             raise ValueError("parameter value {} for {} not normalized".format(p,self))
+        p = np.asarray(p)
+        bad = (p < 0.0) | (p > 1.0)
+        if bad.any():
+            raise ValueError("parameter value {} for {} not normalized".format(p[bad][0],self))
+        return self.prior.denormalize_from_prior(p)
 
 
 
     def evaluate_prior(self, p):
-        u"""Get the probability of `p` coming from the prior distribution."""
-        if p < self.limits[0] or p > self.limits[1]:
-            return -np.inf
-        elif self.prior:
-            return self.prior(p)
+        u"""Get the probability of `p` coming from the prior distribution.
+
+        `p` may also be an array of values, in which case an array of
+        log-probabilities is returned.
+
+        """
+        if np.ndim(p) == 0:
+            if p < self.limits[0] or p > self.limits[1]:
+                return -np.inf
+            elif self.prior:
+                return self.prior(p)
+            else:
+                return 0.0
+        p = np.asarray(p, dtype=float)
+        if self.prior:
+            logp = self.prior(p)
         else:
-            return 0.0
+            logp = np.zeros_like(p)
+        return np.where((p < self.limits[0]) | (p > self.limits[1]), -np.inf, logp)
 
 
 
@@ -292,6 +315,124 @@ class Parameter(object):
                              (line, error))
 
 
+
+class ParameterArrays(object):
+
+    u"""The limits, starting values and prior types of a list of :class:`Parameter`s, as arrays.
+
+    The pipeline keeps one of these for its varied parameters so that
+    vectors of parameter values, and (N, ndim) batches of them, can be
+    normalized, denormalized and range-checked with NumPy rather than
+    with a loop over the parameters.  It is a snapshot: it must be made
+    again if the parameters or their limits change.
+
+    """
+
+    # Codes for the kinds of prior in `prior_type`.  Those we know how
+    # to invert in bulk are handled here; for any others we call the
+    # prior itself, once per parameter.
+    UNIFORM = 0
+    TRUNCATED_GAUSSIAN = 1
+    OTHER = 2
+
+    def __init__(self, params):
+        u"""Make arrays from the list `params` of :class:`Parameter` objects."""
+        self.params = list(params)
+        self.lower = np.array([param.limits[0] for param in self.params], dtype=float)
+        self.upper = np.array([param.limits[1] for param in self.params], dtype=float)
+        self.width = self.upper - self.lower
+        self.start = np.array([param.start for param in self.params])
+        self.prior_type = np.array([self._prior_type(param.prior) for param in self.params], dtype=int)
+
+        uniform = self.prior_type == self.UNIFORM
+        self.uniform = np.flatnonzero(uniform)
+        self.uniform_a = np.array([self.params[i].prior.a for i in self.uniform], dtype=float)
+        self.uniform_b = np.array([self.params[i].prior.b for i in self.uniform], dtype=float)
+
+        # The truncated Gaussians are inverted in the standardized variable,
+        # mirrored where necessary to stay in the lower tail, as in
+        # :func:`prior.truncated_normal_ppf`.
+        self.gaussian = np.flatnonzero(self.prior_type == self.TRUNCATED_GAUSSIAN)
+        gaussian_priors = [self.params[i].prior for i in self.gaussian]
+        self.gaussian_mu = np.array([pr.mu for pr in gaussian_priors], dtype=float)
+        self.gaussian_sigma = np.array([pr.sigma for pr in gaussian_priors], dtype=float)
+        a = np.array([pr.a for pr in gaussian_priors], dtype=float)
+        b = np.array([pr.b for pr in gaussian_priors], dtype=float)
+        self.gaussian_mirror = a > 0
+        self.gaussian_a = np.where(self.gaussian_mirror, -b, a)
+        self.gaussian_b = np.where(self.gaussian_mirror, -a, b)
+        self.gaussian_phi_a = ndtr(self.gaussian_a)
+        self.gaussian_phi_b = ndtr(self.gaussian_b)
+
+        self.other = np.flatnonzero(self.prior_type == self.OTHER)
+
+    @classmethod
+    def _prior_type(cls, prior):
+        if type(prior) is priors.UniformPrior:
+            return cls.UNIFORM
+        elif type(prior) is priors.TruncatedGaussianPrior:
+            return cls.TRUNCATED_GAUSSIAN
+        return cls.OTHER
+
+    def __len__(self):
+        return len(self.params)
+
+    def in_range(self, p):
+        u"""Return whether every value in `p` is within its limits, or an array of these for an (N, ndim) batch."""
+        p = np.asarray(p, dtype=float)
+        return ((p >= self.lower) & (p <= self.upper)).all(axis=-1)
+
+    def normalize(self, p):
+        u"""Return the relative positions of the values `p` between the limits, as :func:`Parameter.normalize`."""
+        p = np.asarray(p, dtype=float)
+        return (p - self.lower) / self.width
+
+    def denormalize(self, p, raise_exception=True):
+        u"""Return the values at the relative positions `p` between the limits, as :func:`Parameter.denormalize`."""
+        p = np.asarray(p, dtype=float)
+        if raise_exception:
+            self._check_normalized(p)
+        return p * self.width + self.lower
+
+    def denormalize_from_prior(self, p):
+        u"""Return the values with cumulated prior probabilities `p`, as :func:`Parameter.denormalize_from_prior`."""
+        p = np.asarray(p, dtype=float)
+        self._check_normalized(p)
+        x = np.empty_like(p)
+
+        i = self.uniform
+        x[..., i] = p[..., i] * (self.uniform_b - self.uniform_a) + self.uniform_a
+
+        i = self.gaussian
+        if i.size:
+            mirror = self.gaussian_mirror
+            y = np.where(mirror, 1.0 - p[..., i], p[..., i])
+            z = ndtri(self.gaussian_phi_a + y * (self.gaussian_phi_b - self.gaussian_phi_a))
+            z = np.clip(z, self.gaussian_a, self.gaussian_b)
+            x[..., i] = np.where(mirror, -z, z) * self.gaussian_sigma + self.gaussian_mu
+
+        for i in self.other:
+            x[..., i] = self.params[i].prior.denormalize_from_prior(p[..., i])
+
+        return x
+
+    def _check_normalized(self, p):
+        # Values outside [0, 1], including NaNs, are an error
+        bad = ~((p >= 0.0) & (p <= 1.0))
+        if bad.any():
+            index = np.argwhere(bad)[0]
+            raise ValueError("parameter value {} for {} not normalized".format(
+                p[tuple(index)], self.params[index[-1]]))
+
+    def normalize_matrix(self, c):
+        u"""Divide each element c[i, j] of a covariance matrix of the parameters by the product of the widths of i and j."""
+        return np.asarray(c) / np.outer(self.width, self.width)
+
+    def denormalize_matrix(self, c):
+        u"""Perform the inverse operation to :func:`normalize_matrix`."""
+        return np.asarray(c) * np.outer(self.width, self.width)
+
+
 def register_new_parameter(options,
                            section,
                            name,
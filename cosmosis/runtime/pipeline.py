@@ -10,7 +10,6 @@ import string
 import numpy as np
 import time
 import collections
-import warnings
 import configparser
 import traceback
 import signal
@@ -19,6 +18,8 @@ from . import config
 from . import parameter
 from . import prior
 from . import module
+from .block_cache import BlockCache, hash_block_values
+from .module_stats import PipelineStats
 from ..datablock.cosmosis_py import block, section_names
 try:
     import faulthandler
@@ -69,59 +70,37 @@ class MissingLikelihoodError(Exception):
         self.pipeline_data = data
 
 
-class LimitedSizeDict(collections.OrderedDict):
-    "From http://stackoverflow.com/questions/2437617/limiting-the-size-of-a-python-dictionary"
-    def __init__(self, *args, **kwds):
-        self.size_limit = kwds.pop("size_limit", None)
-        collections.OrderedDict.__init__(self, *args, **kwds)
-        self._check_size_limit()
-
-    def __setitem__(self, key, value):
-        collections.OrderedDict.__setitem__(self, key, value)
-        self._check_size_limit()
-
-    def _check_size_limit(self):
-        if self.size_limit is not None:
-            while len(self) > self.size_limit:
-                self.popitem(last=False)
-
-
 class SlowSubspaceCache(object):
     """
     This tool analyzes pipelines to determine which of their parameters
     are fast and which are slow, and then caches the results of new sets
     of slow parameters so that if only fast parameters have changed the 
     pipeline can be much faster.
+
+    The cached blocks are kept in a :class:`BlockCache`, in memory up to
+    `cache_mb` megabytes, and also on disk if `cache_dir` is set.  They are
+    keyed by a hash of all the non-fast inputs and of the `context` string,
+    which should describe the pipeline configuration, so that entries on
+    disk can be shared between processes and re-used in later runs.
     """
-    def __init__(self, first_fast_module=None, cache_size_limit=3,):
-        self.current_hash = np.nan
+    def __init__(self, first_fast_module=None, cache_mb=256.0, cache_dir=None, context=""):
+        self.current_hash = None
         self.analyzed = False
-        self.cache = LimitedSizeDict(size_limit=cache_size_limit)
+        self.cache = BlockCache(int(cache_mb * 1e6), directory=cache_dir)
         self.first_fast_module = first_fast_module
+        self.context = context
 
     def clear_cache(self):
         self.cache.clear()
-        self.current_hash = np.nan
+        self.current_hash = None
 
     def hash_slow_parameters(self, block):
         """This is not a general block hash! 
-        It just looks at the slow parameters.
+        It just looks at the input parameters, other than the fast ones.
         """
-        pairs = block.keys()
-        pairs.sort()
-        values = []
-        for section,name in pairs:
-            if (section,name) not in self.slow_params:
-                continue
-            value = block[section, name]
-            if not np.isscalar(value):
-                #non-scalar in the block - this must
-                #reflect some feature not coded yet
-                warnings.warn("Vector parameter(s) in the input means that fast-slow split will not work - this can be fixed - please open an issue if it affects you.  Or set fast_slow=F")
-                return np.nan # 
-            values.append(value)
-        values = tuple(values)
-        return hash(values)
+        items = [(section, name, value) for (section, name), value in sorted(block.items())
+                 if (section, name) not in self.fast_params]
+        return hash_block_values(items, self.context)
 
     def start_pipeline(self, initial_block):
         # We may be in the process of analyzing the pipeline
@@ -138,9 +117,7 @@ class SlowSubspaceCache(object):
             # Now we need to use the old cached results in the new block.
             # We put everything from the old block into the new block,
             # EXCEPT for the fast parameters themselves.
-            for section,name in cached.keys():
-                if (section,name) not in self.fast_params:
-                    initial_block[section,name] = cached[section,name]
+            initial_block.merge(cached, exclude=self.fast_params)
             first_module = self.split_index
         return first_module
 
@@ -151,7 +128,10 @@ class SlowSubspaceCache(object):
         if module_index != self.split_index-1:
             return
 
-        self.cache[self.current_hash] = block.clone()
+        self.cache.put(self.current_hash, block.clone())
+
+    def report(self):
+        self.cache.report(title="Fast/slow cache")
 
     def analyze_pipeline(self, pipeline, all_params=False, grid=False):
         """
@@ -311,6 +291,116 @@ class SlowSubspaceCache(object):
         return index
 
 
+class ModuleMemoizer(object):
+    """
+    This tool caches the outputs of every module in a pipeline, keyed
+    by a hash of the inputs that the module read, so that any module
+    whose inputs are the same as in an earlier run can be skipped and
+    its outputs restored from the cache instead.
+
+    The inputs and outputs of each module are read from the block access
+    log each time the module runs.  So modules must only depend on
+    the values they read from the block, and not for example on a
+    random number generator or on state kept between runs.  Modules which
+    delete, clear, or copy sections are never skipped.
+    """
+    input_log_types = ("READ-OK", "READ-FAIL", "READ-DEFAULT")
+    output_log_types = ("WRITE-OK", "REPLACE-OK")
+    ignored_log_types = ("WRITE-FAIL", "REPLACE-FAIL", "MODULE-START")
+
+    def __init__(self, modules, cache_mb=256.0, cache_dir=None, context=""):
+        self.module_names = [m.name for m in modules]
+        self.context = context
+        self.cache = BlockCache(int(cache_mb * 1e6), directory=cache_dir)
+        # The keys each module read the last time it ran,
+        # or None if that is not yet known or the module
+        # cannot be memoized.
+        self.inputs = [None for m in modules]
+        self.memoizable = [True for m in modules]
+        self.skips = [0 for m in modules]
+
+    def clear_cache(self):
+        self.cache.clear()
+
+    def input_hash(self, module_index, block):
+        """Hash the current values of the inputs to the given module,
+        or return None if we do not know what they are.
+        """
+        keys = self.inputs[module_index]
+        if keys is None or not self.memoizable[module_index]:
+            return None
+        items = []
+        for section, name in keys:
+            if block.has_value(section, name):
+                items.append((section, name, block[section, name]))
+            else:
+                # Missing values are also inputs - the module
+                # might use a default in place of them.
+                items.append(("\0missing", section + "\0" + name, 0))
+        context = "{}\0{}\0{}".format(self.context, module_index, self.module_names[module_index])
+        return hash_block_values(items, context)
+
+    def restore(self, module_index, key, block):
+        """Copy the cached outputs for the inputs with hash key into the block.
+        Returns True if there were any, and False otherwise.
+        """
+        if key is None:
+            return False
+        outputs = self.cache.get(key)
+        if outputs is None:
+            return False
+        block.merge(outputs)
+        self.skips[module_index] += 1
+        return True
+
+    def record(self, module_index, key, data, log_start):
+        """Work out the inputs and outputs of a module that has just run
+        from the log entries after log_start, and cache the outputs.
+
+        The key should be the hash of the inputs from before the module ran.
+        """
+        inputs = set()
+        outputs = []
+        for log_type, section, name, _ in data.get_log(log_start):
+            pair = (section.lower(), name.lower())
+            if log_type in self.input_log_types:
+                # Values the module wrote itself are not inputs
+                if pair not in outputs:
+                    inputs.add(pair)
+            elif log_type in self.output_log_types:
+                if pair not in outputs:
+                    outputs.append(pair)
+            elif log_type not in self.ignored_log_types:
+                self.memoizable[module_index] = False
+                return
+
+        inputs = sorted(inputs)
+        if inputs != self.inputs[module_index]:
+            self.inputs[module_index] = inputs
+            # The key we were given was for a different set of inputs.
+            # If the module did not change any of its inputs then
+            # the values now in the block are the ones it read.
+            if set(inputs).intersection(outputs):
+                return
+            key = self.input_hash(module_index, data)
+
+        if key is None:
+            return
+
+        cached = block.DataBlock()
+        cached.set_log_level("off")
+        for section, name in outputs:
+            cached[section, name] = data[section, name]
+        self.cache.put(key, cached)
+
+    def report(self):
+        if self.cache.hits + self.cache.disk_hits + self.cache.misses == 0:
+            return
+        self.cache.report(title="Module cache")
+        for name, skips in zip(self.module_names, self.skips):
+            sys.stdout.write("    {}: skipped {} times\n".format(name, skips))
+
+
 class Pipeline(object):
 
     u"""A container of :class:`DataBlock`-processing :class:`Module`ʼs.
@@ -368,7 +458,29 @@ class Pipeline(object):
         if self.do_fast_slow and shortcut:
             sys.stderr.write("Warning: you have the fast_slow and shortcut options both set, and we can only do one of those at once (we will do shortcut)\n")
             self.do_fast_slow = False
+        self.do_memoize = self.options.getboolean(PIPELINE_INI_SECTION, "memoize", fallback=False)
+        if self.do_memoize and shortcut:
+            sys.stderr.write("Warning: you have the memoize and shortcut options both set, and we can only do one of those at once (we will do shortcut)\n")
+            self.do_memoize = False
+        if self.do_memoize and self.do_fast_slow:
+            sys.stderr.write("Warning: you have the memoize and fast_slow options both set; memoize already skips any unchanged slow modules so we will not also do fast_slow\n")
+            self.do_fast_slow = False
+
+        # How much of the access log to keep in each block.  Memoizing
+        # needs the full log to see all the inputs to each module, and
+        # fast/slow splitting needs at least the first use of each parameter.
+        self.log_level = self.options.get(PIPELINE_INI_SECTION, "access_log", fallback="full")
+        if self.log_level not in block.LOG_LEVELS:
+            raise ValueError("The access_log option in [pipeline] should be one of: {}".format(", ".join(block.LOG_LEVELS)))
+        if self.do_memoize and self.log_level != "full":
+            sys.stderr.write("Warning: memoize needs the full access log, so ignoring access_log={}\n".format(self.log_level))
+            self.log_level = "full"
+        if self.do_fast_slow and self.log_level == "off":
+            sys.stderr.write("Warning: fast_slow needs the access log, so using access_log=first-use\n")
+            self.log_level = "first-use"
+
         self.slow_subspace_cache = None #until set in method
+        self.module_memoizer = None
         self.first_fast_module = self.options.get(PIPELINE_INI_SECTION, "first_fast_module", fallback="")
 
         # initialize modules
@@ -408,6 +520,26 @@ class Pipeline(object):
             self.shortcut_module=0
             self.shortcut_data=None
 
+        if self.do_memoize:
+            cache_mb = self.options.getfloat(PIPELINE_INI_SECTION, "memoize_cache_mb", fallback=256.0)
+            cache_dir = self.options.get(PIPELINE_INI_SECTION, "memoize_cache_dir", fallback="")
+            self.module_memoizer = ModuleMemoizer(self.modules, cache_mb=cache_mb,
+                cache_dir=cache_dir or None, context=self.configuration_digest())
+
+        # Statistics on the time taken by each module are always collected.
+        # If module_stats is set they are saved to that file at the end
+        # of the run, or whenever the process gets a SIGUSR1 signal.
+        # Forked workers only pass theirs back if they will be reported.
+        self.module_stats_file = self.options.get(PIPELINE_INI_SECTION, "module_stats", fallback="")
+        self.module_stats = PipelineStats([module.name for module in self.modules],
+            spool_workers=bool(self.module_stats_file or self.timing))
+        if self.module_stats_file and hasattr(signal, "SIGUSR1"):
+            try:
+                signal.signal(signal.SIGUSR1, self._module_stats_signal_handler)
+            except ValueError:
+                # We can only set signal handlers in the main thread
+                pass
+
 
 
     def find_module_file(self, path):
@@ -474,7 +606,11 @@ class Pipeline(object):
             else:
                 first_fast_index = None
 
-            self.slow_subspace_cache = SlowSubspaceCache(first_fast_module=first_fast_index)
+            cache_mb = self.options.getfloat(PIPELINE_INI_SECTION, "fast_slow_cache_mb", fallback=256.0)
+            cache_dir = self.options.get(PIPELINE_INI_SECTION, "fast_slow_cache_dir", fallback="")
+            self.slow_subspace_cache = SlowSubspaceCache(first_fast_module=first_fast_index,
+                cache_mb=cache_mb, cache_dir=cache_dir or None,
+                context=self.configuration_digest())
             self.slow_subspace_cache.analyze_pipeline(self, all_params=all_params, grid=grid)
 
             if not self.slow_subspace_cache.worth_splitting:
@@ -506,10 +642,55 @@ class Pipeline(object):
             self.slow_subspace_cache = None
 
 
+    def configuration_digest(self):
+        u"""Return a hash of the list of modules and their configuration options.
+
+        This is used to label cached results on disk so that they are
+        not picked up by runs with a different set-up.
+
+        """
+        sections = [module.name for module in self.modules]
+        sections += self.options.get("runtime", "global", fallback="").split()
+        items = [("module", str(i), module.name) for i, module in enumerate(self.modules)]
+        items += [(section, name, value) for (section, name), value in sorted(self.options)
+                  if section in sections]
+        return hash_block_values(items)
+
+    def write_module_stats(self, pool=None):
+        u"""Combine the module statistics from all the processes and save them.
+
+        The statistics are saved to the file set in the `module_stats`
+        option, if there is one, and if `timing` is set a summary is
+        printed.  Under MPI this must be called by every process.
+
+        """
+        if not (self.module_stats_file or self.timing):
+            # Still clear up anything spooled by finished workers
+            self.module_stats.collect_workers()
+            return
+        if not self.module_stats.gather(pool):
+            return
+        if self.module_stats_file:
+            self.module_stats.write(self.module_stats_file)
+        if self.timing:
+            self.module_stats.report()
+
+    def _module_stats_signal_handler(self, signum, frame):
+        # Forked workers inherit the handler, but only the process
+        # that made the pipeline writes the report
+        if os.getpid() == self.module_stats.owner_pid:
+            self.module_stats.collect_workers()
+            self.module_stats.write(self.module_stats_file)
+
     def cleanup(self):
         u"""Call every `module`ʼs `cleanup` method."""
         for module in self.modules:
             module.cleanup()
+        if self.slow_subspace_cache is not None:
+            self.slow_subspace_cache.report()
+        if self.module_memoizer is not None:
+            self.module_memoizer.report()
+        self.module_stats.close()
 
 
 
@@ -547,7 +728,7 @@ class Pipeline(object):
         # D = pydot.Cluster(label="Data", color='red', style='dashed')
         # G.add_subgraph(D)
         # #find
-        log = [data.get_log_entry(i) for i in range(data.get_log_count())]
+        log = data.get_log()
         for entry in log:
             if entry!="MODULE-START":
                 section = entry[1]
@@ -603,10 +784,7 @@ class Pipeline(object):
                 first_module = 0
             else:
                 first_module = self.shortcut_module
-                existing_keys = set(data_package.keys())
-                for (sec, name) in self.shortcut_data.keys():
-                    if (sec,name) not in existing_keys:
-                        data_package[sec, name] = self.shortcut_data[sec,name]
+                data_package.merge(self.shortcut_data, replace=False)
         elif self.slow_subspace_cache:
             first_module = self.slow_subspace_cache.start_pipeline(data_package)
             if first_module != 0 and (self.debug or self.timing):
@@ -616,7 +794,7 @@ class Pipeline(object):
             first_module = 0
 
         if self.timing:
-            start_time = time.time()
+            start_time = time.perf_counter()
 
         for module_number, module in enumerate(modules):
             if module_number<first_module:
@@ -625,40 +803,35 @@ class Pipeline(object):
                 sys.stdout.write("Running %.20s ...\n" % module)
                 sys.stdout.flush()
             data_package.log_access("MODULE-START", module.name, "")
-            if self.timing:
-                t1 = time.time()
-
-            status = module.execute(data_package)
+            stats = self.module_stats[module_number]
+            t1 = time.perf_counter()
+
+            if self.module_memoizer:
+                memo_key = self.module_memoizer.input_hash(module_number, data_package)
+                if self.module_memoizer.restore(module_number, memo_key, data_package):
+                    status = 0
+                    stats.cached += 1
+                else:
+                    log_start = data_package.get_log_count()
+                    status = self._execute_module(module, stats, data_package)
+                    if status == 0:
+                        self.module_memoizer.record(module_number, memo_key, data_package, log_start)
+            else:
+                status = self._execute_module(module, stats, data_package)
 
-            if status is None:
-                raise ValueError(("A module you ran, '{}', did not return a proper status value.\n"+
-                    "It should return an integer, 0 if everything worked.\n"+
-                    "Sorry to be picky but this kind of thing is important.").format(module))
+            self._check_status(module, status)
 
             if self.debug:
                 sys.stdout.write("Done %.20s status = %d \n" % (module,status))
                 sys.stdout.flush()
 
             if self.timing:
-                t2 = time.time()
+                t2 = time.perf_counter()
                 timings.append(t2-t1)
                 sys.stdout.write("%s took: %.3f seconds\n"% (module,t2-t1))
 
             if status:
-                if self.debug:
-                    data_package.print_log()
-                    sys.stdout.flush()
-                    sys.stderr.write("Because you set debug=True I printed a log of "
-                                     "all access to data printed above.\n"
-                                     "Look for the word 'FAIL' \n")
-                    sys.stderr.write("Though the error message could also be somewhere above that.\n\n")
-                if not self.quiet:
-                    sys.stderr.write("Error running pipeline (%d)- "
-                                     "hopefully printed above here.\n"%status)
-                    sys.stderr.write("Aborting this run and returning "
-                                     "error status.\n")
-                    if not self.debug:
-                        sys.stderr.write("Setting debug=T in [pipeline] might help.\n")
+                self._report_failure(data_package, status)
                 return None
 
             # If we are using a fast/slow split (and we are not already running on a cached subset)
@@ -672,7 +845,7 @@ class Pipeline(object):
                 self.shortcut_data = data_package.clone()
 
         if self.timing:
-            end_time = time.time()
+            end_time = time.perf_counter()
             sys.stdout.write("Total pipeline time: {:.3} seconds\n".format(end_time-start_time))
             self.timings = timings
 
@@ -684,8 +857,142 @@ class Pipeline(object):
         self.has_run = True
         return True
 
+    def run_batch(self, data_packages):
+        u"""Run every module, in sequence, on each of the list of DataBlocks `data_packages`.
+
+        The result is the same as calling :func:`run` on each block, and
+        a list of True or None is returned in the same way, but each
+        module is run on all the blocks at once with
+        :func:`Module.execute_batch`, so modules that can vectorise over
+        their inputs can process the whole batch in one call.  Blocks on
+        which a module fails are not passed to any later modules.
+
+        Module caching, fast/slow splits and short-cuts work block by
+        block, so if any of them is in use this just calls :func:`run` on
+        each block in turn.
+
+        """
+        if self.shortcut_module or self.slow_subspace_cache or self.module_memoizer:
+            return [self.run(data_package) for data_package in data_packages]
+
+        if self.timing:
+            self.timings = None
+            start_time = time.perf_counter()
+
+        timings = []
+        # The indices of the blocks that have not failed yet
+        running = list(range(len(data_packages)))
+
+        for module_number, module in enumerate(self.modules):
+            if not running:
+                break
+            blocks = [data_packages[i] for i in running]
+            if self.debug:
+                sys.stdout.write("Running %.20s on %d blocks ...\n" % (module, len(blocks)))
+                sys.stdout.flush()
+            for data_package in blocks:
+                data_package.log_access("MODULE-START", module.name, "")
+            stats = self.module_stats[module_number]
+            t1 = time.perf_counter()
+
+            statuses = self._execute_module_batch(module, stats, blocks)
+            for status in statuses:
+                self._check_status(module, status)
+
+            if self.debug:
+                sys.stdout.write("Done %.20s, %d failures\n" % (module, sum(1 for status in statuses if status)))
+                sys.stdout.flush()
+
+            if self.timing:
+                t2 = time.perf_counter()
+                timings.append(t2-t1)
+                sys.stdout.write("%s took: %.3f seconds for %d blocks\n"% (module, t2-t1, len(blocks)))
+
+            for data_package, status in zip(blocks, statuses):
+                if status:
+                    self._report_failure(data_package, status)
+            running = [i for i, status in zip(running, statuses) if not status]
+
+        if self.timing:
+            end_time = time.perf_counter()
+            sys.stdout.write("Total pipeline time: {:.3} seconds\n".format(end_time-start_time))
+            self.timings = timings
+
+        for i in running:
+            data_packages[i].log_access("MODULE-START", "Results", "")
+
+        if running:
+            if not self.quiet:
+                sys.stdout.write("Pipeline ran okay on {} of {} blocks.\n".format(len(running), len(data_packages)))
+            self.has_run = True
+
+        running = set(running)
+        return [True if i in running else None for i in range(len(data_packages))]
+
+    @staticmethod
+    def _check_status(module, status):
+        if status is None:
+            raise ValueError(("A module you ran, '{}', did not return a proper status value.\n"+
+                "It should return an integer, 0 if everything worked.\n"+
+                "Sorry to be picky but this kind of thing is important.").format(module))
+
+    def _report_failure(self, data_package, status):
+        if self.debug:
+            data_package.print_log()
+            sys.stdout.flush()
+            sys.stderr.write("Because you set debug=True I printed a log of "
+                             "all access to data printed above.\n"
+                             "Look for the word 'FAIL' \n")
+            sys.stderr.write("Though the error message could also be somewhere above that.\n\n")
+        if not self.quiet:
+            sys.stderr.write("Error running pipeline (%d)- "
+                             "hopefully printed above here.\n"%status)
+            sys.stderr.write("Aborting this run and returning "
+                             "error status.\n")
+            if not self.debug:
+                sys.stderr.write("Setting debug=T in [pipeline] might help.\n")
+
+    @staticmethod
+    def _execute_module_batch(module, stats, data_packages):
+        # Run the module on a batch of blocks.  The time is shared out
+        # equally between them in the statistics.
+        bytes_start = [data_package.get_bytes_accessed() for data_package in data_packages]
+        t1 = time.perf_counter()
+        try:
+            statuses = module.execute_batch(data_packages)
+        except:
+            dt = (time.perf_counter() - t1) / len(data_packages)
+            for data_package in data_packages:
+                stats.record(dt, failed=True)
+            raise
+        dt = (time.perf_counter() - t1) / len(data_packages)
+        for data_package, status, (read_start, written_start) in zip(data_packages, statuses, bytes_start):
+            read_end, written_end = data_package.get_bytes_accessed()
+            stats.record(dt, failed=bool(status), bytes_read=read_end - read_start,
+                         bytes_written=written_end - written_start)
+        return statuses
+
+    @staticmethod
+    def _execute_module(module, stats, data_package):
+        # Run the module and record its statistics
+        read_start, written_start = data_package.get_bytes_accessed()
+        t1 = time.perf_counter()
+        try:
+            status = module.execute(data_package)
+        except:
+            stats.record(time.perf_counter() - t1, failed=True)
+            raise
+        t2 = time.perf_counter()
+        read_end, written_end = data_package.get_bytes_accessed()
+        stats.record(t2 - t1, failed=bool(status), bytes_read=read_end - read_start,
+                     bytes_written=written_end - written_start)
+        return status
+
     def clear_cache(self):
-        self.slow_subspace_cache.clear_cache()
+        if self.slow_subspace_cache:
+            self.slow_subspace_cache.clear_cache()
+        if self.module_memoizer:
+            self.module_memoizer.clear_cache()
 
 
 
@@ -721,6 +1028,8 @@ class LikelihoodPipeline(Pipeline):
     # register_new_parameter function.
     pipeline_being_set_up = []
     module_being_set_up = []
+    # Array versions of the varied parameter limits, see varied_arrays
+    _varied_arrays = None
 
     def __init__(self, arg=None, id="", override=None, modules=None, load=True, values=None, priors=None, only=None):
         u"""Construct a :class:`LikelihoodPipeline`.
@@ -857,7 +1166,20 @@ class LikelihoodPipeline(Pipeline):
                              if param.is_fixed()]
         self.nvaried = len(self.varied_params)
         self.nfixed = len(self.fixed_params)
+        self._varied_arrays = None
+
+
+
+    def varied_arrays(self):
+        u"""Return a :class:`parameter.ParameterArrays` for the varied parameters.
+
+        It is made the first time it is needed after the varied parameters
+        change, through :func:`set_varied` or :func:`set_fixed`.
 
+        """
+        if self._varied_arrays is None:
+            self._varied_arrays = parameter.ParameterArrays(self.varied_params)
+        return self._varied_arrays
 
 
     def parameter_index(self, section, name):
@@ -920,9 +1242,14 @@ class LikelihoodPipeline(Pipeline):
 
 
     def is_out_of_range(self, p):
-        u"""Determine if any parameter is not in its allowed range."""
-        return any([not param.in_range(x) for
-                    param, x in zip(self.varied_params, p)])
+        u"""Determine if any parameter is not in its allowed range.
+
+        `p` may also be an (N, ndim) array of N points, in which case
+        an array of N booleans is returned.
+
+        """
+        out = ~self.varied_arrays().in_range(p)
+        return bool(out) if out.ndim == 0 else out
 
 
 
@@ -932,9 +1259,11 @@ class LikelihoodPipeline(Pipeline):
     
         Use denormalize_vector_from_prior to convert according to the prior instead.
 
+        `p` may also be an (N, ndim) array of N points, in which case
+        an array of the same shape is returned.
+
         """
-        return np.array([param.denormalize(x, raise_exception) for param, x
-                         in zip(self.varied_params, p)])
+        return self.varied_arrays().denormalize(p, raise_exception)
 
 
 
@@ -945,17 +1274,23 @@ class LikelihoodPipeline(Pipeline):
         i.e. 
         v -> x  such that \int_{-inf}^{x} p(x') dx' = v
 
+        `p` may also be an (N, ndim) array of N points, in which case
+        an array of the same shape is returned.
+
         """
-        return np.array([param.denormalize_from_prior(x) for param, x
-                         in zip(self.varied_params, p)])
+        return self.varied_arrays().denormalize_from_prior(p)
 
 
 
     def normalize_vector(self, p):
         u"""Convert an array of parameter values, one for each varied parameter,
-         into a normalized form all in the range [0.0,1.0] using only the lower and upper limits for each parameter."""
-        return np.array([param.normalize(x) for param, x
-                         in zip(self.varied_params, p)])
+         into a normalized form all in the range [0.0,1.0] using only the lower and upper limits for each parameter.
+
+        `p` may also be an (N, ndim) array of N points, in which case
+        an array of the same shape is returned.
+
+        """
+        return self.varied_arrays().normalize(p)
 
 
 
@@ -969,17 +1304,9 @@ class LikelihoodPipeline(Pipeline):
         upper limits on the variates.
 
         """
-        c = c.copy()
         n = c.shape[0]
         assert n==c.shape[1], "Cannot normalize a non-square matrix"
-        for i in range(n):
-            pi = self.varied_params[i]
-            ri = pi.limits[1] - pi.limits[0]
-            for j in range(n):
-                pj = self.varied_params[j]
-                rj = pj.limits[1] - pj.limits[0]
-                c[i,j] /= (ri*rj)
-        return c
+        return self.varied_arrays().normalize_matrix(c)
 
 
 
@@ -990,20 +1317,11 @@ class LikelihoodPipeline(Pipeline):
         as the function above, i.e. it *normalizes* the matrix.
 
         """
-        c = c.copy()
         n = c.shape[0]
         assert n==c.shape[1], "Cannot normalize a non-square matrix"
-        for i in range(n):
-            pi = self.varied_params[i]
-            ri = pi.limits[1] - pi.limits[0]
-            for j in range(n):
-                pj = self.varied_params[j]
-                rj = pj.limits[1] - pj.limits[0]
-                if inverse:
-                    c[i,j] /= (ri*rj)
-                else:
-                    c[i,j] *= (ri*rj)
-        return c
+        if inverse:
+            return self.varied_arrays().normalize_matrix(c)
+        return self.varied_arrays().denormalize_matrix(c)
 
 
 
@@ -1019,8 +1337,10 @@ class LikelihoodPipeline(Pipeline):
         """
         if all_params:
             p = [param.start for param in self.parameters]
-        else:            
-            p =[param.start for param in self.varied_params]
+        elif as_array:
+            return self.varied_arrays().start.copy()
+        else:
+            p = [param.start for param in self.varied_params]
         if as_array:
             p = np.array(p)
         return p
@@ -1039,8 +1359,7 @@ class LikelihoodPipeline(Pipeline):
             return np.array([param.limits[0] for
                  param in self.parameters])
         else:
-            return np.array([param.limits[0] for
-                         param in self.varied_params])
+            return self.varied_arrays().lower.copy()
 
 
 
@@ -1056,8 +1375,7 @@ class LikelihoodPipeline(Pipeline):
             return np.array([param.limits[1] for
                  param in self.parameters])
         else:
-            return np.array([param.limits[1] for
-                         param in self.varied_params])
+            return self.varied_arrays().upper.copy()
 
     def build_starting_block(self, p, check_ranges=False, all_params=False):
         u"""Assemble :class:`DataBlock` data based on parameter values in `p`, and return it.
@@ -1077,22 +1395,36 @@ class LikelihoodPipeline(Pipeline):
                 return None
 
         data = block.DataBlock()
+        data.set_log_level(self.log_level)
 
         if all_params:
-            for param, x in zip(self.parameters, p):
-                data[param.section, param.name] = x
+            data.put_many(self._parameter_handles(self.parameters), p)
         else:
             # add varied parameters
-            for param, x in zip(self.varied_params, p):
-                data[param.section, param.name] = x
+            data.put_many(self._parameter_handles(self.varied_params), p)
 
             # add fixed parameters
-            for param in self.fixed_params:
-                data[param.section, param.name] = param.start
+            data.put_many(self._parameter_handles(self.fixed_params),
+                          [param.start for param in self.fixed_params])
 
         return data
 
 
+    def _parameter_handles(self, params):
+        # The block handles for a list of parameters, computed once per
+        # list.  Modules can add new parameters to the lists, so we
+        # check the length as well as the identity of the list.
+        try:
+            cache = self._handle_cache
+        except AttributeError:
+            cache = self._handle_cache = {}
+        cached = cache.get(id(params))
+        if cached is None or cached[0] is not params or cached[1] != len(params):
+            handles = block.DataBlock.handles([(param.section, param.name) for param in params])
+            cached = cache[id(params)] = (params, len(params), handles)
+        return cached[2]
+
+
     def run_parameters(self, p, check_ranges=False, all_params=False):
         u"""Assemble :class:`DataBlock` data based on parameter values in `p`, and run the pipeline on those data.
 
@@ -1155,11 +1487,38 @@ class LikelihoodPipeline(Pipeline):
             params = self.parameters
         else:
             params = self.varied_params
-        priors = [(str(param),param.evaluate_prior(x)) for param,x in zip(params,p)]
+        priors = [param.evaluate_prior(x) for param,x in zip(params,p)]
+        if total_only:
+            return sum(priors)
+        else:
+            return [(str(param), pr) for param, pr in zip(params, priors)]
+
+    def prior_batch(self, P, all_params=False, total_only=True):
+        u"""Compute the prior probabilities for a whole batch of points at once.
+
+        The array `P` should have shape (N, ndim), where each of the N rows
+        is a point like the argument to :func:`prior`.  The work is done one
+        parameter at a time over all the points, rather than point by point.
+
+        If `total_only` is `True` (the default), then an array of the N
+        total log-priors is returned.  Otherwise a list of pairs is returned,
+        with each element a stringified version of the parameter name, and
+        an array of its N log-priors.
+
+        """
+        if all_params:
+            params = self.parameters
+        else:
+            params = self.varied_params
+        P = np.atleast_2d(np.asarray(P, dtype=float))
+        if P.shape[1] != len(params):
+            raise ValueError("Prior batch has {} parameters per point but "
+                             "{} were expected".format(P.shape[1], len(params)))
+        priors = [param.evaluate_prior(x) for param, x in zip(params, P.T)]
         if total_only:
-            return sum(pr[1] for pr in priors)
+            return np.sum(priors, axis=0) if priors else np.zeros(len(P))
         else:
-            return priors
+            return [(str(param), pr) for param, pr in zip(params, priors)]
 
     def run_results(self, p, all_params=False):
         u"""Run the pipeline on the given parameters and get a results object.
@@ -1190,8 +1549,9 @@ class LikelihoodPipeline(Pipeline):
         """
         r = PipelineResults(p, self.number_extra)
 
-        priors = self.prior(p, all_params=all_params, total_only=False)
-        r.prior = sum(pr[1] for pr in priors)
+        params = self.parameters if all_params else self.varied_params
+        priors = [param.evaluate_prior(x) for param, x in zip(params, p)]
+        r.prior = sum(priors)
 
         if np.isnan(r.prior):
             r.prior = -np.inf
@@ -1205,20 +1565,11 @@ class LikelihoodPipeline(Pipeline):
             r.set_like(like)
 
             if r.block is not None:
-                for name,pr in priors:
-                    r.block["priors", name] = pr
+                for param, pr in zip(params, priors):
+                    r.block["priors", str(param)] = pr
 
         except Exception:
-            if self.debug:
-                sys.stderr.write("\n\nERROR: there was an exception running the likelihood:\n")
-                sys.stderr.write("\nBecause you have debug=T I will let this kill the chain.\n")
-                sys.stderr.write("The input parameters were:{}\n".format(repr(p)))
-                raise
-
-            sys.stderr.write("\n\nERROR: there was an exception running the likelihood:\n")
-            sys.stderr.write("The input parameters were:{}\n".format(repr(p)))
-            traceback.print_exc(file=sys.stderr)
-            sys.stderr.write("You should fix this but for now I will return NaN for the likelihood (because you have debug=F)\n\n")
+            self._report_exception(p)
 
         if np.isnan(r.post):
             r.post = -np.inf
@@ -1228,6 +1579,92 @@ class LikelihoodPipeline(Pipeline):
 
         return r
 
+    def run_results_batch(self, P, all_params=False):
+        u"""Run the pipeline on a batch of parameter vectors and get a list of results objects.
+
+        The argument `P` has one row per point, each like the argument to
+        :func:`run_results`, and a list of the same `PipelineResults`
+        objects that it would give is returned.
+
+        The pipeline is run with :func:`Pipeline.run_batch`, so modules
+        that define an /execute_batch/ function are given all the points
+        at once.  If a batch raises an exception then, since we cannot
+        tell which point caused it, the points are run again one by one
+        (unless debug is set, in which case the exception is raised).
+
+        """
+        P = np.atleast_2d(np.asarray(P, dtype=float))
+        results = [PipelineResults(p, self.number_extra) for p in P]
+        if len(P) == 0:
+            return results
+
+        priors = self.prior_batch(P, all_params=all_params, total_only=False)
+        total_priors = np.sum([pr for _, pr in priors], axis=0) if priors else np.zeros(len(P))
+        total_priors[np.isnan(total_priors)] = -np.inf
+        for r, prior in zip(results, total_priors):
+            r.prior = prior
+
+        indices = np.where(np.isfinite(total_priors))[0]
+        if not self.quiet:
+            for i in range(len(P) - len(indices)):
+                print("Proposed outside bounds: prior -infinity")
+        if len(indices) == 0:
+            return results
+
+        blocks = [self.build_starting_block(P[i], all_params=all_params) for i in indices]
+        try:
+            statuses = self.run_batch(blocks)
+        except Exception:
+            if self.debug:
+                sys.stderr.write("\n\nERROR: there was an exception running a batch of likelihoods:\n")
+                sys.stderr.write("\nBecause you have debug=T I will let this kill the chain.\n")
+                raise
+            sys.stderr.write("\n\nERROR: there was an exception running a batch of likelihoods.\n")
+            traceback.print_exc(file=sys.stderr)
+            sys.stderr.write("I will run the points one at a time instead.\n\n")
+            for i in indices:
+                results[i] = self.run_results(P[i], all_params=all_params)
+            return results
+
+        for i, data, status in zip(indices, blocks, statuses):
+            r = results[i]
+            if not status:
+                sys.stderr.write("Pipeline failed on these parameters: {}\n".format(r.vector))
+                r.set_like(-np.inf)
+                continue
+
+            try:
+                if self.likelihood_names == NO_LIKELIHOOD_NAMES:
+                    self._set_likelihood_names_from_block(data)
+                like, r.extra = self._likelihood_from_block(data)
+                r.block = data
+                r.set_like(like)
+                for name, pr in priors:
+                    data["priors", name] = pr[i]
+            except Exception:
+                self._report_exception(r.vector)
+
+            if np.isnan(r.post):
+                r.post = -np.inf
+
+            if np.isnan(r.like):
+                r.like = -np.inf
+
+        return results
+
+    def _report_exception(self, p):
+        # Called while handling an exception from the likelihood at p
+        if self.debug:
+            sys.stderr.write("\n\nERROR: there was an exception running the likelihood:\n")
+            sys.stderr.write("\nBecause you have debug=T I will let this kill the chain.\n")
+            sys.stderr.write("The input parameters were:{}\n".format(repr(p)))
+            raise
+
+        sys.stderr.write("\n\nERROR: there was an exception running the likelihood:\n")
+        sys.stderr.write("The input parameters were:{}\n".format(repr(p)))
+        traceback.print_exc(file=sys.stderr)
+        sys.stderr.write("You should fix this but for now I will return NaN for the likelihood (because you have debug=F)\n\n")
+
 
 
 
@@ -1286,20 +1723,20 @@ class LikelihoodPipeline(Pipeline):
 
         section_name = section_names.likelihoods
 
-        # loop through named likelihoods and sum their values
-        likelihoods = []
-        for likelihood_name in self.likelihood_names:
-            try:
-                L = data.get_double(section_name,likelihood_name+"_like")
-                likelihoods.append(L)
-                if not self.quiet:
-                    print("    Likelihood {} = {}".format(likelihood_name, L))
-            # Complain if not found
-            except block.BlockError:
-                raise MissingLikelihoodError(likelihood_name, data)
+        # get all the named likelihoods at once and sum their values
+        keys = [(section_name, likelihood_name+"_like") for likelihood_name in self.likelihood_names]
+        try:
+            likelihoods = data.get_many(keys)
+        # Complain if any is not found
+        except block.BlockError as error:
+            raise MissingLikelihoodError(error.name[:-len("_like")], data)
+
+        if not self.quiet:
+            for likelihood_name, L in zip(self.likelihood_names, likelihoods):
+                print("    Likelihood {} = {}".format(likelihood_name, L))
 
         # Total likelihood
-        like = sum(likelihoods)
+        like = float(likelihoods.sum())
 
         # DM: Issue #181: Zuntz: replace NaN's with -inf's in posteriors and
         #                 likelihoods.
@@ -1348,6 +1785,15 @@ class LikelihoodPipeline(Pipeline):
             else:
                 return -np.inf, [np.nan for i in range(self.number_extra)]
 
+        like, extra_saves = self._likelihood_from_block(data)
+        if return_data:
+            return like, extra_saves, data
+        else:
+            return like, extra_saves
+
+    def _likelihood_from_block(self, data):
+        # The total likelihood and the extra outputs from a block that
+        # the pipeline has been run on
         like = self._extract_likelihoods(data)
 
         extra_saves = []
@@ -1374,10 +1820,7 @@ class LikelihoodPipeline(Pipeline):
                 # ---------------------------- otavio end ---------------------------
 
         self.n_iterations += 1
-        if return_data:
-            return like, extra_saves, data
-        else:
-            return like, extra_saves
+        return like, extra_saves
 
 
 
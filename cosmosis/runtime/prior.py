@@ -10,12 +10,16 @@ and :class:`DeltaFunctionPrior`.
 
 Applications can get by only knowing about the :class:`Prior` superclass.
 
+The log-density (`__call__`) and :func:`denormalize_from_prior` methods of
+every prior accept either a scalar or a NumPy array, so that a whole batch
+of points can be evaluated in a single call.
+
 """
 
 from . import config
 import numpy as np
-import math
 from scipy import interpolate
+from scipy.special import ndtr, ndtri
 import copy
 
 class Prior(object):
@@ -65,7 +69,7 @@ class Prior(object):
         if n is None:
             n = 1
         Y = np.random.uniform(0., 1.0, n)
-        return np.array([self.denormalize_from_prior(y) for y in Y])
+        return np.asarray(self.denormalize_from_prior(Y))
 
 
 
@@ -197,11 +201,11 @@ class TabulatedPDF(Prior):
 
     def __call__(self, x):
         u"""Return the logarithm of the probability density."""
-        if x<self.lower:
-            return -np.inf
-        elif x>self.upper:
-            return -np.inf
-        return np.log(self.pdf_interp(x))
+        x = np.asarray(x, dtype=float)
+        outside = (x<self.lower) | (x>self.upper)
+        with np.errstate(divide='ignore'):
+            logp = np.log(self.pdf_interp(np.clip(x, self.lower, self.upper)))
+        return _unwrap(np.where(outside, -np.inf, logp))
 
     def sample(self, n):
         u"""Use interpolation of inverse CDF to give us `n` random samples from a the distribution."""
@@ -245,9 +249,8 @@ class UniformPrior(Prior):
 
     def __call__(self, x):
         u"""Return the logarithm of the probability density, a constant value independent of `x` so long as `x` is in the proper range."""
-        if x<self.a or x>self.b:
-            return -np.inf
-        return self.norm
+        x = np.asarray(x, dtype=float)
+        return _unwrap(np.where((x<self.a) | (x>self.b), -np.inf, self.norm))
 
 
     def sample(self, n):
@@ -257,13 +260,9 @@ class UniformPrior(Prior):
 
     def denormalize_from_prior(self, y):
         u"""Interpolate the cumulated probability `y` to the corresponding value in the interval [`a`, `b`]."""
-        if y<0.0:
-            x = np.nan
-        elif y>1.0:
-            x = np.nan
-        else:
-            x = y * (self.b-self.a) + self.a
-        return x
+        y = np.asarray(y, dtype=float)
+        x = y * (self.b-self.a) + self.a
+        return _unwrap(np.where((y<0.0) | (y>1.0), np.nan, x))
 
 
     def __str__(self):
@@ -309,11 +308,7 @@ class GaussianPrior(Prior):
         return np.random.normal(self.mu, self.sigma, n)
 
     def denormalize_from_prior(self, y):
-        u"""Obtain the value such that the cumulated probability of obtaining a lesser value is `y`.
-
-        Note that this is a very expensive function to call.
-
-        """
+        u"""Obtain the value such that the cumulated probability of obtaining a lesser value is `y`."""
         x_normal = normal_ppf(y)
         x = x_normal*self.sigma + self.mu
         return x
@@ -348,18 +343,12 @@ class TruncatedGaussianPrior(Prior):
 
     def __call__(self, x):
         u"""Get the logarithm of the probability density at the value `x`."""
-        if x<self.lower:
-            return -np.inf
-        elif x>self.upper:
-            return -np.inf
-        return -0.5 * (x-self.mu)**2 / self.sigma2 - self.norm
+        x = np.asarray(x, dtype=float)
+        logp = -0.5 * (x-self.mu)**2 / self.sigma2 - self.norm
+        return _unwrap(np.where((x<self.lower) | (x>self.upper), -np.inf, logp))
 
     def denormalize_from_prior(self, y):
-        u"""Get the value for which the cumulated probability is `y`.
-
-        This is a very expensive function.
-
-        """
+        u"""Get the value for which the cumulated probability is `y`."""
         x_normal = truncated_normal_ppf(y, self.a, self.b)
         x = x_normal*self.sigma + self.mu
         return x
@@ -388,9 +377,8 @@ class ExponentialPrior(Prior):
     
     def __call__(self, x):
         u"""Return logarithm of probability density at `x`."""
-        if x<0.0:
-            return -np.inf
-        return -x/self.beta - self.log_beta
+        x = np.asarray(x, dtype=float)
+        return _unwrap(np.where(x<0.0, -np.inf, -x/self.beta - self.log_beta))
     
     def sample(self,n):
         u"""Use NumPy to obtain random sample of `n` values from Exponential Distribution with our width `beta`."""
@@ -404,7 +392,7 @@ class ExponentialPrior(Prior):
         #exp(-x/beta) = 1 - y
         #-x/beta = log(1-y)
         #x = -beta * log(1-y)
-        return -self.beta * np.log(1-y)
+        return self.beta * exponential_ppf(y)
         
     def __str__(self):
         u"""Give a terse description of ourself."""
@@ -439,11 +427,9 @@ class TruncatedExponentialPrior(Prior):
     def __call__(self, x):
         u"""Return the logarithm of probability density at `x`."""
         #(1/beta)*exp(-x/beta)
-        if x<self.lower:
-            return -np.inf
-        if x>self.upper:
-            return -np.inf
-        return -x/self.beta - self.norm
+        x = np.asarray(x, dtype=float)
+        logp = -x/self.beta - self.norm
+        return _unwrap(np.where((x<self.lower) | (x>self.upper), -np.inf, logp))
     
 
     def denormalize_from_prior(self, y):
@@ -481,11 +467,10 @@ class TruncatedOneoverxPrior(Prior):
 
     def __call__(self, x):
         u"""Return the logarithm of probability density at `x`."""
-        if x<self.lower:
-            return -np.inf
-        if x>self.upper:
-            return -np.inf
-        return -np.log(x) - self.ln_norm
+        x = np.asarray(x, dtype=float)
+        outside = (x<self.lower) | (x>self.upper)
+        logp = -np.log(np.where(outside, self.lower, x)) - self.ln_norm
+        return _unwrap(np.where(outside, -np.inf, logp))
 
     def sample(self, n):
         u"""Obtain random sample of `n` values from 1/x distribution within `lower` and `upper` bounds."""
@@ -497,7 +482,9 @@ class TruncatedOneoverxPrior(Prior):
         u"""Return the value at which the cumulated probability is `y`."""
         # int_a^x dz 1/z 1/N = (ln(x)-ln(a)) / N != y
         # ln(x) = y*N + ln(a)
-        return np.exp(y*self.norm + self.ln_lower)
+        y = np.asarray(y, dtype=float)
+        x = np.exp(y*self.norm + self.ln_lower)
+        return _unwrap(np.where((y<0.0) | (y>1.0), np.nan, x))
 
     def __str__(self):
         u"""Give a terse description of ourself."""
@@ -523,9 +510,8 @@ class DeltaFunctionPrior(Prior):
 
     def __call__(self, x):
         u"""The log-density is zero when `x` is `x0`, minus infinity otherwise."""
-        if x==self.x0:
-            return 0.0
-        return -np.inf
+        x = np.asarray(x)
+        return _unwrap(np.where(x==self.x0, 0.0, -np.inf))
 
     def sample(self, n=None):
         u"""Just return `x0` `n` times."""
@@ -539,11 +525,19 @@ class DeltaFunctionPrior(Prior):
 
     def denormalize_from_prior(self, x):
         u"""Just return `x0`; itʼs the only value with any probability."""
-        return self.x0
+        if np.ndim(x) == 0:
+            return self.x0
+        return np.repeat(self.x0, np.size(x)).reshape(np.shape(x))
         
 
 
 # Helper functions
+def _unwrap(x):
+    "Convert zero-dimensional arrays back to scalars, leaving others alone"
+    if x.ndim == 0:
+        return x[()]
+    return x
+
 def inverse_function(f, y, xmin, xmax, *args, **kwargs):
     "Find x in [xmin,xmax] such that f(x)==y, in 1D, with bisection"
     import scipy.optimize
@@ -552,60 +546,62 @@ def inverse_function(f, y, xmin, xmax, *args, **kwargs):
     x = scipy.optimize.bisect(g, xmin, xmax)
     return x
 
-SQRT2 = np.sqrt(2.)
 def normal_cdf(x):
-#    return 0.5*math.erf(x) + 0.5
-    return 0.5*(math.erf(x/SQRT2) + 1)
+    return _unwrap(ndtr(np.asarray(x, dtype=float)))
 
 
 def normal_ppf(y):
-    if y<0:
-        return np.nan
-    if y>1:
-        return np.nan
-    return inverse_function(normal_cdf, y, -20.0, 20.0)
+    # Values are restricted to +/- 20 sigma as they were
+    # when this was done by bisection
+    y = np.asarray(y, dtype=float)
+    x = np.clip(ndtri(y), -20.0, 20.0)
+    return _unwrap(np.where((y<0) | (y>1), np.nan, x))
 
 def truncated_normal_cdf(x, a, b):
-    if x<a:
-        return np.nan
-    if x>b:
-        return np.nan
-    phi_a = normal_cdf(a)
-    phi_b = normal_cdf(b)
-    phi_x = normal_cdf(x)
-    return (phi_x - phi_a) / (phi_b - phi_a)
+    x = np.asarray(x, dtype=float)
+    phi_a = ndtr(a)
+    phi_b = ndtr(b)
+    phi_x = ndtr(x)
+    y = (phi_x - phi_a) / (phi_b - phi_a)
+    return _unwrap(np.where((x<a) | (x>b), np.nan, y))
 
 def truncated_normal_ppf(y, a, b):
-    if y<0:
-        return np.nan
-    if y>1:
-        return np.nan
-    return inverse_function(truncated_normal_cdf, y, a, b, a, b)
+    y = np.asarray(y, dtype=float)
+    if a > 0:
+        # Work in the lower tail of the mirrored distribution,
+        # where the cdf values do not all round to one
+        return -truncated_normal_ppf(1.0 - y, -b, -a)
+    phi_a = ndtr(a)
+    phi_b = ndtr(b)
+    x = np.clip(ndtri(phi_a + y * (phi_b - phi_a)), a, b)
+    return _unwrap(np.where((y<0) | (y>1), np.nan, x))
 
 def exponential_cdf(x):
-    if x<0.0:
-        return np.nan
-    return 1 - np.exp(-x)
+    x = np.asarray(x, dtype=float)
+    return _unwrap(np.where(x<0.0, np.nan, -np.expm1(-x)))
 
 def truncated_exponential_cdf(x, a, b):
-    if x<a:
-        return np.nan
-    if x>b:
-        return np.nan
+    x = np.asarray(x, dtype=float)
     phi_a = exponential_cdf(a)
     phi_b = exponential_cdf(b)
-    phi_x = exponential_cdf(x)
-    return (phi_x - phi_a) / (phi_b - phi_a)
+    phi_x = -np.expm1(-x)
+    y = (phi_x - phi_a) / (phi_b - phi_a)
+    return _unwrap(np.where((x<a) | (x>b), np.nan, y))
 
 def exponential_ppf(y):
     #y = 1 - exp(-x)
     # exp(-x) = 1-y
     # x = -log(1-y)
-    return -np.log(1-y)
+    y = np.asarray(y, dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x = -np.log1p(-y)
+    return _unwrap(np.where((y<0) | (y>1), np.nan, x))
 
 def truncated_exponential_ppf(y, a, b):
-    if y<0:
-        return np.nan
-    if y>1:
-        return np.nan    
-    return inverse_function(truncated_exponential_cdf, y, a, b, a, b)
\ No newline at end of file
+    # y = (exp(-a) - exp(-x)) / (exp(-a) - exp(-b))
+    # x = -log(exp(-a) - y * (exp(-a) - exp(-b)))
+    y = np.asarray(y, dtype=float)
+    ea = np.exp(-a)
+    eb = np.exp(-b)
+    x = np.clip(-np.log(ea - np.clip(y, 0.0, 1.0) * (ea - eb)), a, b)
+    return _unwrap(np.where((y<0) | (y>1), np.nan, x))
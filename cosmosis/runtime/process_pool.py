@@ -1,34 +1,145 @@
 import multiprocessing
+import queue
 import os
 
 
+def _get_context():
+    # Workers rely on inheriting the set-up pipeline and the
+    # sampler globals from the master, so we need fork wherever
+    # it is available rather than the platform default.
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+
+class _Future(object):
+    """
+    The pending result of a task submitted to a Pool.
+    """
+    def __init__(self, task):
+        self.task = task
+        self._finished = False
+        self._async_result = None
+
+    def done(self):
+        return self._finished
+
+    def result(self):
+        return self._async_result.get()
+
+
 class Pool(object):
-    def __init__(self, processes):
+    """
+    A shared-memory pool of worker processes for the --smp mode.
+
+    The worker processes are forked the first time a sampler calls
+    map, i.e. after the pipeline and sampler have both been set up,
+    so that each worker inherits the modules with their setup state.
+    They are then kept alive for every subsequent call until the
+    sampler finishes and calls close, rather than being spawned anew
+    on each iteration.
+    """
+    def __init__(self, processes, chunksize=None):
         self.size = processes
         self.rank = 0
         self.master_pid = os.getpid()
+        self.chunksize = chunksize
+        self.pool = None
+        self._completed = queue.Queue()
 
     def is_master(self):
         return self.master_pid == os.getpid()
 
-    def map(self, function, args):
-        pool = multiprocessing.Pool(self.size)
-        results = pool.map(function, args)
-        pool.close()
-        return results
+    def __getstate__(self):
+        # Sampler objects holding a reference to us are sometimes
+        # pickled to send to the workers; the workers themselves
+        # cannot be.
+        state = self.__dict__.copy()
+        state['pool'] = None
+        state['_completed'] = None
+        return state
+
+    def _get_pool(self):
+        if self.pool is None:
+            self.pool = _get_context().Pool(self.size)
+        return self.pool
+
+    def _chunksize(self, ntask, chunksize):
+        if chunksize is None:
+            chunksize = self.chunksize
+        if chunksize is None:
+            # Same heuristic as multiprocessing uses for map,
+            # giving each worker a few chunks per call
+            chunksize, extra = divmod(ntask, self.size * 4)
+            if extra:
+                chunksize += 1
+        return max(chunksize, 1)
+
+    def map(self, function, tasks, chunksize=None):
+        tasks = list(tasks)
+        pool = self._get_pool()
+        chunksize = self._chunksize(len(tasks), chunksize)
+        return pool.map(function, tasks, chunksize=chunksize)
+
+    def imap_unordered(self, function, tasks, chunksize=1):
+        """
+        Generate the results of function applied to the tasks
+        in the order they complete, rather than in task order.
+        """
+        pool = self._get_pool()
+        return pool.imap_unordered(function, tasks, chunksize=chunksize)
+
+    def submit(self, function, task):
+        """
+        Start running function(task) on one of the workers and return
+        a future object for it, with done() and result() methods.
+        """
+        pool = self._get_pool()
+        future = _Future(task)
+
+        def notify(_):
+            future._finished = True
+            self._completed.put(future)
+
+        future._async_result = pool.apply_async(function, (task,),
+            callback=notify, error_callback=notify)
+        return future
+
+    def as_completed(self, futures):
+        """
+        Generate the futures from the list as they finish.
+        """
+        remaining = set(futures)
+        for future in futures:
+            if future.done():
+                remaining.discard(future)
+                yield future
+        while remaining:
+            future = self._completed.get()
+            if future in remaining:
+                remaining.discard(future)
+                yield future
 
     def close(self):
-        pass
+        # Shut down the persistent workers.  They will be re-forked
+        # if map is called again, e.g. by the next sampler in a chain
+        # of samplers, so that they pick up its state.
+        if self.pool is not None and self.is_master():
+            self.pool.close()
+            self.pool.join()
+        self.pool = None
 
     def bcast(self, data):
-        return self.data
+        # Only the master process runs sampler code, so there is
+        # no one else to send to
+        return data
 
     def gather(self, data):
-        return self.data
+        return [data]
 
 
     def __enter__(self):
         return self
 
     def __exit__(self, *args):
-        pass        
\ No newline at end of file
+        self.close()
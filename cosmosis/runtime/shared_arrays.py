@@ -0,0 +1,324 @@
+#coding: utf-8
+
+u"""Read-only arrays shared between the processes on a node.
+
+Large constant inputs that modules load in their setup functions, such
+as data vectors, covariance matrices and emulator weights, would
+otherwise be held separately by every process in an --mpi or --smp run.
+A module can instead publish them with :func:`shared_array`, so that
+only one copy is stored on each node and the other processes attach to
+it without copying::
+
+    def setup(options):
+        weights = shared_array("my_emulator/weights", lambda: np.load(filename))
+        ...
+
+The first argument names the array and must be unique in the pipeline.
+The second is the array itself or a function that makes it; a function
+is only called in the process that publishes the array, so expensive
+set-up like inverting a matrix is done once per node.  The result is a
+read-only numpy array.
+
+Under MPI the arrays are stored in MPI-3 shared memory windows on the
+processes of each node, and :func:`shared_array` must be called by all
+of them, in the same order, as happens when the pipeline is set up.
+Otherwise they are stored in POSIX shared memory.  The workers of an
+--smp run are forked from the process that set up the pipeline and
+inherit its arrays.  Separate runs will also share arrays if they set
+the same COSMOSIS_SHARED_NAMESPACE environment variable.
+
+"""
+import atexit
+import hashlib
+import os
+import pickle
+import struct
+import time
+import numpy as np
+
+NAMESPACE_ENVIRONMENT_VARIABLE = "COSMOSIS_SHARED_NAMESPACE"
+
+
+
+class SharedArrayStore(object):
+    u"""The base class for the ways of storing shared arrays.
+
+    Subclasses implement :func:`_publish`, which returns the shared
+    array for a name and whether this process made it.
+
+    """
+    def __init__(self):
+        self.arrays = {}
+        self.owned = set()
+
+    def get(self, name, build):
+        u"""Return the shared array called `name`, making it with `build` if needed."""
+        array = self.arrays.get(name)
+        if array is None:
+            array, owner = self._publish(name, build)
+            array.flags.writeable = False
+            self.arrays[name] = array
+            if owner:
+                self.owned.add(name)
+        return array
+
+    def _publish(self, name, build):
+        raise NotImplementedError()
+
+    @staticmethod
+    def _build(build):
+        if callable(build):
+            build = build()
+        return np.ascontiguousarray(build)
+
+    def nbytes(self):
+        u"""The total size of the shared arrays used by this process."""
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def owned_nbytes(self):
+        u"""The total size of the shared arrays that this process published."""
+        return sum(self.arrays[name].nbytes for name in self.owned)
+
+    def report(self):
+        u"""Return a line describing the memory used by shared arrays."""
+        return "Shared arrays: {} ({:.1f} MB, of which {:.1f} MB published by this process)".format(
+            len(self.arrays), self.nbytes() / 1e6, self.owned_nbytes() / 1e6)
+
+    def close(self):
+        self.arrays.clear()
+        self.owned.clear()
+
+
+
+class PosixSharedArrays(SharedArrayStore):
+    u"""Shared arrays in POSIX shared memory segments.
+
+    Each array is stored in its own segment, named from the namespace
+    and the array name.  The first process to ask for an array makes the
+    segment and removes it again when it exits; others wait until its
+    contents have been written and then attach to it.
+
+    """
+    # magic, ready flag, dtype, number of dimensions, then the shape
+    header = struct.Struct("<4sB16sB")
+    header_size = 128
+    magic = b"CSHM"
+    max_ndim = (header_size - header.size) // 8
+
+    def __init__(self, namespace=None, timeout=600.0):
+        super(PosixSharedArrays, self).__init__()
+        if namespace is None:
+            namespace = os.environ.get(NAMESPACE_ENVIRONMENT_VARIABLE, "pid{}".format(os.getpid()))
+        self.namespace = namespace
+        self.timeout = timeout
+        self.segments = {}
+
+    def segment_name(self, name):
+        # Segment names have to be short, so we use a hash
+        digest = hashlib.sha1("{}\0{}".format(self.namespace, name).encode('utf-8')).hexdigest()
+        return "cosmosis_" + digest[:20]
+
+    def _publish(self, name, build):
+        from multiprocessing import shared_memory
+        segment_name = self.segment_name(name)
+        try:
+            segment = self._attach(shared_memory, segment_name)
+            owner = False
+        except FileNotFoundError:
+            array = self._build(build)
+            if array.ndim > self.max_ndim:
+                raise ValueError("Shared array {} has too many dimensions".format(name))
+            try:
+                segment = shared_memory.SharedMemory(segment_name, create=True,
+                    size=self.header_size + max(array.nbytes, 1))
+                owner = True
+            except FileExistsError:
+                # Another process got there first
+                segment = self._attach(shared_memory, segment_name)
+                owner = False
+            else:
+                self._write(segment, array)
+        self.segments[name] = (segment, owner)
+        return self._wait_for_array(name, segment), owner
+
+    def _attach(self, shared_memory, segment_name):
+        # A segment that another process has only just made can still
+        # be empty, in which case it cannot be mapped yet
+        start = time.time()
+        while True:
+            try:
+                return self._open(shared_memory, segment_name)
+            except ValueError:
+                if time.time() - start > self.timeout:
+                    raise
+                time.sleep(0.01)
+
+    @staticmethod
+    def _open(shared_memory, segment_name):
+        # Python should not remove the segment when this process ends;
+        # that is the job of the process that made it.
+        try:
+            return shared_memory.SharedMemory(segment_name, track=False)
+        except TypeError:
+            pass
+        # Before python 3.13 there is no option for that, and every
+        # segment that is opened is registered with the resource tracker.
+        from multiprocessing import resource_tracker
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(segment_name)
+        finally:
+            resource_tracker.register = register
+
+    def _write(self, segment, array):
+        buf = segment.buf
+        shape = struct.pack("<{}q".format(array.ndim), *array.shape)
+        buf[self.header.size:self.header.size+len(shape)] = shape
+        data = np.ndarray(array.shape, dtype=array.dtype, buffer=buf, offset=self.header_size)
+        data[...] = array
+        del data
+        # The ready flag goes in last, so other processes do not read
+        # the array before it is complete
+        buf[:self.header.size] = self.header.pack(self.magic, 1, array.dtype.str.encode('ascii'), array.ndim)
+
+    def _wait_for_array(self, name, segment):
+        buf = segment.buf
+        start = time.time()
+        while True:
+            magic, ready, dtype, ndim = self.header.unpack(bytes(buf[:self.header.size]))
+            if magic == self.magic and ready:
+                break
+            if time.time() - start > self.timeout:
+                raise RuntimeError("Timed out waiting for another process to publish shared array {}".format(name))
+            time.sleep(0.01)
+        shape = struct.unpack("<{}q".format(ndim), bytes(buf[self.header.size:self.header.size+8*ndim]))
+        dtype = np.dtype(dtype.rstrip(b"\0").decode('ascii'))
+        return np.ndarray(shape, dtype=dtype, buffer=buf, offset=self.header_size)
+
+    def close(self):
+        super(PosixSharedArrays, self).close()
+        for segment, owner in self.segments.values():
+            if owner:
+                try:
+                    segment.unlink()
+                except FileNotFoundError:
+                    pass
+            try:
+                segment.close()
+            except BufferError:
+                # Arrays using the segment are still alive elsewhere;
+                # the memory is released when the process ends.
+                pass
+        self.segments.clear()
+
+
+
+class MPISharedArrays(SharedArrayStore):
+    u"""Shared arrays in MPI-3 shared memory windows.
+
+    The processes on each node share one window per array, allocated by
+    the first process on the node, which also makes the array.  This
+    is collective over the processes on the node.
+
+    """
+    def __init__(self, comm):
+        super(MPISharedArrays, self).__init__()
+        from mpi4py import MPI
+        self.MPI = MPI
+        self.node_comm = comm.Split_type(MPI.COMM_TYPE_SHARED)
+        self.windows = {}
+
+    def _publish(self, name, build):
+        comm = self.node_comm
+        owner = comm.Get_rank() == 0
+        error = None
+        if owner:
+            # If making the array fails the error is sent to the other
+            # processes, which would otherwise wait here forever
+            try:
+                array = self._build(build)
+                info = (name, array.dtype.str, array.shape)
+            except Exception as e:
+                error = e
+                info = (name, None, self._picklable_error(e))
+        else:
+            info = None
+        info = comm.bcast(info, root=0)
+        if info[0] != name:
+            raise RuntimeError("Processes on a node tried to share different arrays at the same time "
+                "({} and {}); shared_array must be called in the same order everywhere".format(info[0], name))
+        if info[1] is None:
+            # The owner re-raises its own error, with its traceback
+            raise error if owner else info[2]
+        _, dtype, shape = info
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+        window = self.MPI.Win.Allocate_shared(nbytes if owner else 0, dtype.itemsize, comm=comm)
+        buf, _ = window.Shared_query(0)
+        shared = np.ndarray(shape, dtype=dtype, buffer=buf)
+        if owner:
+            shared[...] = array
+        comm.Barrier()
+        self.windows[name] = window
+        return shared, owner
+
+    @staticmethod
+    def _picklable_error(error):
+        # The error to raise in the other processes
+        try:
+            pickle.dumps(error)
+            return error
+        except Exception:
+            return RuntimeError("{}: {}".format(type(error).__name__, error))
+
+    def close(self):
+        super(MPISharedArrays, self).close()
+        if not self.MPI.Is_finalized():
+            for window in self.windows.values():
+                window.Free()
+        self.windows.clear()
+
+
+
+_store = None
+_store_pid = None
+
+def get_store():
+    u"""Return the store used by :func:`shared_array`, by default a :class:`PosixSharedArrays`."""
+    global _store
+    if _store is None:
+        set_store(PosixSharedArrays())
+    return _store
+
+
+def set_store(store):
+    u"""Use `store` for shared arrays from now on, closing any previous one."""
+    global _store, _store_pid
+    if _store is not None and _store is not store:
+        _store.close()
+    _store = store
+    _store_pid = os.getpid()
+
+
+def use_mpi(comm):
+    u"""Share arrays between the processes of `comm` on each node using MPI windows."""
+    set_store(MPISharedArrays(comm))
+
+
+def shared_array(name, build):
+    u"""Return a read-only copy of an array that is shared between the processes on this node.
+
+    `build` is either the array or a function that returns it, which
+    is called only if this process is the one publishing the array.
+
+    """
+    return get_store().get(name, build)
+
+
+@atexit.register
+def _close_store():
+    # Only the process that set up the store should remove its
+    # segments, not forked workers that inherited it.
+    if _store is not None and _store_pid == os.getpid():
+        _store.close()
@@ -1,6 +1,8 @@
 from .. import ParallelSampler
 import numpy as np
 from ...runtime import prior
+from ...datablock import BlockError
+from ...gaussian_likelihood import simulate_from_block
 import scipy.linalg
 import types
 
@@ -18,7 +20,7 @@ def abc_model(p):
     for like_name in abc_pipeline.likelihood_names:
         #Look in the standard place for the model
         try:
-            model.append(data['data_vector', like_name + '_simulation'])
+            model.append(simulate_from_block(data, like_name))
         #Raise an error in the even of failure - this is a systematic problem
         except BlockError:
             raise ValueError("The module in the ABC pipeline should save a model (i.e. a simulation) with the same dimensions as the data, called NAME_simulation.")
@@ -8,15 +8,24 @@ def task(p):
     i,p = p
     print("Running sample from prior: ", p)
     r = sampler.pipeline.run_results(p)
+    return task_output(i, p, r)
+
+
+def batch_task(jobs):
+    # Run a list of (i, p) jobs through the pipeline together
+    for i, p in jobs:
+        print("Running sample from prior: ", p)
+    results = sampler.pipeline.run_results_batch([p for i, p in jobs])
+    return [task_output(i, p, r) for (i, p), r in zip(jobs, results)]
+
+
+def task_output(i, p, r):
     #If requested, save the data to file
-    if sampler.save_name:
-        if r.block is None:
-            print("Failed to run parameters: {} so not saving".format(p))
-        else:
-            filename = "{}_{}".format(sampler.save_name, i)
-            r.block.save_to_file(filename, clobber=True)
+    if sampler.save_name and r.block is None:
+        print("Failed to run parameters: {} so not saving".format(p))
+    saved = sampler.save_block(i, r.block)
 
-    return (r.prior, r.post, r.extra)
+    return (r.prior, r.post, r.extra, saved)
 
 
 
@@ -30,45 +39,53 @@ class AprioriSampler(ParallelSampler):
         sampler = self
 
         self.converged = False
-        self.save_name = self.read_ini("save", str, "")
+        self.read_save_options()
         self.nsample = self.read_ini("nsample", int, 1)
+        # When running in serial, samples are run through the pipeline
+        # this many at a time
+        self.batch_size = self.read_ini("batch_size", int, 100)
 
 
     def execute(self):
-        n = 0
         nparam = len(self.pipeline.varied_params)
 
+        def sample_from_prior(batch_size=1000):
+            # Transform the uniform draws a batch at a time
+            for start in range(0, self.nsample, batch_size):
+                n = min(batch_size, self.nsample - start)
+                x = np.random.uniform(0.0,1.0,size=(n, nparam))
+                for p in self.pipeline.denormalize_vector_from_prior(x):
+                    yield p
+
+        # Generate the jobs lazily so that only the ones
+        # currently being run are held in memory.
+        jobs = enumerate(sample_from_prior())
+
+        # The samples are independent so we can save them
+        # in whatever order they finish
         if self.pool:
-            chunk_size = self.pool.size
-
-        def sample_from_prior():
-            x = np.random.uniform(0.0,1.0,size=nparam)
-            p = self.pipeline.denormalize_vector_from_prior(x)
-            return p
-
-        while n < self.nsample:
-            if self.pool:
-                jobs = [(n+i,sample_from_prior()) for i in range(chunk_size)]
-                results = self.pool.map(task, jobs)
-                n += chunk_size
-            else:
-                jobs = [(n,sample_from_prior())]
-                results = list(map(task, jobs))
-                n += 1
-
-            #Save the results of the sampling
-            #We now need to abuse the output code a little.
-            for sample, result  in zip(jobs, results):
-                i, sample=sample
-                #Optionally save all the results calculated by each
-                #pipeline run to files
-                (prior, post, extra) = result
-                #always save the usual text output
-                self.output.parameters(sample, extra, prior, post)
+            results = self.stream_tasks(task, jobs, ordered=False)
+        else:
+            results = self.run_batches(jobs)
+
+        for (i, sample), result in results:
+            (prior, post, extra, saved) = result
+            self.write_saved_block(saved)
+            #always save the usual text output
+            self.output.parameters(sample, extra, prior, post)
 
         #We only ever run this once, though that could 
         #change if we decide to split up the runs
         self.converged = True
 
+    def run_batches(self, jobs):
+        # Generate (job, result) pairs, running the jobs in batches
+        while True:
+            batch = list(itertools.islice(jobs, max(self.batch_size, 1)))
+            if not batch:
+                break
+            for job, result in zip(batch, batch_task(batch)):
+                yield job, result
+
     def is_converged(self):
         return self.converged
@@ -8,6 +8,11 @@ def log_probability_function(p):
     return r.post, (r.prior, r.extra)
 
 
+def log_probability_batch(P):
+    # Run the whole ensemble through the pipeline at once
+    return [(r.post, (r.prior, r.extra)) for r in emcee_pipeline.run_results_batch(P)]
+
+
 class EmceeSampler(ParallelSampler):
     parallel_output = False
     supports_resume = True
@@ -57,15 +62,17 @@ class EmceeSampler(ParallelSampler):
                 iterations_limit = 100000
                 n=0
                 p0 = []
-                for i in range(iterations_limit):
-                    p = self.emcee.utils.sample_ellipsoid(center, cov)[0]
-                    if np.isfinite(self.pipeline.prior(p)):
-                        p0.append(p)
-                    if len(p0)==self.nwalkers:
+                # Draw and test candidates a batch at a time
+                while n < iterations_limit:
+                    size = min(self.nwalkers, iterations_limit - n)
+                    p = sample_ellipsoid(center, cov, size=size)
+                    n += size
+                    p0.extend(p[np.isfinite(self.pipeline.prior_batch(p))])
+                    if len(p0) >= self.nwalkers:
                         break
                 else:
                     raise ValueError("The covmat you used could not generate points inside the prior")
-                self.p0 = np.array(p0)
+                self.p0 = np.array(p0[:self.nwalkers])
             elif random_start:
                 self.p0 = [self.pipeline.randomized_start()
                            for i in range(self.nwalkers)]
@@ -79,10 +86,19 @@ class EmceeSampler(ParallelSampler):
                 self.p0 = [self.pipeline.denormalize_vector(p0_norm_i) for p0_norm_i in p0_norm]
                 self.output.log_info("Generating starting positions in small ball around starting point")
 
+            # Without a pool we can run all the walkers through the pipeline
+            # together, so that modules that can vectorise over points do so.
+            self.batch = self.read_ini("batch", bool, True) and self.pool is None and self.emcee_version >= 3
+
             #Finally we can create the sampler
-            self.ensemble = self.emcee.EnsembleSampler(self.nwalkers, self.ndim,
-                                                       log_probability_function,
-                                                       pool=self.pool)
+            if self.batch:
+                self.ensemble = self.emcee.EnsembleSampler(self.nwalkers, self.ndim,
+                                                           log_probability_batch,
+                                                           vectorize=True)
+            else:
+                self.ensemble = self.emcee.EnsembleSampler(self.nwalkers, self.ndim,
+                                                           log_probability_function,
+                                                           pool=self.pool)
 
     def resume(self):
         if self.output.resumed:
@@ -124,9 +140,10 @@ class EmceeSampler(ParallelSampler):
 
 
     def output_samples(self, pos, prob, extra_info):
-        for params, post, extra in zip(pos,prob,extra_info):
-            prior, extra = extra      
-            self.output.parameters(params, extra, prior, post)
+        # Write the whole population in one go
+        priors = [prior for (prior, extra) in extra_info]
+        extras = np.array([extra for (prior, extra) in extra_info]).reshape(len(pos), -1)
+        self.output.parameters_many(pos, extras, priors, prob)
 
     def execute(self):
         #Run the emcee sampler.
@@ -8,9 +8,8 @@ def task(p):
     i,p = p
     results = grid_sampler.pipeline.run_results(p)
     #If requested, save the data to file
-    if grid_sampler.save_name and results.block is not None:
-        results.block.save_to_file(grid_sampler.save_name+"_%d"%i, clobber=True)
-    return (results.post, results.prior, results.extra)
+    saved = grid_sampler.save_block(i, results.block)
+    return (results.post, results.prior, results.extra, saved)
 
 LARGE_JOB_SIZE = 1000000
 
@@ -27,7 +26,7 @@ class GridSampler(ParallelSampler):
 
         self.converged = False
         self.nsample = self.read_ini("nsample_dimension", int, 1)
-        self.save_name = self.read_ini("save", str, "")
+        self.read_save_options()
         self.nstep = self.read_ini("nstep", int, -1)
         self.allow_large = self.read_ini("allow_large", bool, False)
         self.sample_points = None
@@ -103,22 +102,23 @@ class GridSampler(ParallelSampler):
         sample_index = np.arange(len(samples)) + self.ndone
         jobs = list(zip(sample_index, samples))
 
-        #Actually compute the likelihood results
-        if self.pool:
-            results = self.pool.map(task, jobs)
-        else:
-            results = list(map(task, jobs))
-
-        #Update the count
-        self.ndone += len(results)
-
-        #Save the results of the sampling
-        for sample, result  in zip(samples, results):
-            #Optionally save all the results calculated by each
-            #pipeline run to files
-            (prob, prior, extra) = result
-            #always save the usual text output
-            self.output.parameters(sample, extra, prior, prob)
+        #Actually compute the likelihood results, collecting
+        #them as they finish in order, so the grid stays in order
+        priors = []
+        posts = []
+        extras = []
+        for (i, sample), result in self.stream_tasks(task, jobs):
+            (prob, prior, extra, saved) = result
+            self.write_saved_block(saved)
+            posts.append(prob)
+            priors.append(prior)
+            extras.append(extra)
+            #Update the count
+            self.ndone += 1
+
+        #always save the usual text output, the whole chunk at once
+        extras = np.array(extras).reshape(len(samples), -1)
+        self.output.parameters_many(samples, extras, priors, posts)
 
     def is_converged(self):
         return self.converged
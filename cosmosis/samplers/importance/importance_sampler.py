@@ -117,14 +117,10 @@ class ImportanceSampler(ParallelSampler):
         end = start+self.nstep
         samples_chunk = self.samples[start:end]
 
-        #Run the pipeline on each of the samples
-        if self.pool:
-            results = self.pool.map(task, samples_chunk)
-        else:
-            results = list(map(task, samples_chunk))
-
-        #Collect together and output the results
-        for i,(sample, (new_like, extra)) in enumerate(zip(samples_chunk, results)):
+        #Run the pipeline on each of the samples, and collect
+        #together the results as they come in
+        rows = []
+        for i,(sample, (new_like, extra)) in enumerate(self.stream_tasks(task, samples_chunk)):
             #We already (may) have some extra values from the pipeline
             #as derived parameters.  Add to those any parameters used in the
             #old pipeline but not the new one
@@ -137,8 +133,10 @@ class ImportanceSampler(ParallelSampler):
                 new_like += old_like
             weight = new_like-old_like
             extra = list(extra) + [old_like,weight,new_like]
-            #and save results
-            self.output.parameters(sample, extra)
+            rows.append(extra)
+        #and save results for the whole chunk
+        if rows:
+            self.output.parameters_many(samples_chunk[:len(rows)], rows)
         #Update the current index
         self.current_index+=self.nstep
 
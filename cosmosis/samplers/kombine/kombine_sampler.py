@@ -88,9 +88,9 @@ class KombineSampler(ParallelSampler):
         return list(data)
 
     def output_samples(self, pos, prob, extra_info):
-        for p,l,e in zip(pos,prob,extra_info):
-            e, pr = e
-            self.output.parameters(p, e, pr, l)
+        extras = np.array([e for (e, pr) in extra_info]).reshape(len(pos), -1)
+        priors = [pr for (e, pr) in extra_info]
+        self.output.parameters_many(pos, extras, priors, prob)
 
     def execute(self):
         if not self.burned_in:
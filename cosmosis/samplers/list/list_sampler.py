@@ -8,9 +8,8 @@ def task(p):
     i,p = p
     results = list_sampler.pipeline.run_results(p, all_params=True)
     #If requested, save the data to file
-    if list_sampler.save_name and results.block is not None:
-        results.block.save_to_file(list_sampler.save_name+"_%d"%i, clobber=True)
-    return results.post, (results.prior, results.extra)
+    saved = list_sampler.save_block(i, results.block)
+    return results.post, (results.prior, results.extra), saved
 
 
 
@@ -25,7 +24,7 @@ class ListSampler(ParallelSampler):
 
         self.converged = False
         self.filename = self.read_ini("filename", str)
-        self.save_name = self.read_ini("save", str, "")
+        self.read_save_options()
         self.burn = self.read_ini("burn", int, 0)
         self.thin = self.read_ini("thin", int, 1)
         limits = self.read_ini("limits", bool, False)
@@ -38,6 +37,8 @@ class ListSampler(ParallelSampler):
                 p.limits = (-np.inf, np.inf)
                 if self.output is not None:
                     self.output.add_column(str(p), float)
+            # Every parameter is now varied, with the new limits
+            self.pipeline.reset_fixed_varied_parameters()
             if self.output is not None:
                 for p in self.pipeline.extra_saves:
                     self.output.add_column('{}--{}'.format(*p), float)
@@ -88,24 +89,13 @@ class ListSampler(ParallelSampler):
         sample_index = list(range(len(sample_vectors)))
         jobs = list(zip(sample_index, sample_vectors))
 
-        #Run all the parameters
-        #This only outputs them all at the end
-        #which is a bit problematic, though you 
-        #can't use MPI and retain the output ordering.
-        #Have a few options depending on whether
-        #you care about this we should think about
-        #(also true for grid sampler).
-        if self.pool:
-            results = self.pool.map(task, jobs)
-        else:
-            results = list(map(task, jobs))
-
-        #Save the results of the sampling
-        #We now need to abuse the output code a little.
-        for sample, result  in zip(sample_vectors, results):
-            #Optionally save all the results calculated by each
-            #pipeline run to files
-            (prob, (prior,extra)) = result
+        #Run all the parameters, saving the results as they
+        #come in.  We keep the output in the same order as the
+        #input list, so a slow sample can hold up the writing of
+        #the ones after it, but not their evaluation.
+        for (i, sample), result in self.stream_tasks(task, jobs):
+            (prob, (prior,extra), saved) = result
+            self.write_saved_block(saved)
             #always save the usual text output
             self.output.parameters(sample, extra, prior, prob)
         #We only ever run this once, though that could 
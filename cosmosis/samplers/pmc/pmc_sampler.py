@@ -75,9 +75,10 @@ class PmcSampler(ParallelSampler):
         self.iterations += 1
         self.samples += n
 
-        for (vector, post, extra, component, weight) in zip(*results):
-            prior, extra = extra
-            self.output.parameters(vector, extra, (component, prior, post, weight))
+        vectors, posts, extra_info, components, weights = results
+        priors = [prior for (prior, extra) in extra_info]
+        extras = np.array([extra for (prior, extra) in extra_info]).reshape(len(vectors), -1)
+        self.output.parameters_many(vectors, extras, components, priors, posts, weights)
 
         print("Done %d iterations, %d samples" % (self.iterations, self.samples))
 
@@ -2,6 +2,7 @@ from future.utils import with_metaclass
 from ..runtime.attribution import PipelineAttribution
 from ..runtime.utils import get_git_revision
 from ..runtime import Inifile
+from ..runtime.block_archive import pack_block, BlockArchiveWriter, ARCHIVE_EXTENSION
 from ..output import InMemoryOutput
 import datetime
 import platform
@@ -14,6 +15,7 @@ import numpy as np
 import shutil
 import numpy as np
 import configparser
+import itertools
 
 # Sampler metaclass that registers each of its subclasses
 
@@ -162,6 +164,10 @@ class Sampler(with_metaclass(RegisteredSampler, object)):
     def resume(self):
         raise NotImplementedError("The sampler {} does not support resuming".format(self.name))
 
+    def cleanup(self):
+        ''' Close any files the sampler has open, once it has finished '''
+        pass
+
     def is_converged(self):
         return False
     
@@ -229,6 +235,103 @@ class ParallelSampler(Sampler):
     def is_master(self):
         return self.pool is None or self.pool.is_master()
 
+    def read_save_options(self):
+        """
+        Read the options for saving the block from every sample, used
+        by samplers like grid and list that run a fixed set of points.
+
+        If save is set then with save_format=tar (the default) each
+        block is saved as a separate tarball, save_1.tgz, save_2.tgz etc.
+        With save_format=archive they are all saved in a single binary
+        file, save.blocks, which can be read with
+        cosmosis.runtime.block_archive.BlockArchive.  If the run is
+        resumed then new blocks are added to the end of an existing file.
+        """
+        self.save_name = self.read_ini("save", str, "")
+        self.save_format = self.read_ini_choices("save_format", str, ["tar", "archive"], "tar")
+        self.save_append = self.ini.getboolean("runtime", "resume", fallback=False)
+        self.block_archive = None
+
+    def save_block(self, i, block):
+        """
+        Save the block for sample i.  This is called in the worker
+        process that ran the sample.  For archives the block is packed
+        and compressed here and the record returned, to be sent back and
+        passed to write_saved_block; otherwise None is returned.
+        """
+        if not self.save_name or block is None:
+            return None
+        if self.save_format == "archive":
+            return pack_block(block, i)
+        block.save_to_file("{}_{}".format(self.save_name, i), clobber=True)
+        return None
+
+    def write_saved_block(self, record):
+        """
+        Write a record from save_block to the archive, in the master process.
+        """
+        if record is None:
+            return
+        if self.block_archive is None:
+            self.block_archive = BlockArchiveWriter(self.save_name + ARCHIVE_EXTENSION, append=self.save_append)
+        self.block_archive.append(record)
+
+    def cleanup(self):
+        if getattr(self, "block_archive", None) is not None:
+            self.block_archive.close()
+            self.block_archive = None
+
+    def stream_tasks(self, function, tasks, ordered=True, max_pending=None):
+        """
+        Apply function to each of the tasks, using the pool if there
+        is one, and generate (task, result) pairs as they finish.
+
+        Unlike pool.map this lets samplers write out each result as
+        soon as it is ready.  At most max_pending tasks (by default four
+        per process in the pool) are in flight at once, so the workers
+        stay busy but the master does not hold a whole large job in memory.
+
+        If ordered is True the pairs come out in the same order as the
+        tasks, each one as soon as it and all those before it are done.
+        Otherwise they come out in the order they finish.
+        """
+        if not self.pool:
+            for task in tasks:
+                yield task, function(task)
+            return
+
+        if max_pending is None:
+            max_pending = 4 * self.pool.size
+
+        tasks = iter(tasks)
+        futures = {}
+        finished = {}
+        submitted = 0
+        next_index = 0
+
+        while True:
+            # Keep the workers topped up with tasks.  Results waiting
+            # for an earlier one count towards the limit too.
+            for task in itertools.islice(tasks, max_pending - len(futures) - len(finished)):
+                futures[self.pool.submit(function, task)] = submitted
+                submitted += 1
+
+            if not futures:
+                break
+
+            future = next(self.pool.as_completed(list(futures.keys())))
+            index = futures.pop(future)
+
+            if not ordered:
+                yield future.task, future.result()
+                continue
+
+            finished[index] = future
+            while next_index in finished:
+                future = finished.pop(next_index)
+                yield future.task, future.result()
+                next_index += 1
+
 
 # These are marked as deprecated in emcee, so I moved them here.
 # I think I wrote the first one.  And I've rewritten the second
@@ -98,15 +98,17 @@ class ZeusSampler(ParallelSampler):
                 iterations_limit = 100000
                 n=0
                 p0 = []
-                for i in range(iterations_limit):
-                    p = sample_ellipsoid(center, cov)[0]
-                    if np.isfinite(self.pipeline.prior(p)):
-                        p0.append(p)
-                    if len(p0)==self.nwalkers:
+                # Draw and test candidates a batch at a time
+                while n < iterations_limit:
+                    size = min(self.nwalkers, iterations_limit - n)
+                    p = sample_ellipsoid(center, cov, size=size)
+                    n += size
+                    p0.extend(p[np.isfinite(self.pipeline.prior_batch(p))])
+                    if len(p0) >= self.nwalkers:
                         break
                 else:
                     raise ValueError("The covmat you used could not generate points inside the prior")
-                self.p0 = np.array(p0)
+                self.p0 = np.array(p0[:self.nwalkers])
             elif random_start:
                 self.p0 = [self.pipeline.randomized_start()
                            for i in range(self.nwalkers)]
@@ -235,11 +237,20 @@ class ZeusSampler(ParallelSampler):
         chain = self.sampler.get_chain()
         blobs = self.sampler.get_blobs()
 
-        # Output results per sampler per walker
+        # Output results for every step and walker at once
+        priors = []
+        extras = []
         for i in range(start, end):
             for j in range(self.nwalkers):
                 prior, extra = blobs[i, j]
-                self.output.parameters(chain[i, j], extra, prior, post[i, j])
+                priors.append(prior)
+                extras.append(extra)
+        nrow = (end - start) * self.nwalkers
+        self.output.parameters_many(
+            chain[start:end].reshape(nrow, -1),
+            np.array(extras).reshape(nrow, -1),
+            priors,
+            post[start:end].reshape(nrow))
 
         #Set the starting positions for the next chunk of samples
         #to the last ones for this chunk
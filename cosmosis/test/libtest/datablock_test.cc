@@ -153,6 +153,67 @@ void test_copy()
 }
 
 
+void test_handles()
+{
+  int h = DataBlock::get_handle("Cosmo", "H0");
+  assert(h >= 0);
+  assert(DataBlock::get_handle("cosmo", "h0") == h);
+  assert(DataBlock::get_handle("cosmo", "omega_m") != h);
+
+  DataBlock b;
+  double x;
+  assert(b.get_val(h, x) == DBS_SECTION_NOT_FOUND);
+  assert(b.replace_val(h, 1.0) == DBS_SECTION_NOT_FOUND);
+  assert(b.put_val(h, 0.7) == DBS_SUCCESS);
+  assert(b.put_val(h, 0.7) == DBS_NAME_ALREADY_EXISTS);
+  assert(b.get_val("COSMO", "h0", x) == DBS_SUCCESS);
+  assert(x == 0.7);
+  assert(b.replace_val("cosmo", "h0", 0.8) == DBS_SUCCESS);
+  assert(b.get_val(h, x) == DBS_SUCCESS);
+  assert(x == 0.8);
+  int i;
+  assert(b.get_val(h, i) == DBS_WRONG_VALUE_TYPE);
+  assert(b.replace_val(h, 3) == DBS_WRONG_VALUE_TYPE);
+  datablock_type_t t;
+  assert(b.get_type(h, t) == DBS_SUCCESS);
+  assert(t == DBT_DOUBLE);
+  assert(b.get_val(-1, x) == DBS_NAME_NOT_FOUND);
+  assert(b.get_val(1000000, x) == DBS_NAME_NOT_FOUND);
+
+  // Copies have their own values, and do not share the stored locations
+  DataBlock c(b);
+  assert(c.replace_val(h, 0.9) == DBS_SUCCESS);
+  assert(b.get_val(h, x) == DBS_SUCCESS);
+  assert(x == 0.8);
+  assert(c.get_val(h, x) == DBS_SUCCESS);
+  assert(x == 0.9);
+
+  assert(b.delete_section("cosmo") == DBS_SUCCESS);
+  assert(b.get_val(h, x) == DBS_SECTION_NOT_FOUND);
+  assert(b.put_val("cosmo", "other", 1) == DBS_SUCCESS);
+  assert(b.get_val(h, x) == DBS_NAME_NOT_FOUND);
+  assert(b.put_val("cosmo", "h0", 0.6) == DBS_SUCCESS);
+  assert(b.get_val(h, x) == DBS_SUCCESS);
+  assert(x == 0.6);
+
+  // Only successful reads and writes count towards the bytes accessed
+  std::size_t nread = b.bytes_read(), nwritten = b.bytes_written();
+  assert(b.put_val("counts", "v", vector<double>(10, 1.0)) == DBS_SUCCESS);
+  assert(b.get_val(h, i) == DBS_WRONG_VALUE_TYPE);
+  assert(b.view<vector<double>>("counts", "v").size() == 10);
+  assert(b.get_val(h, x) == DBS_SUCCESS);
+  assert(b.bytes_written() == nwritten + 10 * sizeof(double));
+  assert(b.bytes_read() == nread + 11 * sizeof(double));
+
+  // set_val puts or replaces as needed
+  int om = DataBlock::get_handle("cosmo", "omega_m");
+  assert(b.set_val(om, 0.3) == DBS_SUCCESS);
+  assert(b.set_val(om, 0.25) == DBS_SUCCESS);
+  assert(b.get_val(om, x) == DBS_SUCCESS);
+  assert(x == 0.25);
+  assert(b.set_val(om, 2) == DBS_WRONG_VALUE_TYPE);
+  assert(b.set_val(-1, 0.3) == DBS_NAME_NOT_FOUND);
+}
 
 void test_types()
 {
@@ -213,6 +274,7 @@ int main()
   test_types();
   test_delete();
   test_copy();
+  test_handles();
 
   test_multidim(1.5, vector<size_t>{3,4,5});
 }
@@ -1,5 +1,6 @@
 from cosmosis.datablock.cosmosis_py import DataBlock
 import cosmosis.datablock.cosmosis_py.errors as errors
+import cosmosis.datablock.cosmosis_py.dbt_types as types
 import numpy as np
 import tempfile
 import os
@@ -133,6 +134,105 @@ def test_double_array():
     r = b.get_double_array_1d(section, 'x')
     assert (r==[1.4,2.1,3.6]).all() 
 
+def test_array_view():
+    b = DataBlock()
+    section='test'
+    x = np.arange(12.).reshape(3, 4)
+    b.put_double_array_nd(section, 'x', x)
+    b.put_int_array_1d(section, 'n', np.arange(5))
+    b.put_double_array_nd(section, 'empty', np.zeros((0, 3)))
+
+    v = b.get_array_view(section, 'x')
+    assert v.shape == (3, 4)
+    assert (v == x).all()
+    assert not v.flags.writeable
+    with pytest.raises(ValueError):
+        v[0, 0] = 1.0
+
+    n = b.get_array_view(section, 'n')
+    assert n.dtype == np.intc
+    assert (n == np.arange(5)).all()
+    assert b.get_array_view(section, 'empty').shape == (0, 3)
+
+    with pytest.raises(errors.BlockNameNotFound):
+        b.get_array_view(section, 'missing')
+    b.put_string(section, 's', 'my_string')
+    with pytest.raises(errors.BlockWrongValueType):
+        b.get_array_view(section, 's')
+
+    # Replacing or deleting the value leaves the view alone
+    b[section, 'x'] = x + 1
+    assert (v == x).all()
+    assert (b[section, 'x'] == x + 1).all()
+    b[section, 'x'] = np.arange(100.).reshape(10, 10)
+    assert (v == x).all()
+    w = b.get_array_view(section, 'n')
+    b._delete_section(section)
+    assert (w == np.arange(5)).all()
+    b.put_double_array_nd(section, 'x', x)
+    v = b.get_array_view(section, 'x')
+
+    # Once the views have gone the value is replaced in place again
+    address = v.ctypes.data
+    del v
+    b[section, 'x'] = x + 1
+    assert b.get_array_view(section, 'x').ctypes.data == address
+    v = b.get_array_view(section, 'x')
+
+    # The view should outlive the python block object
+    del b
+    assert (v == x + 1).all()
+
+    # Read-only and non-contiguous arrays can be stored
+    b = DataBlock()
+    b.put_double_array_nd(section, 'x', v)
+    b.put_double_array_nd(section, 'xt', x.T)
+    b.put_double_array_1d(section, 'col', x[:, 1])
+    assert (b[section, 'x'] == x + 1).all()
+    assert (b[section, 'xt'] == x.T).all()
+    assert (b[section, 'col'] == [1., 5., 9.]).all()
+
+def test_log_levels():
+    b = DataBlock()
+    assert b.get_log_level() == 2
+    b.log_access("MODULE-START", "first", "")
+    b['a', 'x'] = 1.0
+    for i in range(3):
+        b['a', 'x']
+        b.log_access("MODULE-START", "second", "")
+    log = b.get_log()
+    assert len(log) == b.get_log_count() == 8
+    assert log == [b.get_log_entry(i) for i in range(len(log))]
+    assert b.get_log(6) == log[6:]
+    assert log[1][:3] == ('WRITE-OK', 'a', 'x')
+
+    b = DataBlock()
+    b.set_log_level("first-use")
+    b.log_access("MODULE-START", "first", "")
+    b['a', 'x'] = 1.0
+    for i in range(3):
+        b['a', 'x']
+        b.log_access("MODULE-START", "second", "")
+    assert [entry[0] for entry in b.get_log()] == [
+        "MODULE-START", "WRITE-OK", "READ-OK", "MODULE-START", "MODULE-START", "MODULE-START"]
+
+    b.set_log_level("off")
+    b['a', 'x']
+    b['a', 'y'] = 2
+    assert b.get_log_count() == 6
+
+    with pytest.raises(ValueError):
+        b.set_log_level("verbose")
+
+def test_long_log_strings():
+    b = DataBlock()
+    name = "x" * 300
+    b['a', name] = 1.0
+    b.log_access("MODULE-START", "m" * 200, "")
+    log = b.get_log()
+    assert log[0][2] == name
+    assert log[1][1] == "m" * 200
+
 def test_keys():
     b = DataBlock()
     section='dogs'
@@ -148,7 +248,190 @@ def test_keys():
     for k in keys:
         assert k in b
 
+    # key_info and items get everything in one go
+    b.put_double_array_nd('other', 'grid', np.zeros((3, 4)))
+    info = b.key_info()
+    assert [(s, n) for (s, n, _, _) in info] == b.keys()
+    info = {(s, n): (t, size) for (s, n, t, size) in info}
+    assert info['dogs', 'x'] == (types.DBT_DOUBLE1D, 3)
+    assert info['dogs', 'n'] == (types.DBT_INT, -1)
+    assert info['other', 'grid'] == (types.DBT_DOUBLEND, 12)
+    assert b.keys('Dogs') == [('dogs', 'n'), ('dogs', 's'), ('dogs', 'x')]
+    items = dict(b.items())
+    assert items['dogs', 's'] == 'my_string'
+    assert items['other', 'a'] == 98
+    assert (items['dogs', 'x'] == [1.4, 2.1, 3.6]).all()
+    assert DataBlock().key_info() == []
+
+def test_clone_and_merge():
+    b = DataBlock()
+    x = np.arange(10.)
+    b['a', 'x'] = x
+    b['a', 'n'] = 3
+    b['b', 'y'] = 2.0
+
+    # Clones share values until one of them replaces them
+    c = b.clone()
+    v = b.get_array_view('a', 'x')
+    assert c.get_array_view('a', 'x').ctypes.data == v.ctypes.data
+    c['a', 'x'] = x * 2
+    c['a', 'n'] = 4
+    assert (b['a', 'x'] == x).all()
+    assert b['a', 'n'] == 3
+    assert (c['a', 'x'] == x * 2).all()
+    del b
+    assert (v == x).all()
+
+    d = DataBlock()
+    d['a', 'n'] = 10
+    d['a', 'z'] = 'keep'
+    d.merge(c, exclude=[('A', 'X')])
+    assert d.get_log()[-1][:2] == ('MERGE', 'b')
+    assert d.keys() == [('a', 'n'), ('a', 'z'), ('b', 'y')]
+    assert d['a', 'n'] == 4
+    assert d['a', 'z'] == 'keep'
+
+    e = DataBlock()
+    e['a', 'n'] = 10
+    e.merge(c, replace=False)
+    assert e['a', 'n'] == 10
+    assert (e['a', 'x'] == x * 2).all()
+    assert e['b', 'y'] == 2.0
+
+def test_handles():
+    h = DataBlock.handle('Cosmo', 'H0')
+    assert DataBlock.handle('cosmo', 'h0').id == h.id
+    n = DataBlock.handle('cosmo', 'n')
+    flag = DataBlock.handle('cosmo', 'flag')
+    x = DataBlock.handle('cosmo', 'x')
+
+    b = DataBlock()
+    with pytest.raises(errors.BlockSectionNotFound):
+        b[h]
+    b[h] = 0.7
+    b[n] = np.int64(3)
+    b[flag] = True
+    b[x] = np.arange(3.)
+    assert b['cosmo', 'h0'] == 0.7
+    assert h in b
+    b[h] = 0.8
+    assert b[h] == 0.8
+    assert b[n] == 3 and isinstance(b[n], int)
+    assert b[flag] is True
+    assert (b[x] == np.arange(3.)).all()
+    with pytest.raises(errors.BlockWrongValueType):
+        b[n] = 2.5
+
+    # Handles work in any block, and copies keep their own values
+    c = b.clone()
+    c[h] = 0.9
+    assert b[h] == 0.8
+    assert c[h] == 0.9
+    b._delete_section('cosmo')
+    with pytest.raises(errors.BlockSectionNotFound):
+        b[h]
+
+
+def test_put_get_many():
+    keys = [('cosmo', 'h0'), ('cosmo', 'omega_m'), ('other', 'x')]
+    handles = DataBlock.handles(keys)
+    assert [h.id for h in handles] == [DataBlock.handle(*key).id for key in keys]
+
+    b = DataBlock()
+    b.put_many(handles, np.array([0.7, 0.3, 1.5]))
+    assert b['cosmo', 'omega_m'] == 0.3
+    assert (b.get_many(keys) == [0.7, 0.3, 1.5]).all()
+
+    # Mixed types, including ones set individually, and replacing
+    b.put_many({('cosmo', 'h0'): 0.8, ('cosmo', 'n'): 3, ('cosmo', 'flag'): True,
+                ('cosmo', 'name'): 'lcdm', ('other', 'y'): np.arange(3.)})
+    assert b['cosmo', 'h0'] == 0.8
+    assert b['cosmo', 'n'] == 3 and isinstance(b['cosmo', 'n'], int)
+    assert b['cosmo', 'flag'] is True
+    assert b['cosmo', 'name'] == 'lcdm'
+    assert (b['other', 'y'] == np.arange(3.)).all()
+    assert (b.get_many([('cosmo', 'n')], dtype=int) == [3]).all()
+    assert 'REPLACE-FAIL' not in [log[0] for log in b.get_log()]
+
+    # Errors report the first failing key
+    with pytest.raises(errors.BlockNameNotFound) as error:
+        b.get_many([('cosmo', 'h0'), ('cosmo', 'missing'), ('other', 'missing')])
+    assert error.value.name == 'missing' and error.value.section == 'cosmo'
+    with pytest.raises(errors.BlockWrongValueType):
+        b.get_many([('cosmo', 'n')])
+    with pytest.raises(errors.BlockWrongValueType):
+        b.put_many([('cosmo', 'n')], [2.5])
+    with pytest.raises(ValueError):
+        b.put_many(keys, [1.0])
+
+    # Object arrays can mix types, and their floats must not be truncated
+    b = DataBlock()
+    b.put_many([('a', 'x'), ('a', 'y'), ('a', 'n')], np.array([0.5, 2.7, 4], dtype=object))
+    assert b['a', 'x'] == 0.5 and b['a', 'y'] == 2.7
+    assert b['a', 'n'] == 4 and isinstance(b['a', 'n'], int)
+
+
+def _pickle_test_block():
+    b = DataBlock()
+    b.put_double('cosmo', 'h0', 0.7)
+    b.put_int('cosmo', 'n', 3)
+    b.put_bool('cosmo', 'flag', True)
+    b.put_string('cosmo', 'name', 'lcdm')
+    b.put_string_array_1d('cosmo', 'labels', ['a', 'b', 'c'])
+    b.put_int_array_1d('cosmo', 'ell', np.arange(10))
+    b.put_metadata('cosmo', 'h0', 'unit', 'km/s/Mpc/100')
+    k = np.logspace(-4, 1, 500)
+    z = np.linspace(0, 3, 100)
+    p = np.outer(np.ones_like(k), 1 + z) * k[:, None]
+    b.put_grid('matter_power_lin', 'k_h', k, 'z', z, 'p_k', p)
+    b.put_int_array_nd('other', 'counts', np.arange(12).reshape(3, 4))
+    return b
+
+
+def test_pickle_binary():
+    import pickle
+    b = _pickle_test_block()
+    for protocol in [2, 4, 5]:
+        b2 = pickle.loads(pickle.dumps(b, protocol=protocol))
+        assert sorted(b2.keys()) == sorted(b.keys())
+        for (section, name) in b.keys():
+            v1 = b[section, name]
+            v2 = b2[section, name]
+            if isinstance(v1, np.ndarray):
+                assert v1.dtype == v2.dtype
+                assert v1.shape == v2.shape
+                assert (v1 == v2).all()
+            else:
+                assert v1 == v2
+        assert b2.get_metadata('cosmo', 'h0', 'unit') == 'km/s/Mpc/100'
+        k, z, p = b2.get_grid('matter_power_lin', 'k_h', 'z', 'p_k')
+        assert p.shape == (500, 100)
+
+    # out-of-band buffers should carry the array data
+    buffers = []
+    s = pickle.dumps(b, protocol=5, buffer_callback=buffers.append)
+    assert len(buffers) == 5
+    b3 = pickle.loads(s, buffers=buffers)
+    assert (b3['other', 'counts'] == b['other', 'counts']).all()
+
+
+def test_pickle_size():
+    import pickle
+    b = _pickle_test_block()
+    assert len(pickle.dumps(b)) < len(b.to_string())
+
 
+# Wall-clock comparisons are unreliable on busy machines,
+# so this only runs when asked for
+@pytest.mark.skipif(not os.environ.get("COSMOSIS_BENCHMARK"),
+                    reason="set COSMOSIS_BENCHMARK=1 to run benchmarks")
+def test_pickle_benchmark():
+    import pickle
+    import timeit
+    b = _pickle_test_block()
+    t_binary = min(timeit.repeat(lambda: pickle.loads(pickle.dumps(b)), number=1, repeat=5))
+    t_yaml = min(timeit.repeat(lambda: DataBlock.from_string(b.to_string()), number=1, repeat=3))
+    assert t_binary < t_yaml
 
 
 if __name__ == '__main__':
@@ -1,30 +1,37 @@
 from cosmosis.runtime import FunctionModule
 from cosmosis.datablock import DataBlock
-from cosmosis.gaussian_likelihood import GaussianLikelihood
+from cosmosis.gaussian_likelihood import GaussianLikelihood, WindowedGaussianLikelihood, simulate_from_block
+from cosmosis.runtime.shared_arrays import PosixSharedArrays
+from cosmosis.covariance import DenseCovariance, DiagonalCovariance, BlockDiagonalCovariance, \
+    BandedCovariance, LowRankCovariance, InverseCovariance
 import numpy as np
+import scipy.interpolate
+import pytest
 import os
 
-def test_gaussian():
-    class MyLikelihood(GaussianLikelihood):
-        x_section = "aaa"
-        x_name = "a"
-        y_section = "bbb"
-        y_name = "b"
-        like_name = "lll"
+class MyLikelihood(GaussianLikelihood):
+    x_section = "aaa"
+    x_name = "a"
+    y_section = "bbb"
+    y_name = "b"
+    like_name = "lll"
 
-        def build_data(self):
-            x_obs = np.array([1.0, 2.0, 3.0])
-            y_obs = x_obs * 2
-            return x_obs, y_obs
+    def build_data(self):
+        x_obs = np.array([1.0, 2.0, 3.0])
+        y_obs = x_obs * 2
+        return x_obs, y_obs
 
-        def build_covariance(self):
-            covmat = np.diag([0.1, 0.1, 0.1])
-            return covmat
+    def build_covariance(self):
+        covmat = np.diag([0.1, 0.1, 0.1])
+        return covmat
 
+
+@pytest.mark.parametrize("shared_memory", [False, True])
+def test_gaussian(shared_memory):
     mod = MyLikelihood.as_module("my")
 
     # no extra config info
-    mod.setup({"my":{"include_norm":True}})
+    mod.setup({"my":{"include_norm":True, "shared_memory":shared_memory}})
 
     block = DataBlock()
     block["aaa", "a"] = np.arange(5.)
@@ -39,8 +46,275 @@ def test_gaussian():
     assert np.isclose(block["likelihoods", "lll_like"], -3*np.log(0.1)/2)
 
 
+def test_gaussian_batch():
+    mod = MyLikelihood.as_module("my")
+    mod.setup({"my":{"include_norm":True}})
+
+    blocks = []
+    for i in range(4):
+        block = DataBlock()
+        block["aaa", "a"] = np.arange(5.)
+        block["bbb", "b"] = np.arange(5.) * 2 + 0.1 * i
+        blocks.append(block)
+    assert mod.execute_batch(blocks) == [0, 0, 0, 0]
+
+    for i, block in enumerate(blocks):
+        single = DataBlock()
+        single["aaa", "a"] = np.arange(5.)
+        single["bbb", "b"] = np.arange(5.) * 2 + 0.1 * i
+        mod.execute(single)
+        assert np.isclose(block["data_vector", "lll_chi2"], 3 * (0.1 * i)**2 / 0.1)
+        assert np.isclose(block["likelihoods", "lll_like"], single["likelihoods", "lll_like"])
+
+
+@pytest.mark.parametrize("kind", ["linear", "cubic"])
+def test_interpolation_operator(kind):
+    mod = MyLikelihood.as_module("my")
+    mod.setup({"my":{"kind":kind}})
+    like = mod.data
+
+    theory_x = np.linspace(0.0, 4.0, 50)
+    for i in range(3):
+        theory_y = np.sin(theory_x + i)
+        expected = scipy.interpolate.interp1d(theory_x, theory_y, kind=kind)(like.data_x)
+        assert np.allclose(like.generate_theory_points(theory_x, theory_y), expected)
+        # The operator is made once the grid has been seen twice
+        assert (like._operator is None) == (i == 0)
+
+    # A new grid goes back to the spline
+    theory_x = np.linspace(0.0, 5.0, 40)
+    expected = scipy.interpolate.interp1d(theory_x, theory_x**2, kind=kind)(like.data_x)
+    assert np.allclose(like.generate_theory_points(theory_x, theory_x**2), expected)
+    assert like._operator is None
+
+
+def _structured_covariances():
+    n = 6
+    rng = np.random.default_rng(42)
+    A = rng.normal(size=(n, n))
+    dense = A @ A.T + n * np.eye(n)
+    variance = rng.uniform(1.0, 2.0, n)
+    factor = rng.normal(size=(n, 2))
+    banded = np.diag(variance) + np.diag(0.3 * variance[1:], 1) + np.diag(0.3 * variance[1:], -1)
+    block = np.diag(variance)
+    block[:3, :3] = dense[:3, :3]
+    return [
+        (DenseCovariance(dense), dense),
+        (InverseCovariance(np.linalg.inv(dense)), dense),
+        (DiagonalCovariance(variance), np.diag(variance)),
+        (BlockDiagonalCovariance([dense[:3, :3], DiagonalCovariance(variance[3:])]), block),
+        (BandedCovariance.from_matrix(banded, 1), banded),
+        (LowRankCovariance(variance, factor), np.diag(variance) + factor @ factor.T),
+    ]
+
+
+@pytest.mark.parametrize("covariance,matrix", _structured_covariances())
+def test_covariance_types(covariance, matrix):
+    d = np.random.default_rng(1).normal(size=(3, len(matrix)))
+    inverse = np.linalg.inv(matrix)
+    chi2 = np.einsum('ni,ij,nj->n', d, inverse, d)
+    assert np.allclose(covariance.chi2(d), chi2)
+    assert np.isclose(covariance.chi2(d[0]), chi2[0])
+    assert np.isclose(covariance.log_determinant(), np.linalg.slogdet(matrix)[1])
+    assert np.allclose(covariance.inverse(), inverse)
+    assert np.allclose(covariance.matrix(), matrix)
+    assert covariance.simulate().shape == (len(matrix),)
+
+
+class BandedLikelihood(MyLikelihood):
+    def build_covariance(self):
+        return BandedCovariance(np.array([[0.0, 0.02, 0.02], [0.1, 0.1, 0.1]]))
+
+
+def test_structured_likelihood():
+    dense = np.diag([0.1, 0.1, 0.1]) + np.diag([0.02, 0.02], 1) + np.diag([0.02, 0.02], -1)
+    theory = np.arange(5.) * 2 + np.array([0.0, 0.1, -0.2, 0.3, 0.0])
+    results = []
+    for cls in [BandedLikelihood, MyLikelihood]:
+        mod = cls.as_module("my")
+        mod.setup({"my":{"include_norm":True}})
+        block = DataBlock()
+        block["aaa", "a"] = np.arange(5.)
+        block["bbb", "b"] = theory
+        mod.execute(block)
+        results.append(block)
+
+    d = theory[1:4] - np.array([1.0, 2.0, 3.0]) * 2
+    assert np.isclose(results[0]["data_vector", "lll_chi2"], d @ np.linalg.solve(dense, d))
+    assert np.isclose(results[0]["data_vector", "lll_log_det"], np.linalg.slogdet(dense)[1])
+    assert np.allclose(results[0]["data_vector", "lll_inverse_covariance"], np.linalg.inv(dense))
+    assert not results[0].has_value("data_vector", "lll_covariance")
+    assert results[1].has_value("data_vector", "lll_covariance")
+
+
+@pytest.mark.parametrize("save_simulation", [None, False, True])
+def test_constant_outputs(save_simulation):
+    mod = MyLikelihood.as_module("my")
+    if save_simulation is None:
+        # The default is to simulate on demand
+        mod.setup({"my":{}})
+        save_simulation = False
+    else:
+        mod.setup({"my":{"save_simulation":save_simulation}})
+
+    blocks = []
+    for i in range(2):
+        block = DataBlock()
+        block["aaa", "a"] = np.arange(5.)
+        block["bbb", "b"] = np.arange(5.) * 2 + i
+        mod.execute(block)
+        blocks.append(block)
+
+    for block in blocks:
+        assert np.allclose(block["data_vector", "lll_data"], [2.0, 4.0, 6.0])
+        assert np.allclose(block["data_vector", "lll_covariance"], np.diag([0.1, 0.1, 0.1]))
+        assert np.allclose(block["data_vector", "lll_inverse_covariance"], np.diag([10., 10., 10.]))
+        # Simulations are only made when asked for, unless save_simulation is set
+        assert block.has_value("data_vector", "lll_simulation") == save_simulation
+        sim = simulate_from_block(block, "lll")
+        assert sim.shape == (3,)
+        assert np.allclose(block["data_vector", "lll_simulation"], sim)
+
+    # Changing the values in one block does not affect the others
+    blocks[0]["data_vector", "lll_data"] = np.zeros(3)
+    assert np.allclose(blocks[1]["data_vector", "lll_data"], [2.0, 4.0, 6.0])
+
+
+class MyNoisyLikelihood(MyLikelihood):
+    def build_covariance(self):
+        return np.diag([1e6, 1e6, 1e6])
+
+
+def test_simulate_from_block():
+    # Two likelihoods with the same like_name must each simulate
+    # from their own covariance
+    mods = [MyLikelihood.as_module("my"), MyNoisyLikelihood.as_module("my")]
+    for mod in mods:
+        mod.setup({"my":{"save_simulation":False}})
+
+    deviations = []
+    for mod in mods:
+        block = DataBlock()
+        block["aaa", "a"] = np.arange(5.)
+        block["bbb", "b"] = np.arange(5.) * 2
+        mod.execute(block)
+        sim = simulate_from_block(block, "lll")
+        deviations.append(np.abs(sim - block["data_vector", "lll_theory"]).max())
+    assert deviations[0] < 10.0
+    assert deviations[1] > 10.0
+
+    # The likelihoods are not kept alive just to make simulations
+    import gc
+    from cosmosis import gaussian_likelihood
+    n = len(gaussian_likelihood._simulators)
+    del mods, mod
+    gc.collect()
+    assert len(gaussian_likelihood._simulators) == n - 2
+
+
+class MyWindowedLikelihood(WindowedGaussianLikelihood):
+    x_section = "aaa"
+    x_name = "a"
+    y_section = "bbb"
+    y_name = "b"
+    like_name = "www"
+
+    def build_data(self):
+        return np.arange(3.), np.zeros(3)
+
+    def build_covariance(self):
+        return np.eye(3)
+
+    def build_windows(self):
+        # Triangular windows of different widths
+        windows = []
+        for i in range(3):
+            window_x = np.linspace(i + 0.5, i + 2.0 + i, 7)
+            window_y = 1 - np.abs(np.linspace(-1, 1, 7))
+            windows.append((window_x, window_y))
+        return windows
+
+
+@pytest.mark.parametrize("kind", ["linear", "cubic"])
+def test_windowed(kind):
+    mod = MyWindowedLikelihood.as_module("my")
+    mod.setup({"my":{"kind":kind, "window_check":True}})
+    like = mod.data
+
+    theory_x = np.linspace(0.0, 6.0, 40)
+    theory_y = np.sin(theory_x) + theory_x**2
+    values = like.generate_theory_points(theory_x, theory_y)
+    assert np.allclose(values, like.integrate_windows(theory_x, theory_y), rtol=1e-8)
+
+    # The same matrix is used for new theory on the same grid
+    operator = like._operator
+    values = like.generate_theory_points(theory_x, 2 * theory_y)
+    assert like._operator is operator
+    assert np.allclose(values, like.integrate_windows(theory_x, 2 * theory_y), rtol=1e-8)
+
+
+def test_shared_arrays():
+    namespace = "test{}".format(os.getpid())
+    store = PosixSharedArrays(namespace)
+    other = PosixSharedArrays(namespace)
+    x = np.arange(12.).reshape(3, 4)
+    a = store.get("x", lambda: x)
+    assert (a == x).all() and a.shape == x.shape
+    assert not a.flags.writeable
+
+    # The second store attaches to the same memory instead of building it
+    def fail():
+        raise AssertionError("should not be built twice")
+    b = other.get("x", fail)
+    assert (b == x).all() and b.dtype == x.dtype
+    assert store.owned_nbytes() == x.nbytes and other.owned_nbytes() == 0
+    assert other.nbytes() == x.nbytes
+
+    n = other.get("n", np.arange(5))
+    assert (store.get("n", fail) == np.arange(5)).all()
+    other.close()
+    store.close()
+
+
+class CountingLikelihood(MyLikelihood):
+    builds = 0
+
+    def build_covariance(self):
+        CountingLikelihood.builds += 1
+        return super().build_covariance()
+
+
+def test_shared_covariance():
+    # Only the process that publishes the covariance builds it
+    for i in range(2):
+        mod = CountingLikelihood.as_module("my")
+        mod.setup({"my":{"shared_memory":True}})
+    assert CountingLikelihood.builds == 1
+
+    # Structured covariances are built by each process instead
+    mod = BandedLikelihood.as_module("my")
+    mod.setup({"my":{"shared_memory":True}})
+    block = DataBlock()
+    block["aaa", "a"] = np.arange(5.)
+    block["bbb", "b"] = np.arange(5.) * 2
+    mod.execute(block)
+    assert np.isclose(block["data_vector", "lll_chi2"], 0.0)
+
+
+def test_mpi_shared_array_error():
+    MPI = pytest.importorskip("mpi4py.MPI")
+    from cosmosis.runtime.shared_arrays import MPISharedArrays
+    store = MPISharedArrays(MPI.COMM_SELF)
+    def fail():
+        raise np.linalg.LinAlgError("not positive definite")
+    # The error reaches every process rather than leaving them waiting
+    with pytest.raises(np.linalg.LinAlgError):
+        store.get("bad", fail)
+    assert (store.get("good", np.arange(3.)) == np.arange(3.)).all()
+    store.close()
+
 
 if __name__ == '__main__':
-    test_gaussian()
+    test_gaussian(False)
 
 
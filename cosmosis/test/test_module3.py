@@ -9,3 +9,13 @@ def execute(block, config):
     like = -(p3**2 + p4**2)/2.
     block['likelihoods', 'test3_like'] = like
     return 0
+
+def execute_batch(blocks, config):
+    # The same as execute, but vectorised over the blocks
+    config['batch_calls'] = config.get('batch_calls', 0) + 1
+    p3 = np.array([block['parameters', 'p3'] for block in blocks])
+    p4 = np.array([block['parameters', 'p4'] for block in blocks])
+    like = -(p3**2 + p4**2)/2.
+    for block, l in zip(blocks, like):
+        block['likelihoods', 'test3_like'] = l
+    return [0] * len(blocks)
@@ -3,7 +3,10 @@ from cosmosis.datablock import DataBlock
 from cosmosis.samplers.sampler import Sampler
 from cosmosis.runtime.prior import TruncatedGaussianPrior, DeltaFunctionPrior
 from cosmosis.output.in_memory_output import InMemoryOutput
+from cosmosis.runtime import process_pool
+from cosmosis.runtime.block_cache import BlockCache, block_nbytes
 import numpy as np
+import json
 import os
 import tempfile
 
@@ -71,6 +74,370 @@ def test_add_param():
 
     return output
 
+def test_prior_batch():
+    values = tempfile.NamedTemporaryFile('w')
+    values.write(
+        "[parameters]\n"
+        "p1=-3.0  0.0  3.0\n"
+        "p2=-3.0  0.0  3.0\n")
+    values.flush()
+
+    override = {
+        ('runtime', 'root'): root,
+        ("pipeline", "debug"): "F",
+        ("pipeline", "quiet"): "T",
+        ("pipeline", "modules"): "test2",
+        ("pipeline", "values"): values.name,
+        ("test2", "file"): "test_module2.py",
+    }
+
+    pipeline = LikelihoodPipeline(Inifile(None, override=override))
+
+    # Include some points outside the allowed ranges
+    P = np.random.uniform(-4.0, 4.0, size=(200, 3))
+    P[:, 2] = np.random.uniform(-1.5, 1.5, size=200)
+    batch = pipeline.prior_batch(P)
+    expected = np.array([pipeline.prior(p) for p in P])
+    assert np.isinf(expected).any() and np.isfinite(expected).any()
+    assert np.allclose(batch, expected)
+    assert np.array_equal(np.isfinite(batch), np.isfinite(expected))
+
+    names = [name for name, _ in pipeline.prior_batch(P, total_only=False)]
+    assert names == [name for name, _ in pipeline.prior(P[0], total_only=False)]
+
+    # Transforming from the unit cube in bulk
+    X = np.random.uniform(0.0, 1.0, size=(50, 3))
+    bulk = pipeline.denormalize_vector_from_prior(X)
+    single = np.array([pipeline.denormalize_vector_from_prior(x) for x in X])
+    assert np.allclose(bulk, single)
+    assert np.isfinite(pipeline.prior_batch(bulk)).all()
+
+
+def test_varied_arrays():
+    values = tempfile.NamedTemporaryFile('w')
+    values.write(
+        "[parameters]\n"
+        "p1=-3.0  0.0  3.0\n"
+        "p2=-3.0  0.0  3.0\n"
+        "p4=0.1  0.5  2.0\n"
+        "p5=1.0\n")
+    values.flush()
+    priors = tempfile.NamedTemporaryFile('w')
+    priors.write(
+        "[parameters]\n"
+        "p2=gaussian -5.0 1.0\n"
+        "p4=exponential 1.0\n")
+    priors.flush()
+
+    override = {
+        ('runtime', 'root'): root,
+        ("pipeline", "debug"): "F",
+        ("pipeline", "quiet"): "T",
+        ("pipeline", "modules"): "test2",
+        ("pipeline", "values"): values.name,
+        ("pipeline", "priors"): priors.name,
+        ("test2", "file"): "test_module2.py",
+    }
+    pipeline = LikelihoodPipeline(Inifile(None, override=override))
+    params = pipeline.varied_params
+    ndim = len(params)
+
+    # Each method should agree with the Parameter objects, for single
+    # vectors and for batches of them
+    X = np.random.uniform(0.0, 1.0, size=(20, ndim))
+    for x in X:
+        p = pipeline.denormalize_vector_from_prior(x)
+        assert np.allclose(p, [param.denormalize_from_prior(xi) for param, xi in zip(params, x)])
+        assert np.allclose(pipeline.denormalize_vector(x), [param.denormalize(xi) for param, xi in zip(params, x)])
+        assert np.allclose(pipeline.normalize_vector(p), [param.normalize(pi) for param, pi in zip(params, p)])
+    P = pipeline.denormalize_vector_from_prior(X)
+    assert P.shape == X.shape
+    assert np.allclose(P, [pipeline.denormalize_vector_from_prior(x) for x in X])
+    assert np.allclose(pipeline.normalize_vector(P), [pipeline.normalize_vector(p) for p in P])
+    assert np.allclose(pipeline.denormalize_vector(X), [pipeline.denormalize_vector(x) for x in X])
+
+    P = np.random.uniform(-4.0, 4.0, size=(100, ndim))
+    out = pipeline.is_out_of_range(P)
+    assert out.any() and not out.all()
+    assert list(out) == [any(not param.in_range(pi) for param, pi in zip(params, p)) for p in P]
+    assert pipeline.is_out_of_range(P[out][0]) is True
+
+    try:
+        pipeline.denormalize_vector(np.full(ndim, 1.5))
+    except ValueError as error:
+        assert "not normalized" in str(error)
+    else:
+        assert False, "denormalize_vector accepted a value outside [0, 1]"
+    assert np.allclose(pipeline.denormalize_vector(np.full(ndim, 1.5), raise_exception=False),
+                       [param.denormalize(1.5, False) for param in params])
+
+    width = np.array([param.width() for param in params])
+    C = np.random.normal(size=(ndim, ndim))
+    assert np.allclose(pipeline.normalize_matrix(C), C / np.outer(width, width))
+    assert np.allclose(pipeline.denormalize_matrix(pipeline.normalize_matrix(C)), C)
+    assert np.allclose(pipeline.denormalize_matrix(C, inverse=True), pipeline.normalize_matrix(C))
+
+    # Changing which parameters vary must rebuild the arrays
+    pipeline.set_fixed("parameters", "p1", 0.5)
+    assert pipeline.nvaried == ndim - 1
+    assert np.allclose(pipeline.min_vector(), [param.limits[0] for param in pipeline.varied_params])
+    pipeline.set_varied("parameters", "p5", 0.0, 2.0)
+    assert pipeline.nvaried == ndim
+    assert np.allclose(pipeline.max_vector(), [param.limits[1] for param in pipeline.varied_params])
+    assert np.allclose(pipeline.start_vector(), [param.start for param in pipeline.varied_params])
+    assert pipeline.normalize_vector(pipeline.start_vector()).shape == (ndim,)
+
+
+def test_fast_slow_cache():
+    values = tempfile.NamedTemporaryFile('w')
+    values.write(
+        "[parameters]\n"
+        "p1=-3.0  0.0  3.0\n"
+        "p2=-3.0  0.0  3.0\n"
+        "p4=-3.0  0.0  3.0\n")
+    values.flush()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        override = {
+            ('runtime', 'root'): root,
+            ("pipeline", "debug"): "F",
+            ("pipeline", "quiet"): "T",
+            ("pipeline", "modules"): "test1 test3",
+            ("pipeline", "values"): values.name,
+            ("pipeline", "fast_slow"): "T",
+            ("pipeline", "first_fast_module"): "test3",
+            ("pipeline", "fast_slow_cache_dir"): cache_dir,
+            ("test1", "file"): "test_module.py",
+            ("test3", "file"): "test_module3.py",
+        }
+
+        def make_pipeline():
+            pipeline = LikelihoodPipeline(Inifile(None, override=override))
+            pipeline.setup_fast_subspaces()
+            return pipeline
+
+        pipeline = make_pipeline()
+        assert [str(p) for p in pipeline.fast_params] == ["parameters--p4"]
+        cache = pipeline.slow_subspace_cache.cache
+
+        # Only the fast parameter changes, so all but the first are hits
+        posts = [pipeline.posterior([0.5, -0.5, p4])[0] for p4 in [0.1, 0.2, 0.3]]
+        assert (cache.misses, cache.hits) == (1, 2)
+        log_prior = -3 * np.log(6.0)
+        expected = [log_prior - (0.5**2 + 0.5**2)/2 - p4**2/2 for p4 in [0.1, 0.2, 0.3]]
+        assert np.allclose(posts, expected)
+
+        # A new slow point is a miss, and pushes the first one out
+        # of memory if there is no room for both
+        pipeline.slow_subspace_cache.cache.memory_limit = 0
+        pipeline.posterior([1.0, -0.5, 0.1])
+        assert cache.misses == 2 and cache.evictions == 1 and len(cache) == 1
+
+        # A fresh pipeline can pick up the results saved on disk
+        pipeline = make_pipeline()
+        cache = pipeline.slow_subspace_cache.cache
+        post = pipeline.posterior([0.5, -0.5, 0.4])[0]
+        assert cache.disk_hits == 1 and cache.misses == 0
+        assert np.isclose(post, log_prior - (0.5**2 + 0.5**2)/2 - 0.4**2/2)
+
+
+def test_block_cache():
+    def make_block(i):
+        block = DataBlock()
+        block["x", "y"] = np.arange(1000.) + i
+        block["x", "n"] = i
+        return block
+
+    assert 8000 < block_nbytes(make_block(0)) < 8500
+
+    # Without a disk store the blocks are never packed up
+    cache = BlockCache(20000)
+    for i in range(3):
+        block = make_block(i)
+        block.to_binary = None
+        cache.put(i, block)
+    assert len(cache) == 2 and cache.evictions == 1
+    assert cache.get(0) is None
+    assert cache.get(2)["x", "n"] == 2
+
+    with tempfile.TemporaryDirectory() as dirname:
+        cache = BlockCache(20000, dirname)
+        cache.put("a", make_block(5))
+        cache.clear()
+        assert (cache.get("a")["x", "y"] == np.arange(1000.) + 5).all()
+        assert cache.disk_hits == 1 and cache.nbytes == block_nbytes(make_block(5))
+
+
+def test_memoize():
+    values = tempfile.NamedTemporaryFile('w')
+    values.write(
+        "[parameters]\n"
+        "p1=-3.0  0.0  3.0\n"
+        "p2=-3.0  0.0  3.0\n"
+        "p4=-3.0  0.0  3.0\n")
+    values.flush()
+
+    override = {
+        ('runtime', 'root'): root,
+        ("pipeline", "debug"): "F",
+        ("pipeline", "quiet"): "T",
+        ("pipeline", "modules"): "test1 test3",
+        ("pipeline", "values"): values.name,
+        ("pipeline", "memoize"): "T",
+        ("test1", "file"): "test_module.py",
+        ("test3", "file"): "test_module3.py",
+    }
+    pipeline = LikelihoodPipeline(Inifile(None, override=override))
+    memoizer = pipeline.module_memoizer
+
+    def expected(p1, p2, p4):
+        return -3 * np.log(6.0) - (p1**2 + p2**2)/2 - ((p1 + p2)**2 + p4**2)/2
+
+    # The second module only depends on p1 and p2 through their sum,
+    # so it can be skipped for the last point even though the first cannot.
+    points = [(0.5, -0.5, 0.1), (0.5, -0.5, 0.2), (0.5, -0.5, 0.1), (0.6, -0.6, 0.1)]
+    skips = [(0, 0), (1, 0), (2, 1), (2, 2)]
+    for p, s in zip(points, skips):
+        post, _ = pipeline.posterior(p)
+        assert np.isclose(post, expected(*p))
+        assert tuple(memoizer.skips) == s
+
+    assert memoizer.inputs[0] == [("parameters", "p1"), ("parameters", "p2")]
+    assert memoizer.inputs[1] == [("parameters", "p3"), ("parameters", "p4")]
+
+    # Memoizing needs the full log, whatever we ask for
+    override[("pipeline", "access_log")] = "off"
+    pipeline = LikelihoodPipeline(Inifile(None, override=override))
+    assert pipeline.log_level == "full"
+
+
+def test_run_results_batch():
+    values = tempfile.NamedTemporaryFile('w')
+    values.write(
+        "[parameters]\n"
+        "p1=-3.0  0.0  3.0\n"
+        "p2=-3.0  0.0  3.0\n"
+        "p4=-3.0  0.0  3.0\n")
+    values.flush()
+
+    override = {
+        ('runtime', 'root'): root,
+        ("pipeline", "debug"): "F",
+        ("pipeline", "quiet"): "T",
+        ("pipeline", "modules"): "test1 test3",
+        ("pipeline", "values"): values.name,
+        ("pipeline", "extra_output"): "parameters/p3",
+        ("test1", "file"): "test_module.py",
+        ("test3", "file"): "test_module3.py",
+    }
+    pipeline = LikelihoodPipeline(Inifile(None, override=override))
+
+    # The second point is outside the prior so is not run
+    P = np.array([[0.5, -0.2, 0.1], [4.0, 0.0, 0.0], [0.3, 0.3, -1.0]])
+    results = pipeline.run_results_batch(P)
+    expected = [pipeline.run_results(p) for p in P]
+    for r, e in zip(results, expected):
+        assert np.isclose(r.post, e.post) and np.isclose(r.prior, e.prior)
+        assert np.allclose(r.extra, e.extra, equal_nan=True)
+        assert (r.block is None) == (e.block is None)
+    assert results[1].post == -np.inf
+    assert results[0].block["priors", "parameters--p1"] == expected[0].block["priors", "parameters--p1"]
+
+    # The first module has no batch function so is run on each point,
+    # and the second is run once on both the good points
+    assert pipeline.modules[1].data["batch_calls"] == 1
+    assert pipeline.module_stats[0].calls == 4
+    assert pipeline.module_stats[1].calls == 4
+
+
+def test_access_log():
+    values = tempfile.NamedTemporaryFile('w')
+    values.write(
+        "[parameters]\n"
+        "p1=-3.0  0.0  3.0\n"
+        "p2=-3.0  0.0  3.0\n")
+    values.flush()
+
+    override = {
+        ('runtime', 'root'): root,
+        ("pipeline", "debug"): "F",
+        ("pipeline", "quiet"): "T",
+        ("pipeline", "modules"): "test1",
+        ("pipeline", "values"): values.name,
+        ("test1", "file"): "test_module.py",
+    }
+    for level, new_entries in [("full", 2), ("first-use", 1), ("off", 0)]:
+        override[("pipeline", "access_log")] = level
+        pipeline = LikelihoodPipeline(Inifile(None, override=override))
+        _, _, data = pipeline.posterior([0.5, -0.5], return_data=True)
+        nlog = data.get_log_count()
+        assert (nlog == 0) == (level == "off")
+        data["parameters", "p3"]
+        data["parameters", "p3"]
+        assert data.get_log_count() == nlog + new_entries
+
+
+_stats_pipeline = None
+
+def _run_stats_pipeline(p):
+    return _stats_pipeline.posterior(p)[0]
+
+def test_module_stats():
+    global _stats_pipeline
+    values = tempfile.NamedTemporaryFile('w')
+    values.write(
+        "[parameters]\n"
+        "p1=-3.0  0.0  3.0\n"
+        "p2=-3.0  0.0  3.0\n")
+    values.flush()
+    report = tempfile.NamedTemporaryFile('w', suffix=".json")
+
+    override = {
+        ('runtime', 'root'): root,
+        ("pipeline", "quiet"): "T",
+        ("pipeline", "modules"): "test1",
+        ("pipeline", "values"): values.name,
+        ("pipeline", "module_stats"): report.name,
+        ("test1", "file"): "test_module.py",
+    }
+    _stats_pipeline = pipeline = LikelihoodPipeline(Inifile(None, override=override))
+    for i in range(3):
+        pipeline.posterior([0.1 * i, 0.2])
+    stats = pipeline.module_stats[0]
+    assert stats.calls == 3 and stats.failures == 0
+    # The module reads two doubles and writes eight each time
+    assert stats.bytes_read == 3 * 16
+    assert stats.bytes_written == 3 * 64
+    assert stats.min_time <= stats.percentile(50) <= stats.percentile(95) <= stats.max_time
+
+    # The runs in forked workers are added in at the end
+    with process_pool.Pool(2) as pool:
+        pool.map(_run_stats_pipeline, [[0.1, 0.1]] * 4)
+        pool.close()
+        pipeline.write_module_stats(pool)
+
+    with open(report.name) as f:
+        summary = json.load(f)["modules"][0]
+    assert summary["module"] == "test1"
+    assert summary["calls"] == 7
+    assert summary["bytes_read"] == 7 * 16
+    assert not os.path.exists(pipeline.module_stats.spool_directory)
+
+    # Without a report the workers should not spool anything at all
+    del override[("pipeline", "module_stats")]
+    reporting_pipeline = pipeline
+    _stats_pipeline = pipeline = LikelihoodPipeline(Inifile(None, override=override))
+    with process_pool.Pool(2) as pool:
+        pool.map(_run_stats_pipeline, [[0.1, 0.1]] * 4)
+    pipeline.write_module_stats()
+    pipeline.cleanup()
+    assert pipeline.module_stats[0].calls == 0
+    assert not os.path.exists(pipeline.module_stats.spool_directory)
+    # but the first pipeline still spools from these workers too
+    reporting_pipeline.cleanup()
+    assert not os.path.exists(reporting_pipeline.module_stats.spool_directory)
+
+
 def test_missing_setup():
     # check the register_new_parameter feature when no
     # setup is currently happening
@@ -1,17 +1,19 @@
 from cosmosis.runtime.config import Inifile
-from cosmosis.samplers.sampler import Sampler
+from cosmosis.samplers.sampler import Sampler, ParallelSampler
 import cosmosis.samplers.minuit.minuit_sampler
 from cosmosis.runtime.pipeline import LikelihoodPipeline
 from cosmosis.output.in_memory_output import InMemoryOutput
+from cosmosis.runtime import process_pool
 import tempfile
 import os
 import sys
+import types
 import pytest
 import numpy as np
 
 minuit_compiled = os.path.exists(cosmosis.samplers.minuit.minuit_sampler.libname)
 
-def run(sampler, check_prior, check_extra=True, **options):
+def run(sampler, check_prior, check_extra=True, pool=None, **options):
 
     sampler_class = Sampler.registry[sampler]
 
@@ -42,12 +44,19 @@ def run(sampler, check_prior, check_extra=True, **options):
     pipeline = LikelihoodPipeline(ini)
 
     output = InMemoryOutput()
-    sampler = sampler_class(ini, pipeline, output)
+    if pool is None:
+        sampler = sampler_class(ini, pipeline, output)
+    else:
+        sampler = sampler_class(ini, pipeline, output, pool)
     sampler.config()
 
 
     while not sampler.is_converged():
         sampler.execute()
+    sampler.cleanup()
+
+    if pool is not None:
+        pool.close()
 
     if check_prior:
         pr = np.array(output['prior'])
@@ -75,12 +84,171 @@ def test_dynesty():
 def test_emcee():
     run('emcee', True, walkers=8, samples=100)
 
+def test_emcee_smp():
+    with process_pool.Pool(2) as pool:
+        run('emcee', True, pool=pool, walkers=8, samples=20)
+
 def test_fisher():
     run('fisher', False, check_extra=False)
 
 def test_grid():
     run('grid', True, nsample_dimension=10)
 
+def test_grid_save_archive():
+    from cosmosis.runtime.block_archive import BlockArchive
+    with tempfile.TemporaryDirectory() as dirname:
+        save = os.path.join(dirname, "grid_blocks")
+        with process_pool.Pool(2) as pool:
+            output = run('grid', True, pool=pool, nsample_dimension=4, save=save, save_format='archive')
+        with BlockArchive(save + ".blocks") as archive:
+            assert archive.samples() == list(range(16))
+            assert 'parameters' in archive.sections(5)
+            params = archive.read_section(5, 'parameters')
+            assert params['p1'] == output['parameters--p1'][5]
+            assert params['p2'] == output['parameters--p2'][5]
+            block = archive.read_block(15)
+            assert block['parameters', 'p3'] == output['PARAMETERS--P3'][15]
+            assert block['likelihoods', 'test_like'] == output['post'][15] - output['prior'][15]
+            assert (block['data_vector', 'test_theory'] == [block['parameters', 'p1'], block['parameters', 'p2']]).all()
+
+def test_list():
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, "chain.txt")
+        with open(filename, "w") as f:
+            f.write("#parameters--p1 parameters--p2\n0.5 1.0\n2.0 -2.0\n")
+        override = {
+            ('runtime', 'root'): os.path.split(os.path.abspath(__file__))[0],
+            ("pipeline", "debug"): "F",
+            ("pipeline", "quiet"): "T",
+            ("pipeline", "modules"): "test1",
+            ("pipeline", "values"): os.path.join(dirname, "values.ini"),
+            ("test1", "file"): "test_module.py",
+            ("list", "filename"): filename,
+        }
+        with open(override[("pipeline", "values")], "w") as f:
+            f.write("[parameters]\np1=-3.0  0.0  3.0\np2=-3.0  0.0  3.0\np3=1.0\n")
+        ini = Inifile(None, override=override)
+        pipeline = LikelihoodPipeline(ini)
+        pipeline.min_vector()
+        output = InMemoryOutput()
+        sampler = Sampler.registry['list'](ini, pipeline, output)
+        sampler.config()
+        # The limits are removed from every parameter, and the
+        # cached arrays of them are updated to match
+        assert pipeline.nvaried == 3
+        assert np.isinf(pipeline.min_vector()).all() and np.isinf(pipeline.max_vector()).all()
+        while not sampler.is_converged():
+            sampler.execute()
+        sampler.cleanup()
+    assert np.allclose(output['parameters--p1'], [0.5, 2.0])
+    assert np.allclose(output['parameters--p3'], [1.0, 1.0])
+
+def test_block_archive_append():
+    from cosmosis.runtime.block_archive import BlockArchive, BlockArchiveWriter, pack_block
+    from cosmosis.datablock import DataBlock
+    block = DataBlock()
+    block['parameters', 'x'] = 1.5
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, "test.blocks")
+        with BlockArchiveWriter(filename) as writer:
+            writer.write(block, 0)
+            # A record cut short, as if the run was killed
+            writer.append(pack_block(block, 1)[:20])
+        # A resumed run keeps the complete records and replaces the partial one
+        with BlockArchiveWriter(filename, append=True) as writer:
+            writer.write(block, 2)
+        with BlockArchive(filename) as archive:
+            assert archive.samples() == [0, 2]
+            assert archive.read_section(2, 'parameters')['x'] == 1.5
+        # Otherwise the file is replaced
+        with BlockArchiveWriter(filename) as writer:
+            writer.write(block, 3)
+        with BlockArchive(filename) as archive:
+            assert archive.samples() == [3]
+
+def _worker_pid(x):
+    return os.getpid()
+
+def test_smp_pool_persistent():
+    with process_pool.Pool(2) as pool:
+        # the same workers should be re-used across calls
+        pids1 = set(pool.map(_worker_pid, range(20), chunksize=1))
+        pids2 = set(pool.map(_worker_pid, range(20), chunksize=1))
+        workers = set(p.pid for p in pool.pool._pool)
+        assert os.getpid() not in pids1
+        assert (pids1 | pids2) <= workers
+        assert sorted(pool.imap_unordered(abs, range(-5, 0))) == [1, 2, 3, 4, 5]
+        assert pool.bcast(3) == 3
+        assert pool.gather(3) == [3]
+        pool.close()
+        # and re-forked after closing
+        pids3 = set(pool.map(_worker_pid, range(20), chunksize=1))
+        assert not (pids3 & workers)
+
+def _slow_square(x):
+    import time
+    time.sleep(0.2 if x == 0 else 0.01)
+    return x * x
+
+def test_smp_pool_submit():
+    with process_pool.Pool(2) as pool:
+        futures = [pool.submit(_slow_square, x) for x in range(10)]
+        done = [f.task for f in pool.as_completed(futures)]
+        assert sorted(done) == list(range(10))
+        assert [f.result() for f in futures] == [x * x for x in range(10)]
+
+
+class _DoneFuture(object):
+    def __init__(self, task, result):
+        self.task = task
+        self._result = result
+
+    def result(self):
+        return self._result
+
+
+class _HeadLastPool(object):
+    # A pool that runs tasks at once but reports task 0 as finished
+    # only when nothing else is left, like a very slow first task.
+    size = 1
+
+    def submit(self, function, task):
+        return _DoneFuture(task, function(task))
+
+    def as_completed(self, futures):
+        return iter(sorted(futures, key=lambda f: f.task == 0))
+
+
+def test_stream_tasks_bounded():
+    sampler = types.SimpleNamespace(pool=_HeadLastPool())
+    submitted = []
+    def tasks():
+        for i in range(100):
+            submitted.append(i)
+            yield i
+
+    results = []
+    most_pending = 0
+    for task, result in ParallelSampler.stream_tasks(sampler, lambda x: x * x, tasks(), max_pending=4):
+        results.append((task, result))
+        most_pending = max(most_pending, len(submitted) - len(results))
+    assert results == [(x, x * x) for x in range(100)]
+    # Results held back behind the slow task count towards the limit
+    assert most_pending <= 4
+
+def test_apriori_smp():
+    with process_pool.Pool(2) as pool:
+        output = run('apriori', True, pool=pool, nsample=50)
+    assert len(output['post']) == 50
+
+def test_grid_smp():
+    with process_pool.Pool(2) as pool:
+        output = run('grid', True, pool=pool, nsample_dimension=10)
+    # results should come out in the same order as in serial
+    serial_output = run('grid', True, nsample_dimension=10)
+    assert np.allclose(output['post'], serial_output['post'])
+    assert np.allclose(output['parameters--p1'], serial_output['parameters--p1'])
+
 def test_gridmax():
     run('gridmax', True, max_iterations=1000)
 
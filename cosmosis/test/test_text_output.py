@@ -1,7 +1,9 @@
 from cosmosis.output.text_output import TextColumnOutput
+from cosmosis.output.binary_output import BinaryOutput
 import string
 import numpy as np
 import os
+import tempfile
 try:
     import astropy.table
 except:
@@ -54,3 +56,141 @@ def test_text():
         assert final[0]['FINISH'] is True
     finally:
         os.remove(filename)
+
+
+def test_binary():
+    nparam = 8
+    ns = 20
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, 'chain.npy')
+        ini = {'filename':filename, 'format':'binary', 'buffer_rows':'7'}
+        out = BinaryOutput.from_options(ini)
+        out.comment("A comment")
+        populate_table(out, nparam, ns)
+
+        # The data part is just a numpy array
+        t = np.load(filename)
+        assert t.shape == (ns, nparam)
+        assert (t[:, 0] == np.arange(ns)).all()
+        assert (t[:, 1] == np.arange(ns)+1).all()
+
+        names, data, meta, comments, final = BinaryOutput.load_from_options({"filename":filename})
+        assert names == [string.ascii_uppercase[i] for i in range(nparam)]
+        assert isinstance(data[0], np.memmap)
+        assert np.array_equal(data[0], t)
+        assert meta[0]['NP']==nparam
+        assert meta[0]['TIME']=='1:30pm'
+        assert comments[0] == ["A comment"]
+        assert final[0]['FINISH'] is True
+
+        # Simulate a run killed part-way through writing some rows
+        # after the header was last updated
+        with open(filename, "ab") as f:
+            f.write(b"partial row")
+        assert np.load(filename, mmap_mode='r').shape == (ns, nparam)
+
+        # Resuming should discard the partial row and carry on
+        out = BinaryOutput.from_options(ini, resume=True)
+        assert out.resumed
+        for i in range(nparam):
+            out.add_column(string.ascii_uppercase[i], float)
+        out.parameters(np.repeat(-1.0, nparam))
+        out.flush()
+        out.parameters(np.repeat(-2.0, nparam))
+        out.close()
+        t = np.load(filename)
+        assert t.shape == (ns + 2, nparam)
+        assert (t[ns] == -1).all() and (t[ns+1] == -2).all()
+
+        # Resetting goes back to where this run started
+        out = BinaryOutput.from_options(ini, resume=True)
+        for i in range(nparam):
+            out.add_column(string.ascii_uppercase[i], float)
+        out.parameters(np.repeat(-3.0, nparam))
+        out.flush()
+        out.reset_to_chain_start()
+        out.parameters(np.repeat(-4.0, nparam))
+        out.close()
+        t = np.load(filename)
+        assert t.shape == (ns + 3, nparam)
+        assert (t[-1] == -4).all()
+
+
+def test_text_load_truncated_and_parallel():
+    nparam = 4
+    ns = 50
+    with tempfile.TemporaryDirectory() as dirname:
+        base = os.path.join(dirname, 'chain')
+        for rank in range(3):
+            ini = {'filename':base + '.txt', 'rank':rank, 'parallel':3}
+            out = TextColumnOutput.from_options(ini)
+            populate_table(out, nparam, ns + rank)
+
+        # Cut off the end of the last row in the first file,
+        # leaving the final metadata after it
+        filename = base + '_1.txt'
+        with open(filename) as f:
+            lines = f.read().split("\n")
+        last_row = max(i for i, line in enumerate(lines) if line and not line.startswith('#'))
+        lines[last_row] = lines[last_row][:3]
+        # Comments and metadata can also appear among the data
+        first_row = min(i for i, line in enumerate(lines) if line and not line.startswith('#'))
+        lines.insert(first_row + 5, "## halfway")
+        lines.insert(first_row + 10, "#CHECKPOINT=7")
+        with open(filename, 'w') as f:
+            f.write("\n".join(lines))
+
+        names, data, meta, comments, final = TextColumnOutput.load_from_options({"filename":base})
+        assert sorted(len(d) for d in data) == [ns - 1, ns + 1, ns + 2]
+        assert all(f['FINISH'] is True for f in final)
+        assert all(m['TIME'] == '1:30pm' for m in meta)
+        assert sum(f.get('CHECKPOINT') == 7 for f in final) == 1
+        assert sum(c.count(' halfway') for c in comments) == 1
+
+        # Load a subset of the columns, in a different order
+        names, data, _, _, _ = TextColumnOutput.load_from_options({"filename":base + '_2.txt', "usecols":"C A"})
+        assert names == ['C', 'A']
+        assert data[0].shape == (ns + 1, 2)
+        assert (data[0][:, 0] == np.arange(ns + 1) + 2).all()
+        assert (data[0][:, 1] == np.arange(ns + 1)).all()
+
+
+def test_parameters_many():
+    # Writing a block of rows in one call should give exactly
+    # the same files as writing them one at a time
+    nparam = 3
+    ns = 10
+    rng = np.random.default_rng(1)
+    x = rng.normal(size=(ns, nparam))
+    counts = np.arange(ns)
+    post = rng.normal(size=ns)
+    with tempfile.TemporaryDirectory() as dirname:
+        for cls, ext in [(TextColumnOutput, '.txt'), (BinaryOutput, '.npy')]:
+            outputs = []
+            for label in ["single", "many"]:
+                filename = os.path.join(dirname, label + ext)
+                out = cls.from_options({'filename': filename, 'buffer_rows': '4'})
+                for i in range(nparam):
+                    out.add_column(string.ascii_uppercase[i], float)
+                out.add_column("count", int)
+                out.add_column("post", float)
+                outputs.append(out)
+
+            single, many = outputs
+            for i in range(ns):
+                single.parameters(x[i], counts[i], post[i])
+            many.parameters_many(x[:6], counts[:6], post[:6])
+            many.parameters_many(x[6:], counts[6:], post[6:])
+
+            try:
+                many.parameters_many(x, post)
+            except ValueError:
+                pass
+            else:
+                assert False, "Wrong number of columns should be an error"
+
+            for out in outputs:
+                out.close()
+            with open(os.path.join(dirname, "single" + ext), 'rb') as f1, \
+                 open(os.path.join(dirname, "many" + ext), 'rb') as f2:
+                assert f1.read() == f2.read()